@@ -1,14 +1,15 @@
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from fastapi import HTTPException, Security, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from .database import supabase
+from .tokens import token_verifier, TokenRejected
+from .sessions import create_session_store, SESSION_TIMEOUT
 import logging
 from api.Weather.weather import get_current_weather
 
 
-# 📌 Active session storage
-active_sessions = {}
-SESSION_TIMEOUT = timedelta(minutes=20)
+# 📌 Active session storage (bounded, expiring; see SESSION_STORE for the backend)
+session_store = create_session_store()
 
 
 # 📌 Security (Token Authentication)
@@ -22,21 +23,15 @@ logger = logging.getLogger(__name__)
 def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
     token = credentials.credentials
     try:
-        user_response = supabase.auth.get_user(token)
+        # Verified locally against the JWT signature when possible; Supabase is only asked on a cache miss it can't decide
+        user_obj = token_verifier.verify(token)
 
-        if not hasattr(user_response, "user") or user_response.user is None:
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
-
-        user_obj = user_response.user
-
-        if user_obj.id not in active_sessions:
-            active_sessions[user_obj.id] = {
-                "access_token": token,
-                "last_active": datetime.now(timezone.utc)
-            }
+        session_store.add_if_absent(user_obj.id, token)
 
         return user_obj
 
+    except TokenRejected as e:
+        raise HTTPException(status_code=401, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve user: {str(e)}")
 
@@ -86,7 +81,7 @@ def sign_up_db(user):
 
 
 # 📌 Sign In Function
-async def sign_in_db(user):
+def sign_in_db(user):
     try:
         # Determine if the identifier is an email or a username
         email_to_use = user.identifier
@@ -123,10 +118,7 @@ async def sign_in_db(user):
         else:
             profile_data = {}
 
-        active_sessions[user_id] = {
-            "access_token": access_token,
-            "last_active": datetime.now(timezone.utc)
-        }
+        session_store.set(user_id, access_token)
 
         # Fetch weather data for New York (hardcoded)
         try:
@@ -165,16 +157,16 @@ async def sign_in_db(user):
 # 📌 Get Session Function
 def get_session_db(user):
     user_id = user.id
-    session = active_sessions.get(user_id)
+    session = session_store.get(user_id)
 
     if not session:
         raise HTTPException(status_code=401, detail="No active session found")
 
     if datetime.now(timezone.utc) - session["last_active"] > SESSION_TIMEOUT:
-        del active_sessions[user_id]
+        session_store.delete(user_id)
         raise HTTPException(status_code=401, detail="Session expired due to inactivity")
 
-    session["last_active"] = datetime.now(timezone.utc)
+    session_store.touch(user_id)
     return {"message": "Session active", "user_id": user_id, "access_token": session["access_token"]}
 
 
@@ -182,8 +174,8 @@ def get_session_db(user):
 # 📌 Sign Out Function
 def sign_out_db(user):
     user_id = user.id
-    if user_id in active_sessions:
-        del active_sessions[user_id]
+    session_store.delete(user_id)
+    token_verifier.revoke_user(user_id)
     try:
         supabase.auth.sign_out()
         return {"message": "User successfully signed out"}
@@ -1,12 +1,88 @@
 import logging
 import os
+import threading
 import uuid
 from pydantic import BaseModel
 import requests
 from fastapi import HTTPException
+from api.attributes import lookup_key
+from api.cache import SingleFlight
 from api.Database.database import supabase
 from api.llm.image import generateImage
 
+# Configuration
+IMAGE_FAILURE_TTL = float(os.getenv("IMAGE_FAILURE_TTL", "30"))  # seconds a failed generation is not retried
+
+# Concurrent requests for the same image wait on a single generation
+image_flights = SingleFlight(failure_ttl=IMAGE_FAILURE_TTL)
+
+
+class ImageIndex:
+    """
+    In-memory map of image lookup_key -> image_link for every known image_items row.
+    Loaded once at startup and updated on insert, so items whose image already exists skip the
+    database lookup entirely.
+    """
+
+    def __init__(self):
+        self._links = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, batch_size: int = 1000):
+        try:
+            links = {}
+            start = 0
+            while True:
+                response = supabase.table("image_items") \
+                    .select("id, lookup_key, material, color, pattern, sub_type, image_link") \
+                    .order("id") \
+                    .range(start, start + batch_size - 1) \
+                    .execute()
+                rows = response.data or []
+                for row in rows:
+                    links.setdefault(row.get("lookup_key") or lookup_key(row), row["image_link"])
+                if len(rows) < batch_size:
+                    break
+                start += batch_size
+            with self._lock:
+                links.update(self._links)
+                self._links = links
+                self.loaded = True
+            logging.info("Loaded %d image keys into the image index.", len(links))
+        except Exception as e:
+            logging.error("❌ Loading Image Index Error: %s", e)
+
+    def get(self, key: str):
+        link = self._links.get(key)
+        if link is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return link
+
+    def add(self, key: str, image_link: str):
+        with self._lock:
+            self._links.setdefault(key, image_link)
+
+    def __len__(self):
+        return len(self._links)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "keys": len(self._links),
+            "loaded": self.loaded,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+image_index = ImageIndex()
+
 class ClothingItem(BaseModel):
     user_id: str
     item_type: str
@@ -68,7 +144,7 @@ def add_new_item_image(file, item: ClothingItem):
     filename = upload_result.get("filename")
     if not filename:
         raise HTTPException(status_code=400, detail="Failed to obtain filename from upload result")
-    image_link = f"{os.environ.get("SUPABASE_URL")}/storage/v1/object/public/{bucket}/{filename}"
+    image_link = f"{os.environ.get('SUPABASE_URL')}/storage/v1/object/public/{bucket}/{filename}"
     
     # Prepare the record with the image attributes.
     record = {
@@ -76,6 +152,7 @@ def add_new_item_image(file, item: ClothingItem):
         "color": item.color,
         "pattern": item.pattern,
         "sub_type": item.sub_type,
+        "lookup_key": lookup_key(item),
         "image_link": image_link,
     }
     
@@ -83,35 +160,89 @@ def add_new_item_image(file, item: ClothingItem):
     db_response = supabase.table("image_items").insert(record).execute()
     return db_response
 
-def set_image(item: ClothingItem):
+def find_or_create_image(item: ClothingItem, key: str):
     """
-    Checks if an image for the clothing item (based on material, color, pattern, and sub_type)
-    already exists in the image_items table. 
-    - If an image is found, sets item.image_link from the existing record and returns the record.
-    - If not, generates an emoji-like image using generateImage, uploads it via add_new_item_image,
-      sets item.image_link using the newly created record, and returns that record.
+    Returns the image_items record with the item's lookup key, generating and uploading a new
+    image when there is none.
     """
-    # Query the image_items table for an existing image with matching attributes.
+    # Query the image_items table for an existing image with the same canonical attributes
+    # (another worker may have created it since the index was loaded).
     query_response = supabase.table("image_items").select("*") \
-        .eq("material", item.material) \
-        .eq("color", item.color) \
-        .eq("pattern", item.pattern) \
-        .eq("sub_type", item.sub_type) \
+        .eq("lookup_key", key) \
+        .limit(1) \
         .execute()
 
     if query_response.data and len(query_response.data) > 0:
         logging.info("Image already exists with the same attributes; using existing image.")
-        # Assume we use the first returned record.
-        item.image_link = query_response.data[0]["image_link"]
+        image_index.add(key, query_response.data[0]["image_link"])
         return {"message": "Image already exists", "data": query_response.data}
-    else:
-        # No matching image exists, so generate a new image.
-        image_bytes = generateImage(item)
-        # Upload image and insert a new record in the image_items table.
-        upload_result = add_new_item_image(image_bytes, item)
-        # Extract the newly created image link from the insert result.
-        if upload_result.data and len(upload_result.data) > 0:
-            item.image_link = upload_result.data[0]["image_link"]
-            return {"message": "New image created", "data": upload_result.data}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to create new image record")
+
+    # No matching image exists, so generate a new image.
+    image_bytes = generateImage(item)
+    # Upload image and insert a new record in the image_items table.
+    upload_result = add_new_item_image(image_bytes, item)
+    if upload_result.data and len(upload_result.data) > 0:
+        image_index.add(key, upload_result.data[0]["image_link"])
+        return {"message": "New image created", "data": upload_result.data}
+    raise HTTPException(status_code=500, detail="Failed to create new image record")
+
+def set_image(item: ClothingItem, retry: bool = False):
+    """
+    Checks if an image for the clothing item (based on the canonical material, color, pattern,
+    and sub_type, see api.attributes) already exists in the image index or image_items table. 
+    - If an image is found, sets item.image_link from the existing record and returns the record.
+    - If not, generates an emoji-like image using generateImage, uploads it via add_new_item_image,
+      sets item.image_link using the newly created record, and returns that record.
+
+    Concurrent calls for the same lookup key share one lookup/generation, and a failed
+    generation is not retried for IMAGE_FAILURE_TTL seconds unless `retry` is set (a caller
+    with its own backoff, such as a job's retry, generates again right away).
+    """
+    key = lookup_key(item)
+    if retry:
+        image_flights.forget_failure(key)
+    image_link = image_index.get(key)
+    if image_link:
+        item.image_link = image_link
+        return {"message": "Image already exists", "data": [{"lookup_key": key, "image_link": image_link}]}
+
+    result = image_flights.do(key, lambda: find_or_create_image(item, key))
+    # Assume we use the first returned record.
+    item.image_link = result["data"][0]["image_link"]
+    return result
+
+def image_generation_stats():
+    """Counters for generations run, coalesced onto an in-flight one, and failures."""
+    return image_flights.stats()
+
+def backfill_lookup_keys_db(batch_size: int = 500):
+    """
+    Sets lookup_key on existing image_items rows whose key is missing or was built with older
+    canonicalization rules. Safe to re-run.
+
+    Returns:
+        dict: Number of rows scanned and updated.
+    """
+    scanned = updated = 0
+    start = 0
+    while True:
+        response = supabase.table("image_items") \
+            .select("id, lookup_key, material, color, pattern, sub_type") \
+            .order("id") \
+            .range(start, start + batch_size - 1) \
+            .execute()
+        rows = response.data or []
+        for row in rows:
+            key = lookup_key(row)
+            if row.get("lookup_key") != key:
+                supabase.table("image_items").update({"lookup_key": key}).eq("id", row["id"]).execute()
+                updated += 1
+        scanned += len(rows)
+        if len(rows) < batch_size:
+            break
+        start += batch_size
+    return {"rows_scanned": scanned, "rows_updated": updated}
+
+
+if __name__ == "__main__":
+    print(backfill_lookup_keys_db())
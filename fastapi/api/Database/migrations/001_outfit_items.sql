@@ -0,0 +1,54 @@
+-- Item -> outfit index for saved_outfits.
+-- Lets check_item_in_outfits_db and the cascade in delete_clothing_item_db find
+-- the outfits that contain an item with one indexed lookup instead of scanning
+-- every outfit's items JSON. Rows are written by a trigger on saved_outfits, in
+-- the same statement as the outfit insert or items update, so the index can't
+-- diverge from the outfits; they are removed with their outfit by the ON DELETE
+-- CASCADE.
+-- Populate existing outfits afterwards with: python -m api.Database.outfits
+
+create table if not exists public.outfit_items (
+    outfit_id uuid not null references public.saved_outfits (id) on delete cascade,
+    clothing_item_id uuid not null,
+    user_id uuid not null,
+    primary key (outfit_id, clothing_item_id)
+);
+
+create index if not exists outfit_items_user_item_idx
+    on public.outfit_items (user_id, clothing_item_id);
+
+alter table public.outfit_items enable row level security;
+
+create policy "Users manage their own outfit items"
+    on public.outfit_items
+    for all
+    using (auth.uid() = user_id)
+    with check (auth.uid() = user_id);
+
+-- Rebuilds an outfit's index rows from its items JSON (objects with a uuid "id").
+-- security definer: the rows are derived from an outfit row that already passed
+-- its own RLS check.
+create or replace function public.sync_outfit_items()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op = 'UPDATE' then
+        delete from public.outfit_items where outfit_id = new.id;
+    end if;
+    insert into public.outfit_items (outfit_id, clothing_item_id, user_id)
+    select distinct new.id, (item ->> 'id')::uuid, new.user_id
+    from jsonb_array_elements(coalesce(to_jsonb(new.items), '[]'::jsonb)) as item
+    where jsonb_typeof(item) = 'object'
+      and item ->> 'id' ~* '^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$'
+    on conflict do nothing;
+    return new;
+end;
+$$;
+
+drop trigger if exists saved_outfits_sync_outfit_items on public.saved_outfits;
+create trigger saved_outfits_sync_outfit_items
+    after insert or update of items on public.saved_outfits
+    for each row execute function public.sync_outfit_items();
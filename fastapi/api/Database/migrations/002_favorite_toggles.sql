@@ -0,0 +1,35 @@
+-- Atomic favorite toggles for clothing items and saved outfits.
+-- One statement per call: flips favorite (or sets it to p_favorite when given)
+-- for every id in p_ids and returns the updated rows, so concurrent clicks can't
+-- lose updates and the API needs a single round trip. When p_user_id is given
+-- only that user's rows are touched.
+
+create or replace function public.toggle_clothing_item_favorites(
+    p_ids uuid[],
+    p_favorite boolean default null,
+    p_user_id uuid default null
+)
+returns setof public.clothing_items
+language sql
+as $$
+    update public.clothing_items
+    set favorite = coalesce(p_favorite, not coalesce(favorite, false))
+    where id = any (p_ids)
+      and (p_user_id is null or user_id = p_user_id)
+    returning *;
+$$;
+
+create or replace function public.toggle_saved_outfit_favorites(
+    p_ids uuid[],
+    p_favorite boolean default null,
+    p_user_id uuid default null
+)
+returns setof public.saved_outfits
+language sql
+as $$
+    update public.saved_outfits
+    set favorite = coalesce(p_favorite, not coalesce(favorite, false))
+    where id = any (p_ids)
+      and (p_user_id is null or user_id = p_user_id)
+    returning *;
+$$;
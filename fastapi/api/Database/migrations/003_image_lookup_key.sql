@@ -0,0 +1,10 @@
+-- Canonical lookup key for image reuse.
+-- set_image used to match images with exact equality on four free-text columns,
+-- so "Black" / "black " / "BLACK" each generated a new image. lookup_key holds
+-- the canonical material|color|pattern|sub_type built by api/attributes.py.
+-- Populate existing rows afterwards with: python -m api.Database.images
+
+alter table public.image_items add column if not exists lookup_key text;
+
+create index if not exists image_items_lookup_key_idx
+    on public.image_items (lookup_key);
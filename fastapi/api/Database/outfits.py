@@ -1,19 +1,42 @@
 from fastapi import HTTPException
 from .database import supabase
+from .wardrobe import favorite_rpc_params
+
+def outfit_record(outfit):
+    """Build the saved_outfits row for an OutfitData."""
+    return {
+        "user_id": outfit.user_id,
+        "items": outfit.items,
+        "occasion": outfit.occasion,
+        "favorite": outfit.favorite
+    }
+
+def outfit_item_rows(outfits):
+    """
+    Build outfit_items index rows (outfit_id, clothing_item_id, user_id) for saved_outfits rows.
+    The index lets item -> outfit lookups run as one indexed query instead of scanning every outfit's items JSON.
+    """
+    rows = {}
+    for outfit in outfits:
+        for item in outfit.get("items") or []:
+            if isinstance(item, dict) and item.get("id"):
+                rows[(outfit["id"], item["id"])] = {
+                    "outfit_id": outfit["id"],
+                    "clothing_item_id": item["id"],
+                    "user_id": outfit["user_id"]
+                }
+    return list(rows.values())
 
 def add_saved_outfit_db(outfit):
     try:
-        outfit_data = {
-            "user_id": outfit.user_id,
-            "items": outfit.items,
-            "occasion": outfit.occasion,
-            "favorite": outfit.favorite 
-        }
+        outfit_data = outfit_record(outfit)
 
         response = supabase.table("saved_outfits").insert(outfit_data).execute()
         item_error = getattr(response, "error", None)
         if item_error:
             raise HTTPException(status_code=400, detail=str(item_error))
+
+        # The item -> outfit index rows are written by the saved_outfits trigger in the same statement
         return {"message": "Outfit added successfully", "data": response.data}
     except Exception as e:
         print("❌ Adding Item Error:", str(e))
@@ -52,28 +75,56 @@ def delete_saved_outfit_db(outfit_id: str):
         print("❌ Deleting Outfit Error:", str(e))
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
-def edit_favorite_outfit_db(outfit_id: str):
+def edit_favorite_outfits_db(outfit_ids, favorite=None, user_id: str = None):
+    """
+    Flip (or set, when favorite is given) the favorite flag of several outfits in one atomic statement.
+    """
     try:
-        # First, get the current favorite value
-        get_response = supabase.table("saved_outfits").select("favorite").eq("id", outfit_id).execute()
-        item_error = getattr(get_response, "error", None)
-        if item_error:
-            raise HTTPException(status_code=400, detail=str(item_error))
-        
-        if not get_response.data or len(get_response.data) == 0:
-            raise HTTPException(status_code=404, detail="Outfit not found")
-        
-        # Get the current value and set the new value to the opposite
-        current_favorite = get_response.data[0]["favorite"]
-        new_favorite = not current_favorite
-        
-        # Update the favorite status to the opposite value
-        update_response = supabase.table("saved_outfits").update({"favorite": new_favorite}).eq("id", outfit_id).execute()
-        item_error = getattr(update_response, "error", None)
+        response = supabase.rpc("toggle_saved_outfit_favorites", favorite_rpc_params(outfit_ids, favorite, user_id)).execute()
+        item_error = getattr(response, "error", None)
         if item_error:
             raise HTTPException(status_code=400, detail=str(item_error))
         
-        return {"message": "Favorite status updated successfully", "data": update_response.data}
+        return {"message": "Favorite status updated successfully", "data": response.data or []}
     except Exception as e:
         print("❌ Editing Favorite Status Error:", str(e))
-        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+def edit_favorite_outfit_db(outfit_id: str, user_id: str = None):
+    result = edit_favorite_outfits_db([outfit_id], user_id=user_id)
+    if not result["data"]:
+        raise HTTPException(status_code=404, detail="Outfit not found")
+    return result
+
+def backfill_outfit_items_db(batch_size: int = 500):
+    """
+    Populates the outfit_items index from the items JSON of existing saved outfits.
+    Safe to re-run: rows that already exist are skipped.
+
+    Returns:
+        dict: Number of outfits scanned and index rows written.
+    """
+    scanned = written = 0
+    start = 0
+    while True:
+        response = supabase.table("saved_outfits") \
+            .select("id, user_id, items") \
+            .order("id") \
+            .range(start, start + batch_size - 1) \
+            .execute()
+        outfits = response.data or []
+        index_rows = outfit_item_rows(outfits)
+        if index_rows:
+            supabase.table("outfit_items") \
+                .upsert(index_rows, on_conflict="outfit_id,clothing_item_id", ignore_duplicates=True) \
+                .execute()
+        scanned += len(outfits)
+        written += len(index_rows)
+        if len(outfits) < batch_size:
+            break
+        start += batch_size
+    return {"outfits_scanned": scanned, "index_rows_written": written}
+
+
+if __name__ == "__main__":
+    print(backfill_outfit_items_db())
@@ -0,0 +1,56 @@
+"""
+Awaitable data-access layer used by the routers.
+
+Every function here has the same name and signature as its synchronous
+counterpart in the Database modules and runs it in the threadpool, so a slow
+PostgREST call never blocks the event loop. The synchronous functions are the
+only implementation; `python -m api.bench wardrobe-load` measures this against
+calling them directly on the event loop.
+"""
+import functools
+
+from fastapi.concurrency import run_in_threadpool
+
+from . import auth, outfits, user_details, wardrobe
+
+
+def _in_threadpool(sync_fn):
+    """Awaitable version of sync_fn that runs it in the threadpool."""
+    @functools.wraps(sync_fn)
+    async def wrapper(*args, **kwargs):
+        return await run_in_threadpool(sync_fn, *args, **kwargs)
+    return wrapper
+
+
+# ——— Wardrobe ———
+
+add_clothing_item_db = _in_threadpool(wardrobe.add_clothing_item_db)
+get_user_items_db = _in_threadpool(wardrobe.get_user_items_db)
+get_item_by_id_db = _in_threadpool(wardrobe.get_item_by_id_db)
+get_all_user_items_db = _in_threadpool(wardrobe.get_all_user_items_db)
+get_items_with_occasion_db = _in_threadpool(wardrobe.get_items_with_occasion_db)
+update_clothing_item_db = _in_threadpool(wardrobe.update_clothing_item_db)
+edit_favorite_items_db = _in_threadpool(wardrobe.edit_favorite_items_db)
+edit_favorite_item_db = _in_threadpool(wardrobe.edit_favorite_item_db)
+check_item_in_outfits_db = _in_threadpool(wardrobe.check_item_in_outfits_db)
+delete_clothing_item_db = _in_threadpool(wardrobe.delete_clothing_item_db)
+
+# ——— Saved outfits ———
+
+add_saved_outfit_db = _in_threadpool(outfits.add_saved_outfit_db)
+get_saved_outfits_db = _in_threadpool(outfits.get_saved_outfits_db)
+delete_saved_outfit_db = _in_threadpool(outfits.delete_saved_outfit_db)
+edit_favorite_outfits_db = _in_threadpool(outfits.edit_favorite_outfits_db)
+edit_favorite_outfit_db = _in_threadpool(outfits.edit_favorite_outfit_db)
+
+# ——— Profiles ———
+
+get_user_profile_db = _in_threadpool(user_details.get_user_profile_db)
+update_user_profile_db = _in_threadpool(user_details.update_user_profile_db)
+
+# ——— Auth ———
+
+sign_up_db = _in_threadpool(auth.sign_up_db)
+sign_in_db = _in_threadpool(auth.sign_in_db)
+get_session_db = _in_threadpool(auth.get_session_db)
+sign_out_db = _in_threadpool(auth.sign_out_db)
@@ -0,0 +1,264 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from api.cache import TTLCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SESSION_TIMEOUT = timedelta(minutes=20)
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE", "memory")  # "memory" or "sqlite"
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "100000"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))  # seconds
+
+
+class SessionStore(ABC):
+    """
+    Interface for active session storage.
+
+    Sessions are keyed by user id and hold the access token plus the time of
+    last activity. Implementations evict sessions idle for longer than
+    `timeout` from a background thread and keep at most `max_entries`
+    sessions, dropping the least recently active ones first (the SQLite
+    store trims to the cap on each sweep rather than on every write).
+    """
+
+    def __init__(self, timeout: timedelta = SESSION_TIMEOUT, max_entries: int = SESSION_MAX_ENTRIES,
+                 sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        self.timeout = timeout.total_seconds()
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    @abstractmethod
+    def get(self, user_id: str) -> Optional[Dict]:
+        """Return {"access_token", "last_active"} for the user, or None."""
+
+    @abstractmethod
+    def set(self, user_id: str, access_token: str) -> None:
+        """Create or replace the user's session and mark it active now."""
+
+    @abstractmethod
+    def add_if_absent(self, user_id: str, access_token: str) -> None:
+        """Create a session for the user unless one already exists."""
+
+    @abstractmethod
+    def touch(self, user_id: str) -> None:
+        """Mark the user's session active now."""
+
+    @abstractmethod
+    def delete(self, user_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def evict_expired(self) -> int:
+        """Remove all idle sessions and return how many were removed."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def start_sweeper(self) -> None:
+        """Start the background eviction thread (idempotent)."""
+        if self._sweeper and self._sweeper.is_alive():
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        self._stop.set()
+
+    def _sweep_loop(self) -> None:
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                evicted = self.evict_expired()
+                if evicted:
+                    logger.info(f"Evicted {evicted} expired sessions")
+            except Exception as e:
+                logger.error(f"Session sweep failed: {e}")
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process session store.
+
+    Since every session has the same idle timeout, keeping sessions in an
+    OrderedDict sorted by last activity means the oldest session is always at
+    the front: touching is a move-to-end, and both expiry and cap eviction pop
+    from the front, all O(1) amortized.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None:
+                return None
+            return {
+                "access_token": session["access_token"],
+                "last_active": datetime.fromtimestamp(session["last_active"], timezone.utc),
+            }
+
+    def set(self, user_id: str, access_token: str) -> None:
+        with self._lock:
+            self._set(user_id, access_token)
+
+    def add_if_absent(self, user_id: str, access_token: str) -> None:
+        with self._lock:
+            if user_id not in self._sessions:
+                self._set(user_id, access_token)
+
+    def _set(self, user_id: str, access_token: str) -> None:
+        # Callers hold self._lock
+        self._sessions[user_id] = {"access_token": access_token, "last_active": time.time()}
+        self._sessions.move_to_end(user_id)
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+
+    def touch(self, user_id: str) -> None:
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None:
+                session["last_active"] = time.time()
+                self._sessions.move_to_end(user_id)
+
+    def delete(self, user_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+    def evict_expired(self) -> int:
+        cutoff = time.time() - self.timeout
+        evicted = 0
+        with self._lock:
+            while self._sessions:
+                user_id, session = next(iter(self._sessions.items()))
+                if session["last_active"] > cutoff:
+                    break
+                del self._sessions[user_id]
+                evicted += 1
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store backed by a shared SQLite file so that all uvicorn workers
+    on the same host see the same sessions. The last_active column is indexed
+    so expiry and cap eviction are range deletes.
+
+    Writes take the database-wide lock, so the per-request path avoids them:
+    add_if_absent remembers which users it has seen to have a session (for one
+    sweep interval) and only inserts for new ones, and the cap is enforced by
+    the sweeper instead of on every insert.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        self._known = TTLCache(max_size=self.max_entries, ttl=self.sweep_interval)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "user_id TEXT PRIMARY KEY, access_token TEXT NOT NULL, last_active REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_active ON sessions (last_active)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        row = self._connection().execute(
+            "SELECT access_token, last_active FROM sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"access_token": row[0], "last_active": datetime.fromtimestamp(row[1], timezone.utc)}
+
+    def set(self, user_id: str, access_token: str) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO sessions (user_id, access_token, last_active) VALUES (?, ?, ?)",
+            (user_id, access_token, time.time()),
+        )
+        self._known.set(user_id, True)
+
+    def add_if_absent(self, user_id: str, access_token: str) -> None:
+        if self._known.get(user_id):
+            return
+        conn = self._connection()
+        # A read doesn't block other workers; only a user without a session is written
+        exists = conn.execute("SELECT 1 FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+        if exists is None:
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (user_id, access_token, last_active) VALUES (?, ?, ?)",
+                (user_id, access_token, time.time()),
+            )
+        self._known.set(user_id, True)
+
+    def touch(self, user_id: str) -> None:
+        self._connection().execute(
+            "UPDATE sessions SET last_active = ? WHERE user_id = ?", (time.time(), user_id)
+        )
+
+    def delete(self, user_id: str) -> None:
+        self._connection().execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        self._known.pop(user_id)
+
+    def evict_expired(self) -> int:
+        """Remove idle sessions, then the least recently active ones above the cap."""
+        conn = self._connection()
+        evicted = conn.execute(
+            "DELETE FROM sessions WHERE last_active <= ?", (time.time() - self.timeout,)
+        ).rowcount
+        evicted += self._enforce_cap(conn)
+        if evicted:
+            self._known.clear()
+        return evicted
+
+    def _enforce_cap(self, conn: sqlite3.Connection) -> int:
+        return conn.execute(
+            "DELETE FROM sessions WHERE user_id IN ("
+            "SELECT user_id FROM sessions ORDER BY last_active DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_session_store(backend: str = SESSION_STORE_BACKEND) -> SessionStore:
+    """Build the configured session store and start its background sweeper."""
+    if backend == "sqlite":
+        store = SQLiteSessionStore()
+    elif backend == "memory":
+        store = MemorySessionStore()
+    else:
+        raise ValueError(f"Unknown session store backend: {backend}")
+    store.start_sweeper()
+    return store
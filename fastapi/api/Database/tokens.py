@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import requests
+from dotenv import load_dotenv
+from jose import jwt, JWTError, ExpiredSignatureError
+
+from api.cache import TTLCache
+from .database import supabase
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_URL = f"{os.getenv('SUPABASE_URL', '').rstrip('/')}/auth/v1/.well-known/jwks.json"
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))  # seconds
+TOKEN_LIFETIME = float(os.getenv("SUPABASE_JWT_EXPIRY", "3600"))  # seconds, the project's access token lifetime
+JWKS_REFRESH_INTERVAL = 300  # seconds, minimum time between JWKS refetches
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
+
+
+class TokenRejected(Exception):
+    """Raised when a token is definitively invalid (bad signature, expired, ...)."""
+
+
+@dataclass
+class VerifiedUser:
+    """Minimal user object built from verified JWT claims (mirrors the fields we use from Supabase's User)."""
+    id: str
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    role: Optional[str] = None
+    session_id: Optional[str] = None
+    app_metadata: Dict[str, Any] = field(default_factory=dict)
+    user_metadata: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_claims(cls, claims: Dict[str, Any]) -> 'VerifiedUser':
+        return cls(
+            id=claims["sub"],
+            email=claims.get("email"),
+            phone=claims.get("phone"),
+            role=claims.get("role"),
+            session_id=claims.get("session_id"),
+            app_metadata=claims.get("app_metadata") or {},
+            user_metadata=claims.get("user_metadata") or {},
+        )
+
+
+class TokenVerifier:
+    """
+    Verifies Supabase access tokens locally and caches the decoded user.
+
+    Tokens signed with the project's JWT secret (HS256) or a key from the
+    project's JWKS (RS256/ES256) are checked locally for signature, audience
+    and expiry. Supabase is only asked when the token can't be decided
+    locally: no secret configured, an unknown signing key, or a token issued
+    before its user signed out in this process.
+
+    Revocations are kept for one token lifetime, after which every token issued
+    before the sign-out has expired anyway. They are per process: a sign-out
+    handled by one worker doesn't stop another worker from trusting the user's
+    older tokens locally until they expire or leave its cache.
+    """
+
+    def __init__(self, secret: Optional[str] = JWT_SECRET, audience: str = JWT_AUDIENCE,
+                 max_size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL,
+                 token_lifetime: float = TOKEN_LIFETIME):
+        self.secret = secret
+        self.audience = audience
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+        self._revoked_at = TTLCache(max_size=max_size, ttl=token_lifetime)  # user id -> sign-out time
+        self._jwks: Dict[str, Dict[str, Any]] = {}
+        self._jwks_fetched_at = 0.0
+        self._jwks_lock = threading.Lock()
+        self.local_verifications = 0
+        self.remote_verifications = 0
+        self.rejections = 0
+
+    @staticmethod
+    def _hash(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def verify(self, token: str):
+        """Return the user for a token, from cache, local verification or Supabase."""
+        key = self._hash(token)
+        user = self._cache.get(key)
+        if user is not None:
+            return user
+
+        claims = self._decode_locally(token)
+        if claims is not None and not self._is_revoked(claims):
+            user = VerifiedUser.from_claims(claims)
+            self.local_verifications += 1
+        else:
+            user = self._verify_remotely(token)
+            self.remote_verifications += 1
+
+        self._cache.set(key, user, ttl=self._cache_ttl(claims or self._unverified_claims(token)))
+        return user
+
+    def revoke_user(self, user_id: str) -> None:
+        """Stop trusting locally verified tokens issued to this user until now."""
+        self._revoked_at.set(user_id, time.time())
+        for key, user in self._cache.items():
+            if getattr(user, "id", None) == user_id:
+                self._cache.pop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache hit/miss counters plus how cache misses were resolved."""
+        stats = self._cache.stats()
+        stats.update({
+            "local_verifications": self.local_verifications,
+            "remote_verifications": self.remote_verifications,
+            "rejections": self.rejections,
+            "revoked_users": len(self._revoked_at),
+        })
+        return stats
+
+    def _decode_locally(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns verified claims, or None if the token must be checked by Supabase.
+        Raises TokenRejected when the token is definitively invalid.
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError as e:
+            self.rejections += 1
+            raise TokenRejected(f"Malformed token: {e}")
+
+        alg = header.get("alg")
+        if alg == "HS256":
+            key = self.secret
+        elif alg in ASYMMETRIC_ALGORITHMS:
+            key = self._signing_key(header.get("kid"))
+        else:
+            key = None
+        if not key:
+            return None
+
+        try:
+            return jwt.decode(token, key, algorithms=[alg], audience=self.audience)
+        except ExpiredSignatureError:
+            self.rejections += 1
+            raise TokenRejected("Token has expired")
+        except JWTError as e:
+            self.rejections += 1
+            raise TokenRejected(f"Invalid token: {e}")
+
+    def _signing_key(self, kid: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Look up a JWKS key by id, refetching the key set at most once per refresh interval."""
+        if not kid:
+            return None
+        if kid in self._jwks:
+            return self._jwks[kid]
+        with self._jwks_lock:
+            if kid not in self._jwks and time.monotonic() - self._jwks_fetched_at > JWKS_REFRESH_INTERVAL:
+                self._jwks_fetched_at = time.monotonic()
+                try:
+                    response = requests.get(JWKS_URL, timeout=5)
+                    response.raise_for_status()
+                    self._jwks = {k["kid"]: k for k in response.json().get("keys", []) if "kid" in k}
+                except Exception as e:
+                    logger.warning(f"Failed to fetch JWKS from {JWKS_URL}: {e}")
+        return self._jwks.get(kid)
+
+    def _is_revoked(self, claims: Dict[str, Any]) -> bool:
+        revoked_at = self._revoked_at.get(claims.get("sub"))
+        return revoked_at is not None and claims.get("iat", 0) <= revoked_at
+
+    def _verify_remotely(self, token: str):
+        user_response = supabase.auth.get_user(token)
+        if not hasattr(user_response, "user") or user_response.user is None:
+            self.rejections += 1
+            raise TokenRejected("Invalid or expired token")
+        return user_response.user
+
+    @staticmethod
+    def _unverified_claims(token: str) -> Dict[str, Any]:
+        try:
+            return jwt.get_unverified_claims(token)
+        except JWTError:
+            return {}
+
+    def _cache_ttl(self, claims: Dict[str, Any]) -> float:
+        """Never cache a user past the token's own expiry."""
+        exp = claims.get("exp")
+        if exp is None:
+            return self._cache.ttl
+        return min(self._cache.ttl, exp - time.time())
+
+
+# Create a singleton token verifier
+token_verifier = TokenVerifier()
@@ -3,27 +3,59 @@ import uuid
 from fastapi import HTTPException
 from .database import supabase
 
-def update_user_profile_db(data, user):
+PROFILE_COLUMNS = "id, first_name, last_name, username, member_since, gender, profile_image_url, email"
+
+def get_user_profile_db(user):
     """
-    Updates the user profile in the 'profiles' table using the provided update data.
+    Retrieves the user's profile from the 'profiles' table.
 
     Parameters:
-        data (UpdateProfile): An instance of UpdateProfile with updated first_name, last_name, and username.
         user (object): The current user object containing the user's id.
 
     Returns:
-        dict: The updated user profile data.
+        dict: The user profile data, including the user_id.
 
     Raises:
-        HTTPException: If there is an error updating the profile.
+        HTTPException: If no profile exists for the user.
     """
-    update_data = {
+    profile_response = supabase.table("profiles") \
+        .select(PROFILE_COLUMNS) \
+        .eq("id", user.id) \
+        .execute()
+
+    if not profile_response.data or len(profile_response.data) == 0:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    profile_data = profile_response.data[0]
+    # Add the user_id to the response
+    profile_data["user_id"] = user.id
+    return profile_data
+
+def profile_update(data):
+    """Build the profiles update payload from an UpdateProfile."""
+    return {
         "first_name": data.first_name,
         "last_name": data.last_name,
         "username": data.username,
         "gender": data.gender
     }
 
+def update_user_profile_db(data, user):
+    """
+    Updates the user profile in the 'profiles' table using the provided update data.
+
+    Parameters:
+        data (UpdateProfile): An instance of UpdateProfile with updated first_name, last_name, and username.
+        user (object): The current user object containing the user's id.
+
+    Returns:
+        dict: The updated user profile data.
+
+    Raises:
+        HTTPException: If there is an error updating the profile.
+    """
+    update_data = profile_update(data)
+
     response = supabase.table("profiles").update(update_data).eq("id", user.id).execute()
 
     # Convert response to dict if necessary (if response is a pydantic model)
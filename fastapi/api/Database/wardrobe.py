@@ -1,25 +1,31 @@
 from fastapi import HTTPException
 from .database import supabase
+from .wardrobe_cache import wardrobe_cache
+
+def item_record(item):
+    """Build the clothing_items row for a ClothingItem."""
+    return {
+        "user_id": item.user_id,
+        "item_type": item.item_type,
+        "material": item.material,
+        "color": item.color,
+        "formality": item.formality,
+        "pattern": item.pattern,
+        "fit": item.fit,
+        "suitable_for_weather": item.suitable_for_weather,
+        "suitable_for_occasion": item.suitable_for_occasion,
+        "sub_type": item.sub_type,
+        "image_link": item.image_link
+    }
 
 def add_clothing_item_db(item):
     try:
-        item_data = {
-            "user_id": item.user_id,
-            "item_type": item.item_type,
-            "material": item.material,
-            "color": item.color,
-            "formality": item.formality,
-            "pattern": item.pattern,
-            "fit": item.fit,
-            "suitable_for_weather": item.suitable_for_weather,
-            "suitable_for_occasion": item.suitable_for_occasion,
-            "sub_type": item.sub_type,
-            "image_link": item.image_link
-        }
+        item_data = item_record(item)
         item_response = supabase.table("clothing_items").insert(item_data).execute()
         item_error = getattr(item_response, "error", None)
         if item_error:
             raise HTTPException(status_code=400, detail=str(item_error))
+        wardrobe_cache.add_items(item_response.data or [])
         return {"message": "Item added successfully", "data": item_response.data}
     except Exception as e:
         print("❌ Adding Item Error:", str(e))
@@ -27,6 +33,9 @@ def add_clothing_item_db(item):
 
 def get_user_items_db(item_type, user):
     try:
+        cached = wardrobe_cache.get(user.id)
+        if cached is not None:
+            return {"data": [i for i in cached.items if i.get("item_type") == item_type]}
         response = supabase.table("clothing_items").select("*").eq("user_id", user.id).eq("item_type", item_type).execute()
         item_error = getattr(response, "error", None)
         if item_error:
@@ -38,6 +47,9 @@ def get_user_items_db(item_type, user):
 
 def get_item_by_id_db(item_id: str, user):
     try:
+        cached = wardrobe_cache.get(user.id)
+        if cached is not None:
+            return {"data": [i for i in cached.items if i.get("id") == item_id]}
         response = supabase.table("clothing_items").select("*").eq("id", item_id).eq("user_id", user.id).execute()
         item_error = getattr(response, "error", None)
         if item_error:
@@ -49,6 +61,10 @@ def get_item_by_id_db(item_id: str, user):
 
 def get_all_user_items_db(user):
     try:
+        cached = wardrobe_cache.get(user.id)
+        if cached is not None:
+            return {"data": list(cached.items)}
+        token = wardrobe_cache.fetch_token()
         response = supabase.table("clothing_items")\
             .select("*")\
             .eq("user_id", user.id)\
@@ -57,45 +73,80 @@ def get_all_user_items_db(user):
         item_error = getattr(response, "error", None)
         if item_error:
             raise HTTPException(status_code=400, detail=str(item_error))
-        return {"data": response.data if response.data else []}
+        items = response.data if response.data else []
+        entry = wardrobe_cache.put(user.id, items, token)
+        return {"data": list(entry.items) if entry is not None else items}
     except Exception as e:
         print("❌ Retrieving All Items Error:", str(e))
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
     
-def edit_favorite_item_db(item_id: str):
+def get_items_with_occasion_db(occasion: str, added_before: str = None, limit: int = 1000):
+    """
+    Items of any user whose suitable_for_occasion is exactly `occasion`, e.g. a placeholder,
+    optionally only those added before the `added_before` timestamp (ISO 8601).
+    """
     try:
-        # First, get the current favorite value
-        get_response = supabase.table("clothing_items").select("favorite").eq("id", item_id).execute()
-        item_error = getattr(get_response, "error", None)
+        query = supabase.table("clothing_items").select("*").eq("suitable_for_occasion", occasion)
+        if added_before:
+            query = query.lt("added_date", added_before)
+        response = query.limit(limit).execute()
+        item_error = getattr(response, "error", None)
+        if item_error:
+            raise HTTPException(status_code=400, detail=str(item_error))
+        return {"data": response.data or []}
+    except Exception as e:
+        print("❌ Retrieving Items By Occasion Error:", str(e))
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+def update_clothing_item_db(item_id: str, fields):
+    """Update columns of one clothing item and patch the cached wardrobe."""
+    try:
+        response = supabase.table("clothing_items").update(fields).eq("id", item_id).execute()
+        item_error = getattr(response, "error", None)
         if item_error:
             raise HTTPException(status_code=400, detail=str(item_error))
         
-        if not get_response.data or len(get_response.data) == 0:
-            raise HTTPException(status_code=404, detail="Item not found")
-        
-        # Get the current value and set the new value to the opposite
-        current_favorite = get_response.data[0]["favorite"]
-        new_favorite = not current_favorite
-        
-        # Update the favorite status to the opposite value
-        update_response = supabase.table("clothing_items").update({"favorite": new_favorite}).eq("id", item_id).execute()
-        item_error = getattr(update_response, "error", None)
+        wardrobe_cache.update_items(response.data or [])
+        return {"message": "Item updated successfully", "data": response.data or []}
+    except Exception as e:
+        print("❌ Updating Item Error:", str(e))
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+def favorite_rpc_params(ids, favorite=None, user_id=None):
+    """Arguments for the toggle_*_favorites RPCs (favorite=None flips each row)."""
+    return {"p_ids": list(ids), "p_favorite": favorite, "p_user_id": user_id}
+
+def edit_favorite_items_db(item_ids, favorite=None, user_id: str = None):
+    """
+    Flip (or set, when favorite is given) the favorite flag of several items in one atomic statement.
+    """
+    try:
+        response = supabase.rpc("toggle_clothing_item_favorites", favorite_rpc_params(item_ids, favorite, user_id)).execute()
+        item_error = getattr(response, "error", None)
         if item_error:
             raise HTTPException(status_code=400, detail=str(item_error))
         
-        return {"message": "Favorite status updated successfully", "data": update_response.data}
+        wardrobe_cache.update_items(response.data or [])
+        return {"message": "Favorite status updated successfully", "data": response.data or []}
     except Exception as e:
         print("❌ Editing Favorite Status Error:", str(e))
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+def edit_favorite_item_db(item_id: str, user_id: str = None):
+    result = edit_favorite_items_db([item_id], user_id=user_id)
+    if not result["data"]:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return result
     
 def check_item_in_outfits_db(item_id: str, user_id: str):
     try:
-        # Query saved_outfits for the specific user
+        # Join saved_outfits to the outfit_items index so only matching outfits are returned
         resp = (
             supabase
             .table("saved_outfits")
-            .select("id, items")
+            .select("id, items, outfit_items!inner(clothing_item_id)")
             .eq("user_id", user_id)
+            .eq("outfit_items.clothing_item_id", item_id)
             .execute()
         )
         
@@ -103,11 +154,7 @@ def check_item_in_outfits_db(item_id: str, user_id: str):
         if err:
             raise HTTPException(status_code=400, detail=f"Failed to load saved outfits: {err}")
         
-        outfits = resp.data or []
-        matches = [
-            o for o in outfits
-            if any(isinstance(i, dict) and i.get("id") == item_id for i in o.get("items", []))
-        ]
+        matches = [{"id": o["id"], "items": o["items"]} for o in resp.data or []]
         
         return {"data": matches}
     except HTTPException:
@@ -120,12 +167,13 @@ def delete_clothing_item_db(item_id: str, delete_outfits: bool = False, user_id:
     try:
         # If cascade delete is enabled, delete associated outfits first
         if delete_outfits and user_id:
-            # Get outfits containing this item
+            # Get outfits containing this item from the outfit_items index
             outfit_resp = (
                 supabase
-                .table("saved_outfits")
-                .select("id, items")
+                .table("outfit_items")
+                .select("outfit_id")
                 .eq("user_id", user_id)
+                .eq("clothing_item_id", item_id)
                 .execute()
             )
             
@@ -133,12 +181,7 @@ def delete_clothing_item_db(item_id: str, delete_outfits: bool = False, user_id:
             if err:
                 raise HTTPException(status_code=400, detail=f"Failed to load saved outfits: {err}")
             
-            outfits = outfit_resp.data or []
-            to_delete_ids = [
-                outfit["id"]
-                for outfit in outfits
-                if any(isinstance(i, dict) and i.get("id") == item_id for i in outfit.get("items", []))
-            ]
+            to_delete_ids = [row["outfit_id"] for row in outfit_resp.data or []]
             
             # Delete associated outfits if any found
             if to_delete_ids:
@@ -161,7 +204,9 @@ def delete_clothing_item_db(item_id: str, delete_outfits: bool = False, user_id:
         except AttributeError:
             pass
         
-        return {"data": response.data if hasattr(response, "data") and response.data else []}
+        deleted = response.data if hasattr(response, "data") and response.data else []
+        wardrobe_cache.remove_items(deleted)
+        return {"data": deleted}
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,199 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+WARDROBE_CACHE_MAX_BYTES = int(os.getenv("WARDROBE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Each worker has its own cache, so entries also expire to bound staleness from writes made by other workers
+WARDROBE_CACHE_TTL = float(os.getenv("WARDROBE_CACHE_TTL", "600"))  # seconds
+WRITE_STAMP_TTL = 120.0  # seconds a user's last write is remembered; longer than any fetch can take
+
+_versions = itertools.count(1)
+
+
+class ReadOnlyRow(dict):
+    """
+    A cached clothing_items row. Rows are shared by every caller (and identify
+    the wardrobe version for parse_wardrobe's snapshots), so they can't be
+    modified in place; copy with dict(row) or {**row, ...} to change one.
+    """
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Cached wardrobe rows are read-only; copy the row with dict(row) to modify it")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # Copies (copy.copy, deepcopy, pickle) are plain, writable dicts
+        return dict, (dict(self),)
+
+
+@dataclass
+class WardrobeEntry:
+    """A user's clothing_items rows, newest first, with a version stamp that changes on every write."""
+    items: List[Dict]
+    version: int
+    size: int
+    expires_at: float
+
+
+class WardrobeCache:
+    """
+    Per-user cache of clothing_items rows with write-through patching.
+
+    Writes made through the wardrobe DB functions patch the cached list in
+    place (and bump its version) instead of forcing a refetch. Total size is
+    bounded by `max_bytes`, evicting the least recently used wardrobes first.
+
+    Cached rows are ReadOnlyRow dicts, so a caller can't corrupt the cache by
+    modifying one. A fetch takes a fetch_token() before querying and passes it
+    to put(); if a write for that user happened in between, the fetched rows
+    may predate it and aren't cached.
+    """
+
+    def __init__(self, max_bytes: int = WARDROBE_CACHE_MAX_BYTES, ttl: float = WARDROBE_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, WardrobeEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_seq = 0
+        self._last_writes: "OrderedDict[str, tuple]" = OrderedDict()  # user id -> (write seq, time)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_fetches = 0
+
+    def get(self, user_id: str) -> Optional[WardrobeEntry]:
+        """Return the cached wardrobe for the user, or None."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry.expires_at <= time.monotonic():
+                if entry is not None:
+                    self._remove(user_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry
+
+    def fetch_token(self) -> int:
+        """Taken before fetching a wardrobe from the database and passed to put()."""
+        with self._lock:
+            return self._write_seq
+
+    def put(self, user_id: str, items: List[Dict], token: Optional[int] = None) -> Optional[WardrobeEntry]:
+        """
+        Cache a freshly fetched wardrobe (rows ordered newest first). Returns the entry,
+        or None when a write for the user since `token` means the rows may be stale.
+        """
+        with self._lock:
+            if token is not None and self._written_since(user_id, token):
+                self.stale_fetches += 1
+                return None
+            return self._store(user_id, [ReadOnlyRow(i) for i in items])
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._mark_written(user_id)
+            self._remove(user_id)
+
+    def add_items(self, rows: List[Dict]) -> None:
+        """Patch newly inserted rows into their owners' cached wardrobes."""
+        with self._lock:
+            for row in rows:
+                self._mark_written(row.get("user_id"))
+                entry = self._entries.get(row.get("user_id"))
+                if entry is not None:
+                    self._store(row["user_id"], [ReadOnlyRow(row)] + [
+                        i for i in entry.items if i.get("id") != row.get("id")
+                    ], entry.expires_at)
+
+    def update_items(self, rows: List[Dict]) -> None:
+        """Patch updated rows into their owners' cached wardrobes."""
+        with self._lock:
+            for row in rows:
+                self._mark_written(row.get("user_id"))
+                entry = self._entries.get(row.get("user_id"))
+                if entry is not None:
+                    self._store(row["user_id"], [
+                        ReadOnlyRow({**i, **row}) if i.get("id") == row.get("id") else i for i in entry.items
+                    ], entry.expires_at)
+
+    def remove_items(self, rows: List[Dict]) -> None:
+        """Drop deleted rows from their owners' cached wardrobes."""
+        with self._lock:
+            for row in rows:
+                self._mark_written(row.get("user_id"))
+                entry = self._entries.get(row.get("user_id"))
+                if entry is not None:
+                    self._store(row["user_id"], [i for i in entry.items if i.get("id") != row.get("id")],
+                                entry.expires_at)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "wardrobes": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale_fetches": self.stale_fetches,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _store(self, user_id: str, items: List[Dict], expires_at: Optional[float] = None) -> WardrobeEntry:
+        """Patches keep the original expiry so other workers' writes are still picked up within the TTL."""
+        self._remove(user_id)
+        size = len(json.dumps(items, default=str))
+        entry = WardrobeEntry(items=items, version=next(_versions), size=size,
+                              expires_at=expires_at or time.monotonic() + self.ttl)
+        if size > self.max_bytes:
+            return entry
+        self._entries[user_id] = entry
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= evicted.size
+            self.evictions += 1
+        return entry
+
+    def _mark_written(self, user_id: Optional[str]) -> None:
+        """Callers hold self._lock. Records a write so fetches started before it aren't cached."""
+        self._write_seq += 1
+        if user_id is None:
+            return
+        now = time.monotonic()
+        self._last_writes[user_id] = (self._write_seq, now)
+        self._last_writes.move_to_end(user_id)
+        # Oldest first; a fetch can't have started before a write this old and still be running
+        while self._last_writes:
+            _, (_, written_at) = next(iter(self._last_writes.items()))
+            if written_at > now - WRITE_STAMP_TTL:
+                break
+            self._last_writes.popitem(last=False)
+
+    def _written_since(self, user_id: str, token: int) -> bool:
+        stamp = self._last_writes.get(user_id)
+        return stamp is not None and stamp[0] > token
+
+    def _remove(self, user_id: str) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+
+# Create a singleton wardrobe cache
+wardrobe_cache = WardrobeCache()
@@ -0,0 +1,152 @@
+"""
+Canonical forms for free-text clothing attributes.
+
+Users type the same attribute many ways ("Black ", "BLACK", "t-shirts",
+"Tee"), so exact matching on the raw columns misses. `canonical()` reduces a
+value to one spelling: lowercase, punctuation and extra whitespace removed,
+plural words singularized, then words and phrases mapped through a
+per-attribute synonym table.
+`lookup_key()` joins the canonical material, color, pattern and sub_type into
+the key stored in image_items.lookup_key; `attribute_key()` does the same for
+any set of attributes.
+"""
+import re
+from functools import lru_cache
+from typing import Dict
+
+KEY_ATTRIBUTES = ("material", "color", "pattern", "sub_type")
+KEY_SEPARATOR = "|"
+
+# Words that are already singular or only exist in plural form
+_INVARIANT_WORDS = {
+    "jeans", "pants", "shorts", "trousers", "leggings", "tights", "overalls", "joggers", "sweatpants",
+    "chinos", "boxers", "briefs", "glasses", "sunglasses", "pajamas", "suspenders",
+    "dress", "bus", "lens", "canvas", "chiffon", "cashmere", "mesh", "plus", "gas",
+}
+
+# Plurals the suffix rules get wrong (ties -> ty, scarves -> scarve)
+_IRREGULAR_PLURALS = {
+    "ties": "tie", "bowties": "bowtie", "neckties": "necktie", "hoodies": "hoodie", "beanies": "beanie",
+    "onesies": "onesie", "booties": "bootie", "scrunchies": "scrunchie", "scarves": "scarf",
+}
+
+# Garments that only exist in plural form, restored when the singular is typed as the head noun
+# ("cargo short" -> "cargo shorts", while "short sleeve shirt" is left alone)
+_PLURAL_ONLY = {
+    "jean": "jeans", "pant": "pants", "trouser": "trousers", "short": "shorts", "legging": "leggings",
+    "chino": "chinos", "jogger": "joggers", "sweatpant": "sweatpants",
+}
+
+# Synonyms are matched on whole words of the (normalized, singularized) value, longest phrase
+# first; a phrase mapped to itself keeps its words from matching on their own ("polka dot")
+SYNONYMS: Dict[str, Dict[str, str]] = {
+    "color": {
+        "gray": "grey",
+        "navy blue": "navy",
+        "dark blue": "navy",
+        "off white": "cream",
+        "ivory": "cream",
+        "tan": "beige",
+        "khaki": "beige",
+        "burgundy": "maroon",
+        "wine": "maroon",
+        "multicolor": "multi",
+        "multicolored": "multi",
+        "multi color": "multi",
+    },
+    "material": {
+        "jean": "denim",
+        "jeans": "denim",
+        "poly": "polyester",
+        "cotton blend": "cotton",
+        "100 cotton": "cotton",
+        "pu leather": "faux leather",
+        "vegan leather": "faux leather",
+        "synthetic leather": "faux leather",
+        "woolen": "wool",
+        "merino": "merino wool",
+        "merino wool": "merino wool",
+    },
+    "pattern": {
+        "plain": "solid",
+        "none": "solid",
+        "solid color": "solid",
+        "stripe": "striped",
+        "pinstripe": "striped",
+        "check": "plaid",
+        "checked": "plaid",
+        "checkered": "plaid",
+        "tartan": "plaid",
+        "dot": "polka dot",
+        "dotted": "polka dot",
+        "polka dot": "polka dot",
+        "floral print": "floral",
+        "flower": "floral",
+        "camouflage": "camo",
+    },
+    "sub_type": {
+        "tee": "t shirt",
+        "tshirt": "t shirt",
+        "tee shirt": "t shirt",
+        "trainer": "sneaker",
+        "running shoe": "sneaker",
+        "hoody": "hoodie",
+        "hooded sweatshirt": "hoodie",
+        "jumper": "sweater",
+        "pullover": "sweater",
+    },
+}
+
+_PHRASE_WORDS = {attribute: max(len(phrase.split()) for phrase in table) for attribute, table in SYNONYMS.items()}
+
+_PUNCTUATION = re.compile(r"[^\w\s]|_")
+
+
+def singularize(word: str) -> str:
+    """Naive English singular for clothing vocabulary (shoes -> shoe, dresses -> dress)."""
+    if word in _INVARIANT_WORDS or len(word) <= 3:
+        return word
+    if word in _IRREGULAR_PLURALS:
+        return _IRREGULAR_PLURALS[word]
+    if word.endswith(("sses", "xes", "ches", "shes", "zzes")):
+        return word[:-2]
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=8192)
+def canonical(attribute: str, value) -> str:
+    """Canonical spelling of one attribute value."""
+    text = _PUNCTUATION.sub(" ", str(value or "").lower())
+    words = [singularize(word) for word in text.split()]
+    if attribute == "sub_type" and words:
+        words[-1] = _PLURAL_ONLY.get(words[-1], words[-1])
+    synonyms = SYNONYMS.get(attribute)
+    if not synonyms:
+        return " ".join(words)
+    out, i = [], 0
+    while i < len(words):
+        for size in range(min(_PHRASE_WORDS[attribute], len(words) - i), 0, -1):
+            phrase = " ".join(words[i:i + size])
+            if phrase in synonyms:
+                out.append(synonyms[phrase])
+                i += size
+                break
+        else:
+            out.append(words[i])
+            i += 1
+    return " ".join(out)
+
+
+def attribute_key(item, attributes=KEY_ATTRIBUTES) -> str:
+    """Canonical values of `attributes` joined with KEY_SEPARATOR, for an item object or row dict."""
+    get = item.get if isinstance(item, dict) else lambda attr: getattr(item, attr, None)
+    return KEY_SEPARATOR.join(canonical(attr, get(attr)) for attr in attributes)
+
+
+def lookup_key(item) -> str:
+    """Canonical material|color|pattern|sub_type key for an item object or row dict."""
+    return attribute_key(item, KEY_ATTRIBUTES)
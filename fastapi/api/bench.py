@@ -0,0 +1,973 @@
+"""
+Benchmarks for the backend, run from the fastapi/ directory:
+
+    python -m api.bench <benchmark> [options]
+
+Each benchmark runs against local stubs, so no Supabase or OpenAI
+credentials are needed.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import time
+import uuid
+
+
+def _configure_stub_env(supabase_url: str = "http://127.0.0.1:9", openai_url: str = None) -> None:
+    """Point the api package at local stubs; must run before any api module is imported."""
+    os.environ["SUPABASE_URL"] = supabase_url
+    os.environ.setdefault("SUPABASE_ROLE_KEY", "bench-key")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    if openai_url:
+        os.environ["OPENAI_BASE_URL"] = f"{openai_url}/v1"
+
+
+def sample_wardrobe_items(count: int, user_id: str = "bench-user"):
+    """Deterministic synthetic clothing_items rows."""
+    types = ["top", "bottom", "shoes", "outerwear", "accessory", "top", "bottom"]
+    colors = ["black", "white", "navy", "grey", "brown", "beige", "olive"]
+    materials = ["cotton", "wool", "denim", "leather", "linen", "polyester"]
+    patterns = ["solid", "solid", "striped", "plaid"]
+    weather = ["cold", "hot", "cold, rainy", "very cold,cold", "hot,very hot", "rainy,windy"]
+    occasions = ["work", "casual outing", "date night", "gym", "dinner party", "all occasions"]
+    formality = ["casual", "business casual", "smart casual", "high", "low"]
+    return [
+        {
+            "id": str(uuid.UUID(int=i + 1)),
+            "user_id": user_id,
+            "item_type": types[i % len(types)],
+            "material": materials[i % len(materials)],
+            "color": colors[(i * 3) % len(colors)],
+            "formality": formality[i % len(formality)],
+            "pattern": patterns[i % len(patterns)],
+            "fit": "regular",
+            "suitable_for_weather": weather[(i * 5) % len(weather)],
+            "suitable_for_occasion": ",".join(occasions[(i + k) % len(occasions)] for k in range(2)),
+            "sub_type": f"{colors[i % len(colors)]} {types[i % len(types)]} {i}",
+            "image_link": None,
+            "favorite": i % 9 == 0,
+            "added_date": "2024-01-01T00:00:00",
+        }
+        for i in range(count)
+    ]
+
+
+def sample_image_rows(count: int, seed: int = 0):
+    """
+    Synthetic image_items rows: a small attribute vocabulary typed the way users type it
+    (mixed case, stray whitespace, plurals and synonyms).
+    """
+    rng = random.Random(seed)
+    variants = {
+        "material": [["cotton", "Cotton", "cotton "], ["leather", "Leather"], ["denim", "Denim", "jean"],
+                     ["wool", "Wool", "woolen"], ["polyester", "Polyester", "poly"]],
+        "color": [["black", "Black", "BLACK", "black "], ["grey", "gray", "Grey"], ["navy", "Navy", "navy blue"],
+                  ["white", "White"], ["beige", "tan", "Khaki"]],
+        "pattern": [["solid", "Solid", "plain", "none"], ["striped", "Stripes", "stripe"], ["plaid", "checkered"]],
+        "sub_type": [["t-shirt", "T-Shirt", "tee", "t shirts"], ["jeans", "Jeans", "jean"], ["sneakers", "sneaker", "Trainers"],
+                     ["hoodie", "Hoodie", "hoody"], ["jacket", "Jacket", "jackets"], ["dress", "Dresses"]],
+    }
+    rows = []
+    for i in range(count):
+        row = {attr: rng.choice(rng.choice(options)) for attr, options in variants.items()}
+        row["id"] = str(uuid.UUID(int=i + 1))
+        row["image_link"] = f"https://example.com/{i}.png"
+        rows.append(row)
+    return rows
+
+
+def sample_occasion_messages(count: int, seed: int = 0):
+    """
+    Synthetic chat messages labelled the way the LLM labels them: some name the
+    occasion outright, some only describe it, and a few mention two occasions.
+    """
+    rng = random.Random(seed)
+    phrasings = {
+        "work": ["for work", "for the office", "for a day at the office", "for a client meeting",
+                 "for a team standup and presentations", "to the quarterly review meeting with my manager"],
+        "job interview": ["for a job interview", "for my interview", "to meet a hiring manager",
+                          "for a final round with the recruiter"],
+        "gym": ["for the gym", "for a workout", "for leg day", "for a spin class", "for lifting weights"],
+        "date night": ["for a date", "for date night", "for a romantic dinner for two", "to meet my crush",
+                       "for our anniversary evening"],
+        "dinner party": ["for a dinner party", "for dinner at a friend's place", "to host friends for dinner"],
+        "beach": ["for the beach", "for a day by the ocean", "for surfing and sunbathing", "for the seaside"],
+        "brunch": ["for brunch", "for mimosas and pancakes", "for a late breakfast with friends"],
+        "travel": ["for travel", "for a long flight", "for the airport", "for a road trip", "for my trip to Rome"],
+        "party": ["for a party", "for a birthday bash", "for a night out clubbing", "for a house party"],
+        "casual outing": ["for a casual outing", "to run errands", "for a walk in the park", "for a lazy saturday"],
+        "black tie event": ["for a black tie gala", "for a black tie event", "for the opera gala"],
+        "general formal occasion": ["for a formal event", "for a wedding", "for a graduation ceremony"],
+        "general informal occasion": ["for something informal", "for hanging out at home"],
+        "all occasions": ["for tomorrow", "for today", "that looks good", "for the weekend"],
+    }
+    openers = ["What should I wear", "Suggest an outfit", "Can you pick an outfit", "Help me dress",
+               "i need an outfit", "Outfit ideas"]
+    occasions = list(phrasings)
+    messages = []
+    for _ in range(count):
+        occasion = rng.choice(occasions)
+        text = f"{rng.choice(openers)} {rng.choice(phrasings[occasion])}"
+        if rng.random() < 0.1:
+            # A second occasion mentioned in passing; the LLM still picks the main one
+            other = rng.choice([o for o in occasions if o != occasion])
+            text += f", then maybe {rng.choice(phrasings[other]).removeprefix('for ')} later"
+        messages.append({"message": text + rng.choice(["?", "", "!", " please"]), "occasion": occasion})
+    return messages
+
+
+# ——— Stub servers ———
+
+class _StubServer:
+    """
+    Minimal keep-alive HTTP/1.1 server on asyncio, run in a child process so
+    the stub doesn't compete with the code under test for the GIL.
+
+    `handler(method, path, body)` returns (status, content_type, body_bytes,
+    latency_seconds) and must be a picklable module-level function. The body may
+    also be a list of (seconds_after_request, bytes) pieces, sent chunked as a stream.
+    """
+
+    def __init__(self, handler, *args):
+        self._ready = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=self._serve, args=(self._ready, handler, args), daemon=True
+        )
+
+    @staticmethod
+    def _serve(ready, handler, args):
+        async def handle(reader, writer):
+            try:
+                while True:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    method, path, _ = request_line.decode().split(" ", 2)
+                    length = 0
+                    while (line := await reader.readline()) not in (b"\r\n", b""):
+                        name, _, value = line.decode().partition(":")
+                        if name.lower() == "content-length":
+                            length = int(value)
+                    body = await reader.readexactly(length) if length else b""
+                    received = time.perf_counter()
+                    status, content_type, payload, latency = handler(method, path, body, *args)
+                    if latency:
+                        await asyncio.sleep(latency)
+                    if isinstance(payload, list):
+                        writer.write(f"HTTP/1.1 {status} OK\r\nContent-Type: {content_type}\r\n"
+                                     f"Transfer-Encoding: chunked\r\n\r\n".encode())
+                        for at, piece in payload:
+                            delay = received + at - time.perf_counter()
+                            if delay > 0:
+                                await asyncio.sleep(delay)
+                            writer.write(f"{len(piece):x}\r\n".encode() + piece + b"\r\n")
+                            await writer.drain()
+                        writer.write(b"0\r\n\r\n")
+                    else:
+                        writer.write(
+                            f"HTTP/1.1 {status} OK\r\nContent-Type: {content_type}\r\n"
+                            f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                        )
+                    await writer.drain()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                writer.close()
+
+        async def main():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0, backlog=1024)
+            ready.put(server.sockets[0].getsockname()[1])
+            await server.serve_forever()
+
+        asyncio.run(main())
+
+    def __enter__(self):
+        self.process.start()
+        self.url = f"http://127.0.0.1:{self._ready.get(timeout=10)}"
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+
+def postgrest_stub(method, path, body, rows, latency):
+    """Stub PostgREST: answers every request with `rows` after `latency` seconds."""
+    return 200, "application/json", json.dumps(rows).encode(), latency
+
+
+def image_download_stub(method, path, body, latency):
+    """Stub image host: serves a tiny PNG-sized payload."""
+    return 200, "image/png", b"\x89PNG" + b"\0" * 2048, latency
+
+
+def openai_images_stub(method, path, body, image_url, latency):
+    """Stub OpenAI images API: every generation returns `image_url` after `latency` seconds."""
+    payload = {"created": int(time.time()), "data": [{"url": image_url, "revised_prompt": ""}]}
+    return 200, "application/json", json.dumps(payload).encode(), latency
+
+
+def openai_chat_stub(method, path, body, content, latency):
+    """Stub OpenAI chat completions API: always answers with `content` after `latency` seconds."""
+    payload = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": json.loads(body or b"{}").get("model", "gpt-4o-mini"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+    return 200, "application/json", json.dumps(payload).encode(), latency
+
+
+def openai_routing_stub(method, path, body, outfit_content, occasion, latency):
+    """Stub OpenAI chat completions API: outfit prompts get `outfit_content`, any other prompt `occasion`."""
+    return openai_chat_stub(method, path, body, outfit_content if b"outfit_items" in body else occasion, latency)
+
+
+def openai_stream_stub(method, path, body, outfit_content, occasion, latency, tokens_per_second):
+    """
+    Stub OpenAI chat completions API that generates like a model: the first token
+    after `latency` seconds, then `tokens_per_second` tokens of about 4 characters.
+    Streaming requests get the tokens as they are generated, others the whole answer.
+    """
+    content = outfit_content if b"outfit_items" in body else occasion
+    request = json.loads(body or b"{}")
+    tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+    if not request.get("stream"):
+        return openai_chat_stub(method, path, body, content, latency + (len(tokens) - 1) / tokens_per_second)
+
+    def event(delta, finish_reason=None):
+        chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                 "model": request.get("model", "gpt-4o-mini"),
+                 "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        return f"data: {json.dumps(chunk)}\n\n".encode()
+
+    pieces = [(latency + i / tokens_per_second, event({"content": token})) for i, token in enumerate(tokens)]
+    pieces.append((pieces[-1][0], event({}, "stop") + b"data: [DONE]\n\n"))
+    return 200, "text/event-stream", pieces, 0
+
+
+def weather_forecast_stub(method, path, body, latency):
+    """Stub weatherapi.com forecast endpoint: one mild, rainy day."""
+    hour = {"time": "2024-01-01 09:00", "temp_f": 55.0, "condition": {"text": "Light rain"}, "feelslike_f": 52.0,
+            "humidity": 80, "wind_kph": 12.0, "chance_of_rain": 70, "is_day": 1}
+    day = {"date": "2024-01-01", "day": {"maxtemp_f": 58.0, "mintemp_f": 46.0, "condition": {"text": "Light rain"},
+                                         "daily_chance_of_rain": 70, "avghumidity": 80, "maxwind_kph": 15.0},
+           "hour": [hour]}
+    payload = {"location": {"name": "Bench"}, "forecast": {"forecastday": [day]}}
+    return 200, "application/json", json.dumps(payload).encode(), latency
+
+
+# ——— Benchmarks ———
+
+def bench_wardrobe_load(concurrency_levels=(1, 8, 32, 64), requests_per_level: int = 256,
+                        latency: float = 0.05, items: int = 50) -> None:
+    """
+    Throughput of /wardrobe/clothing_items/all/ against a stub PostgREST
+    server, comparing the repository (the sync client in the threadpool) with the
+    previous behaviour of calling the sync client on the event loop. The wardrobe
+    cache is disabled so every request reaches the database.
+    """
+    rows = sample_wardrobe_items(items)
+    with _StubServer(postgrest_stub, rows, latency) as stub:
+        _configure_stub_env(stub.url)
+        import httpx
+        from api.main import app
+        from api.Database import wardrobe
+        from api.Database.auth import get_current_user
+        from api.Database.tokens import VerifiedUser
+        from api.Database.wardrobe_cache import wardrobe_cache
+        from api.routers import clothing
+
+        app.dependency_overrides[get_current_user] = lambda: VerifiedUser(id="bench-user")
+        native = clothing.get_all_user_items_db
+
+        async def blocking(user):
+            return wardrobe.get_all_user_items_db(user)
+
+        async def run(concurrency: int) -> float:
+            semaphore = asyncio.Semaphore(concurrency)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                async def one():
+                    async with semaphore:
+                        response = await client.get("/wardrobe/clothing_items/all/")
+                        assert response.status_code == 200, response.text
+                start = time.perf_counter()
+                await asyncio.gather(*(one() for _ in range(requests_per_level)))
+                return requests_per_level / (time.perf_counter() - start)
+
+        async def run_levels():
+            return [await run(c) for c in concurrency_levels]
+
+        wardrobe_cache.max_bytes = 0  # nothing fits, so nothing is cached
+        modes = {"threadpool": native, "sync on event loop": blocking}
+        print(f"Stub latency {latency * 1000:.0f} ms, {items} items, {requests_per_level} requests per level")
+        print(f"{'mode':<22}" + "".join(f"{'c=' + str(c):>10}" for c in concurrency_levels) + "   (req/s)")
+        for name, handler in modes.items():
+            clothing.get_all_user_items_db = handler
+            results = asyncio.run(run_levels())
+            print(f"{name:<22}" + "".join(f"{r:>10.1f}" for r in results))
+        clothing.get_all_user_items_db = native
+
+
+def bench_image_key_replay(rows_file: str = None, count: int = 2000) -> None:
+    """
+    Replays image_items rows in insertion order and counts how many would have reused an existing
+    image with the old exact four-column match versus the canonical lookup key. Pass a JSON export
+    of the table with --rows to replay real data; otherwise synthetic rows are used.
+    """
+    from api.attributes import KEY_ATTRIBUTES, lookup_key
+
+    if rows_file:
+        with open(rows_file) as f:
+            rows = json.load(f)
+    else:
+        rows = sample_image_rows(count)
+
+    def replay(key_fn):
+        seen, hits = set(), 0
+        for row in rows:
+            key = key_fn(row)
+            hits += key in seen
+            seen.add(key)
+        return hits, len(seen)
+
+    start = time.perf_counter()
+    canonical_hits, canonical_keys = replay(lookup_key)
+    elapsed = time.perf_counter() - start
+    exact_hits, exact_keys = replay(lambda row: tuple(row.get(attr) for attr in KEY_ATTRIBUTES))
+
+    print(f"Replayed {len(rows)} image_items rows ({rows_file or 'synthetic'})")
+    print(f"{'match':<12}{'hit rate':>10}{'images generated':>18}")
+    print(f"{'exact':<12}{exact_hits / len(rows):>10.1%}{exact_keys:>18}")
+    print(f"{'canonical':<12}{canonical_hits / len(rows):>10.1%}{canonical_keys:>18}")
+    print(f"Canonical key cost: {elapsed / len(rows) * 1e6:.1f} us per row")
+
+
+def bench_image_batch(items: int = 48, latency: float = 0.5, concurrency: int = 8) -> None:
+    """
+    Wall time to generate images for a bulk import against a stub images API:
+    the one-at-a-time loop versus the concurrent, rate-limited generate_images.
+    """
+    with _StubServer(image_download_stub, 0.02) as downloads:
+        with _StubServer(openai_images_stub, f"{downloads.url}/image.png", latency) as api:
+            _configure_stub_env(openai_url=api.url)
+            from api.llm import image
+            from api.models import ClothingItem
+
+            batch = [
+                ClothingItem(**{k: v for k, v in row.items() if k in ClothingItem.model_fields})
+                for row in sample_wardrobe_items(items)
+            ]
+
+            start = time.perf_counter()
+            for item in batch:
+                image.generate_image(item)
+            sequential = time.perf_counter() - start
+
+            async def run(rate_per_minute: float):
+                first = None
+                start = time.perf_counter()
+                done = 0
+                async for result in image.generate_images(batch, concurrency=concurrency,
+                                                          rate_per_minute=rate_per_minute):
+                    assert result.image, result.error
+                    first = first or time.perf_counter() - start
+                    done += 1
+                assert done == len(batch)
+                return time.perf_counter() - start, first
+
+            unlimited, first_unlimited = asyncio.run(run(1e9))
+            limited_rate = 60 * concurrency / latency / 4
+            limited, first_limited = asyncio.run(run(limited_rate))
+
+            print(f"{items} images, stub generation latency {latency * 1000:.0f} ms")
+            print(f"{'mode':<40}{'total s':>10}{'first s':>10}{'images/s':>10}")
+            print(f"{'sequential generate_image':<40}{sequential:>10.2f}{sequential / items:>10.2f}{items / sequential:>10.1f}")
+            print(f"{f'generate_images c={concurrency}':<40}{unlimited:>10.2f}{first_unlimited:>10.2f}{items / unlimited:>10.1f}")
+            label = f"generate_images c={concurrency} @{limited_rate:.0f}/min"
+            print(f"{label:<40}{limited:>10.2f}{first_limited:>10.2f}{items / limited:>10.1f}")
+
+
+def bench_llm_client(calls: int = 200, latency: float = 0.0, threads: int = 8) -> None:
+    """
+    Per-call overhead of LLMClient against a stub chat completions server: the previous
+    with_temperature() + invoke() pattern (a new ChatOpenAI and HTTP client per call) versus
+    per-call temperature on the pooled clients.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with _StubServer(openai_chat_stub, "work", latency) as api:
+        _configure_stub_env(openai_url=api.url)
+        from langchain_core.messages import SystemMessage
+        from langchain_openai import ChatOpenAI
+        from api.llm.client import llm_client
+
+        messages = [SystemMessage(content="Which occasion is this item for?")]
+        temperatures = [0.3, 0.5, 0.7]
+
+        def rebuilt(i):
+            llm = ChatOpenAI(openai_api_key=llm_client.api_key, temperature=temperatures[i % 3],
+                             top_p=1, model_name=llm_client.model_name)
+            return llm.invoke(messages).content
+
+        def pooled(i):
+            return llm_client.invoke(messages, temperature=temperatures[i % 3])
+
+        print(f"{calls} calls, stub latency {latency * 1000:.0f} ms")
+        print(f"{'mode':<34}{'sequential ms/call':>20}{f'{threads} threads ms/call':>22}")
+        for name, fn in (("new client per call (before)", rebuilt), ("pooled clients (after)", pooled)):
+            fn(0)
+            start = time.perf_counter()
+            for i in range(calls):
+                fn(i)
+            sequential = (time.perf_counter() - start) / calls
+            with ThreadPoolExecutor(threads) as pool:
+                start = time.perf_counter()
+                list(pool.map(fn, range(calls)))
+                threaded = (time.perf_counter() - start) / calls
+            print(f"{name:<34}{sequential * 1000:>20.2f}{threaded * 1000:>22.2f}")
+
+
+def bench_occasion_classifier(corpus_file: str = None, model_file: str = None, count: int = 3000) -> None:
+    """
+    Offline evaluation of the local occasion fast path against LLM labels. The corpus is JSON
+    lines of {"message", "occasion"} (pass --corpus; otherwise synthetic messages are used).
+    Without --model, a model is trained on 80% of the corpus and evaluated on the rest.
+    Reports how often the LLM would be skipped, the accuracy of those local answers, and the
+    accuracy of the old keyword fallback for comparison. The synthetic messages come from a few
+    templates shared by the train and test splits, so their accuracy is an upper bound.
+    """
+    _configure_stub_env()
+    from api.llm import classifier, occasion
+
+    if corpus_file:
+        with open(corpus_file) as f:
+            corpus = [json.loads(line) for line in f if line.strip()]
+    else:
+        corpus = sample_occasion_messages(count)
+
+    if model_file:
+        test = corpus
+        classifier.occasion_model = classifier.OccasionModel.load(model_file)
+    else:
+        corpus = corpus[:]
+        random.Random(1).shuffle(corpus)
+        split = int(len(corpus) * 0.8)
+        train, test = corpus[:split], corpus[split:]
+        classifier.occasion_model = classifier.OccasionModel(
+            classifier.train_occasion_model((row["message"], row["occasion"]) for row in train)
+        )
+
+    def evaluate(model):
+        classifier.occasion_model = model
+        answered = correct = 0
+        timings = []
+        for row in test:
+            start = time.perf_counter()
+            label = occasion.classify_locally(row["message"])
+            timings.append(time.perf_counter() - start)
+            if label is not None:
+                answered += 1
+                correct += label == row["occasion"]
+        timings.sort()
+        return answered, correct, timings
+
+    fallback_correct = sum(occasion.fallback_determineOccasions(r["message"]) == r["occasion"] for r in test)
+    trained = classifier.occasion_model
+    print(f"Evaluated on {len(test)} labelled messages ({corpus_file or 'synthetic'})")
+    if not corpus_file:
+        print("Synthetic messages share templates across the split; accuracy here is an upper bound")
+    print(f"{'local path':<20}{'LLM avoided':>13}{'accuracy':>10}{'p50 us':>9}{'p99 us':>9}")
+    for name, model in (("rules only", None), ("rules + model", trained)):
+        answered, correct, timings = evaluate(model)
+        accuracy = correct / answered if answered else 0.0
+        p50, p99 = timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+        print(f"{name:<20}{answered / len(test):>13.1%}{accuracy:>10.1%}{p50 * 1e6:>9.0f}{p99 * 1e6:>9.0f}")
+    print(f"Keyword fallback on every message (previous LLM-failure path): {fallback_correct / len(test):.1%} accurate")
+
+
+def bench_occasion_matcher(count: int = 20000) -> None:
+    """
+    Per-message cost of fallback_determineOccasions: the previous per-phrase regex search
+    (one pattern built and scanned per occasion and synonym) versus the precompiled
+    single-pass matcher. Also checks both return the same occasion for every message.
+    """
+    import re
+
+    _configure_stub_env()
+    from api.llm import occasion
+    from api.llm.config import ai_config
+
+    def per_phrase(user_message):
+        lower_msg = user_message.lower()
+        for occ in sorted(ai_config.get_occasion_config().keys(), key=len, reverse=True):
+            if re.search(r'\b' + re.escape(occ) + r'\b', lower_msg):
+                return occ
+        for key, value in occasion.OCCASION_SYNONYMS.items():
+            if re.search(r'\b' + re.escape(key) + r'\b', lower_msg):
+                return value
+        return "all occasions"
+
+    messages = [row["message"] for row in sample_occasion_messages(count)]
+    mismatches = sum(per_phrase(m) != occasion.fallback_determineOccasions(m) for m in messages)
+
+    start = time.perf_counter()
+    occasion._matcher = None
+    occasion.get_matcher()
+    build = time.perf_counter() - start
+
+    print(f"{count} messages, {mismatches} mismatches; matcher build {build * 1000:.2f} ms (once per config load)")
+    print(f"{'implementation':<28}{'us/message':>12}")
+    for name, fn in (("per-phrase regex (before)", per_phrase),
+                     ("precompiled matcher (after)", occasion.fallback_determineOccasions)):
+        start = time.perf_counter()
+        for m in messages:
+            fn(m)
+        print(f"{name:<28}{(time.perf_counter() - start) / count * 1e6:>12.2f}")
+
+
+def bench_outfit_solver(sizes=(10, 50, 200, 1000, 2000), repeats: int = 20) -> None:
+    """
+    Latency of the local outfit solver (top-3 outfits) across wardrobe sizes, and whether
+    every returned outfit passes validate_outfit_composition and check_style_coherence.
+    """
+    _configure_stub_env()
+    from api.llm.outfit import WardrobeItem, check_style_coherence, validate_outfit_composition
+    from api.llm.solver import solve_outfits
+
+    weather = [
+        {"temperature": 8, "feels_like": 6, "description": "light rain", "humidity": 85, "wind_speed": 12,
+         "forecast": {"high": 10, "low": 4}},
+        {"temperature": 21, "feels_like": 21, "description": "clear sky", "humidity": 40, "wind_speed": 5,
+         "forecast": {"high": 23, "low": 17}},
+        {"temperature": 31, "feels_like": 33, "description": "hot and sunny", "humidity": 60, "wind_speed": 3,
+         "forecast": {"high": 34, "low": 24}},
+    ]
+    occasions = ["work", "casual outing", "date night", "gym", "dinner party"]
+
+    print(f"{'items':>6}{'mean ms':>10}{'p95 ms':>10}{'valid':>8}")
+    for size in sizes:
+        wardrobe = [WardrobeItem.from_dict(row) for row in sample_wardrobe_items(size)]
+        timings, valid, total = [], 0, 0
+        for i in range(repeats):
+            start = time.perf_counter()
+            solutions = solve_outfits(wardrobe, weather[i % len(weather)], occasions[i % len(occasions)], k=3)
+            timings.append(time.perf_counter() - start)
+            for _, items in solutions:
+                dicts = [item.to_dict() for item in items]
+                total += 1
+                valid += validate_outfit_composition(dicts)[0] and check_style_coherence(dicts)[0]
+        timings.sort()
+        mean = sum(timings) / len(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{size:>6}{mean * 1000:>10.2f}{p95 * 1000:>10.2f}{f'{valid}/{total}':>8}")
+
+
+def bench_prompt_size(sizes=(10, 50, 200, 500, 2000)) -> None:
+    """
+    Estimated outfit prompt tokens per wardrobe size with and without score-based pruning,
+    and the time spent building the prompt.
+    """
+    _configure_stub_env()
+    from api.llm import outfit
+
+    weather = {"temperature": 12, "feels_like": 11, "description": "overcast", "humidity": 70, "wind_speed": 10,
+               "forecast": {"high": 14, "low": 8}}
+    print(f"budget {outfit.PROMPT_WARDROBE_TOKEN_BUDGET} wardrobe tokens, at most {outfit.PROMPT_MAX_ITEMS_PER_TYPE} items per type")
+    print(f"{'items':>6}{'items sent':>12}{'tokens before':>15}{'tokens after':>14}{'build ms':>10}")
+    for size in sizes:
+        wardrobe = outfit.parse_wardrobe(sample_wardrobe_items(size))
+        outfit.prompt_token_stats.clear()
+        start = time.perf_counter()
+        prompt = outfit.prepare_outfit_prompt("What should I wear to work?", weather, wardrobe, "work")
+        elapsed = time.perf_counter() - start
+        stats = outfit.prompt_token_stats
+        print(f"{size:>6}{len(prompt.wardrobe_ids):>12}{stats['tokens_unpruned']:>15}{stats['tokens']:>14}"
+              f"{elapsed * 1000:>10.1f}")
+
+
+def scan_suitable_items(wardrobe_items, weather_data, occasion):
+    """The per-item filter_suitable_items loop the suitability index replaced, as the reference."""
+    from api.llm.outfit import ItemType
+
+    filtered_items = []
+    for item in wardrobe_items:
+        if not item.is_suitable_for_weather(weather_data):
+            if item.item_type not in [ItemType.ACCESSORY, ItemType.SHOES]:
+                continue
+        if not item.is_suitable_for_occasion(occasion):
+            if not (("formal" in occasion.lower() and "semi-formal" in item.suitable_for_occasion) or
+                    ("casual" in occasion.lower() and "smart casual" in item.suitable_for_occasion)):
+                continue
+        filtered_items.append(item)
+    return filtered_items
+
+
+def bench_suitability_index(sizes=(100, 1000, 10000), repeats: int = 50, seed: int = 0) -> None:
+    """
+    filter_suitable_items on the precomputed bitset index against the per-item scan, per
+    wardrobe size: the one-off index build, a filter on a built index, and the number of
+    (weather, occasion) cases where the two disagree.
+    """
+    _configure_stub_env()
+    from api.llm.outfit import WardrobeItem
+    from api.llm.suitability import SuitabilityIndex
+
+    rng = random.Random(seed)
+    descriptions = ["clear sky", "light rain", "heavy snow", "windy", "drizzle and wind", "overcast", "hot and sunny"]
+    weather = [
+        {"temperature": t, "feels_like": t + rng.choice([-3, 0, 2]), "description": rng.choice(descriptions),
+         "humidity": rng.choice([30, 60, 75, 90]), "wind_speed": rng.choice([2, 12, 25]),
+         "forecast": rng.choice([{}, {"high": t + 3, "low": t - 2}, {"high": t + 8, "low": t - 6}])}
+        for t in (rng.randint(-5, 38) for _ in range(24))
+    ]
+    occasions = ["work", "casual outing", "date night", "gym", "dinner party", "formal event", "business casual"]
+    cases = [(w, o) for w in weather for o in occasions]
+
+    print(f"{'items':>6}{'scan us':>10}{'index us':>10}{'speedup':>9}{'build ms':>10}{'mismatches':>12}")
+    for size in sizes:
+        rows = sample_wardrobe_items(size)
+        for row in rows[::7]:
+            row["suitable_for_occasion"] += rng.choice([",semi-formal", ",smart casual", ",Work", ""])
+            row["material"] = rng.choice(["windproof nylon", "breathable mesh", row["material"]])
+            # Sample rows always pair the extreme tags with the milder ones; break that up
+            row["suitable_for_weather"] = rng.choice(["very cold", "very hot", "cold,windy", row["suitable_for_weather"]])
+        wardrobe = [WardrobeItem.from_dict(row) for row in rows]
+
+        start = time.perf_counter()
+        index = SuitabilityIndex(wardrobe)
+        build = time.perf_counter() - start
+
+        mismatches = sum(index.filter(w, o) != scan_suitable_items(wardrobe, w, o) for w, o in cases)
+        runs = [cases[i % len(cases)] for i in range(repeats)]
+        start = time.perf_counter()
+        for w, o in runs:
+            scan_suitable_items(wardrobe, w, o)
+        scan = (time.perf_counter() - start) / repeats
+        start = time.perf_counter()
+        for w, o in runs:
+            index.filter(w, o)
+        indexed = (time.perf_counter() - start) / repeats
+        print(f"{size:>6}{scan * 1e6:>10.0f}{indexed * 1e6:>10.0f}{scan / indexed:>8.1f}x{build * 1000:>10.2f}"
+              f"{f'{mismatches}/{len(cases)}':>12}")
+
+
+def bench_wardrobe_memory(sizes=(100, 1000, 5000), requests: int = 10) -> None:
+    """
+    Memory held by a parsed wardrobe per 1k items, and per simulated outfit request
+    (parse the rows, build the prompt, validate an answer) the peak memory allocated
+    and the time. Warm requests pass the same row dicts again, as when the wardrobe
+    is served from the wardrobe cache; cold ones pass fresh copies of the rows.
+    """
+    _configure_stub_env()
+    import gc
+    import logging
+    import tracemalloc
+    from api.llm import outfit
+
+    logging.disable(logging.INFO)
+    weather = {"temperature": 12, "feels_like": 11, "description": "light rain", "humidity": 75, "wind_speed": 10,
+               "forecast": {"high": 14, "low": 8}}
+
+    def request(rows, answer):
+        objects = outfit.parse_wardrobe(list(rows))
+        prompt = outfit.prepare_outfit_prompt("What should I wear to work?", weather, objects, "work")
+        outfit.finalize_outfit(answer, prompt)
+
+    def measure(make_rows, answer):
+        batches = [make_rows() for _ in range(requests + 1)]
+        request(batches.pop(), answer)  # warm up
+        start = time.perf_counter()
+        for rows in batches[1:]:
+            request(rows, answer)
+        elapsed = (time.perf_counter() - start) / (len(batches) - 1)
+        gc.collect()
+        tracemalloc.start()
+        request(batches[0], answer)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak, elapsed
+
+    print(f"{'items':>6}{'KB per 1k items':>17}{'warm peak KB':>14}{'warm ms':>10}{'cold peak KB':>14}{'cold ms':>10}",
+          flush=True)
+    for size in sizes:
+        rows = sample_wardrobe_items(size)
+        gc.collect()
+        tracemalloc.start()
+        wardrobe = outfit.parse_wardrobe(list(rows))
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        answer = json.dumps({"occasion": "work", "outfit_items": [{"id": item.id} for item in wardrobe[:3]],
+                             "description": "", "styling_tips": ""})
+        del wardrobe
+
+        warm_peak, warm = measure(lambda: rows, answer)
+        cold_peak, cold = measure(lambda: [dict(row) for row in rows], answer)
+        print(f"{size:>6}{held / 1024 * 1000 / size:>17.0f}{warm_peak / 1024:>14.0f}{warm * 1000:>10.2f}"
+              f"{cold_peak / 1024:>14.0f}{cold * 1000:>10.2f}", flush=True)
+
+
+def bench_metrics_overhead(spans: int = 200000) -> None:
+    """Cost of one metrics span with metrics enabled and disabled, and of rendering /metrics."""
+    _configure_stub_env()
+    from api import metrics
+
+    enabled = metrics.METRICS_ENABLED
+    print(f"{'metrics':>9}{'ns/span':>10}")
+    try:
+        for state in (True, False):
+            metrics.METRICS_ENABLED = state
+            start = time.perf_counter()
+            for _ in range(spans):
+                with metrics.span("bench"):
+                    pass
+            elapsed = time.perf_counter() - start
+            print(f"{'enabled' if state else 'disabled':>9}{elapsed / spans * 1e9:>10.0f}")
+    finally:
+        metrics.METRICS_ENABLED = enabled
+    start = time.perf_counter()
+    text = metrics.render()
+    print(f"render: {len(text.splitlines())} lines in {(time.perf_counter() - start) * 1000:.2f} ms")
+    metrics.reset()
+
+
+def bench_chat_pipeline(requests: int = 10, db_latency: float = 0.1, llm_latency: float = 0.3,
+                        weather_latency: float = 0.15, items: int = 50) -> None:
+    """
+    /chat/ latency with its independent stages (wardrobe fetch, occasion detection,
+    forecast lookup) run one after another versus concurrently, against stub
+    Supabase, OpenAI and weather servers. Stage times come from the Server-Timing
+    header; every request has a new message and regenerates, so both LLM calls run.
+    """
+    rows = sample_wardrobe_items(items)
+    outfit = json.dumps({"occasion": "work", "outfit_items": [{"id": rows[i]["id"]} for i in (0, 1, 2)],
+                         "description": "Bench outfit", "styling_tips": "None"})
+    with _StubServer(postgrest_stub, rows, db_latency) as db, \
+            _StubServer(openai_routing_stub, outfit, "work", llm_latency) as ai, \
+            _StubServer(weather_forecast_stub, weather_latency) as weather:
+        _configure_stub_env(db.url, ai.url)
+        os.environ["WEATHER_BASE_URL"] = weather.url
+        os.environ.setdefault("WEATHER_API_KEY", "bench-key")
+        import logging
+        import httpx
+        from api.main import app
+        from api.Database.auth import get_current_user
+        from api.Database.tokens import VerifiedUser
+        from api.Database.wardrobe_cache import wardrobe_cache
+        from api.routers import chat
+
+        logging.disable(logging.INFO)
+        app.dependency_overrides[get_current_user] = lambda: VerifiedUser(id="bench-user")
+        weather_data = {"temperature": 12, "description": "overcast", "feels_like": 11, "humidity": 60,
+                        "wind_speed": 8, "location": "Bench", "timestamp": "2024-01-01T09:00:00"}
+        stages = ("wardrobe_fetch", "occasion", "forecast", "generate", "chat")
+
+        async def run(label: str):
+            chat.CHAT_CONCURRENT_STAGES = label == "concurrent"
+            timings = {stage: [] for stage in stages}
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                         timeout=60) as client:
+                for i in range(requests + 1):
+                    wardrobe_cache.invalidate("bench-user")
+                    body = {"user_message": f"What should I wear tomorrow? ({label} {i})", "regenerate": True,
+                            "weather_data": weather_data, "lat": 40.7, "lon": -74.0}
+                    response = await client.post("/chat/", json=body)
+                    assert response.status_code == 200 and response.json()["response"]["outfit_items"], response.text
+                    if not i:
+                        continue  # warm-up
+                    header = dict(entry.split(";dur=") for entry in response.headers["server-timing"].split(", "))
+                    for stage in stages:
+                        timings[stage].append(float(header.get(stage, 0)))
+            return {stage: sum(values) / len(values) for stage, values in timings.items()}
+
+        async def main():
+            # One event loop for both runs: the async LLM clients are bound to it
+            return {label: await run(label) for label in ("sequential", "concurrent")}
+
+        print(f"stub latency: db {db_latency * 1000:.0f} ms, llm {llm_latency * 1000:.0f} ms, "
+              f"forecast {weather_latency * 1000:.0f} ms; {requests} requests")
+        print(f"{'stages':<12}" + "".join(f"{stage + ' ms':>18}" for stage in stages))
+        for label, means in asyncio.run(main()).items():
+            print(f"{label:<12}" + "".join(f"{means[stage]:>18.1f}" for stage in stages))
+
+
+def bench_chat_stream(requests: int = 10, db_latency: float = 0.05, llm_latency: float = 0.3,
+                      tokens_per_second: float = 80, items: int = 9) -> None:
+    """
+    Time to the first outfit item on /chat/stream versus the full /chat/ response,
+    served by uvicorn (so the stream reaches the client as it is written) against
+    stub Supabase and a stub OpenAI that generates at `tokens_per_second` after a
+    first-token latency. The answer is a short reasoning paragraph and the outfit JSON;
+    the wardrobe is small enough that the prompt keeps every item the answer names.
+    """
+    rows = sample_wardrobe_items(items)
+    outfit = {"occasion": "work",
+              "outfit_items": [{"id": rows[i]["id"], "sub_type": rows[i]["sub_type"], "color": rows[i]["color"],
+                                "item_type": rows[i]["item_type"]} for i in (0, 1, 2, 3)],
+              "description": "A clean, balanced look for a day at the office.",
+              "styling_tips": "Roll the sleeves once and keep accessories minimal."}
+    answer = ("The user needs a work outfit. The weather is mild, so a light top, tailored bottom and "
+              "closed shoes fit best; colours should stay neutral and the formality consistent.\n\n"
+              "### Output:\n```json\n" + json.dumps(outfit, indent=2) + "\n```")
+    with _StubServer(postgrest_stub, rows, db_latency) as db, \
+            _StubServer(openai_stream_stub, answer, "work", llm_latency, tokens_per_second) as ai:
+        _configure_stub_env(db.url, ai.url)
+        import logging
+        import httpx
+        import uvicorn
+        from api.main import app
+        from api.Database.auth import get_current_user
+        from api.Database.tokens import VerifiedUser
+
+        logging.disable(logging.INFO)
+        app.dependency_overrides[get_current_user] = lambda: VerifiedUser(id="bench-user")
+        weather_data = {"temperature": 18, "description": "clear", "feels_like": 18, "humidity": 50,
+                        "wind_speed": 8, "location": "Bench", "timestamp": "2024-01-01T09:00:00"}
+
+        async def main():
+            server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning",
+                                                   lifespan="off"))
+            serving = asyncio.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.01)
+            url = f"http://127.0.0.1:{server.servers[0].sockets[0].getsockname()[1]}"
+            full, first_item, done, streamed = [], [], [], []
+            try:
+                async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+                    for i in range(requests + 1):
+                        body = {"user_message": f"What should I wear tomorrow? (full {i})", "regenerate": True,
+                                "weather_data": weather_data}
+                        start = time.perf_counter()
+                        response = await client.post("/chat/", json=body)
+                        assert response.json()["response"]["outfit_items"], response.text
+                        elapsed = time.perf_counter() - start
+
+                        body["user_message"] = f"What should I wear tomorrow? (stream {i})"
+                        start, first, events = time.perf_counter(), None, []
+                        async with client.stream("POST", "/chat/stream", json=body) as response:
+                            async for line in response.aiter_lines():
+                                if line.startswith("event: "):
+                                    events.append(line[7:])
+                                    if events[-1] == "item" and first is None:
+                                        first = time.perf_counter() - start
+                        assert events[-1] == "done" and first is not None, events
+                        if i:  # the first round is a warm-up
+                            full.append(elapsed)
+                            first_item.append(first)
+                            done.append(time.perf_counter() - start)
+                            streamed.append(events.count("item"))
+            finally:
+                server.should_exit = True
+                await serving
+            return full, first_item, done, streamed
+
+        full, first_item, done, streamed = asyncio.run(main())
+        mean = lambda values: sum(values) / len(values) * 1000
+        print(f"stub: db {db_latency * 1000:.0f} ms, first token {llm_latency * 1000:.0f} ms, "
+              f"{tokens_per_second:.0f} tokens/s, answer ~{len(answer) // 4} tokens; {requests} requests")
+        print(f"/chat/ full response        {mean(full):8.1f} ms")
+        print(f"/chat/stream first item     {mean(first_item):8.1f} ms  ({mean(first_item) / mean(full):.0%} of full)")
+        print(f"/chat/stream done           {mean(done):8.1f} ms  ({sum(streamed) / len(streamed):.1f} item events)")
+
+
+RECORDED_EXCHANGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  "tests", "data", "outfit_exchanges.jsonl")
+
+
+def load_recorded_exchanges(path: str = RECORDED_EXCHANGES):
+    """Outfit exchanges recorded through OUTFIT_RECORD_PATH (JSON lines)."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay_recorded_outfit(record, encoding: str, include_examples: bool = True):
+    """
+    Rebuilds the record's prompt in `encoding` and validates the recorded answer against it,
+    re-addressed to that prompt's item IDs. Returns (prompt, recorded item IDs, validated
+    item IDs, retry messages); the recorded outfit survived if the two ID lists are equal.
+    """
+    from api.llm import outfit
+
+    wardrobe = outfit.parse_wardrobe(record["wardrobe"])
+    prompt = outfit.prepare_outfit_prompt(record["user_message"], record["weather_data"], wardrobe,
+                                          record["occasion"], encoding=encoding, include_examples=include_examples)
+    recorded_aliases = record.get("aliases", {})
+    answer = json.loads(record["response"])
+    recorded_ids = [recorded_aliases.get(item["id"], item["id"]) for item in answer["outfit_items"]]
+    to_alias = {item_id: alias for alias, item_id in prompt.aliases.items()}
+    for item, item_id in zip(answer["outfit_items"], recorded_ids):
+        item["id"] = to_alias.get(item_id, item_id)
+    validated, retry_messages = outfit.finalize_outfit(json.dumps(answer), prompt)
+    return prompt, recorded_ids, [item["id"] for item in validated.get("outfit_items", [])], retry_messages
+
+
+def bench_prompt_encoding(recorded_file: str = RECORDED_EXCHANGES) -> None:
+    """
+    Token-count comparison of the outfit prompt encodings over recorded exchanges (JSON lines
+    written by OUTFIT_RECORD_PATH; tests/data/outfit_exchanges.jsonl by default). Each recorded
+    answer is also replayed against every encoding's prompt, and the count of answers that
+    validate to exactly the recorded outfit is reported. That checks the aliasing and
+    validation round trip only; whether the model picks the same outfit from a compact prompt
+    needs live requests, which this bench doesn't make.
+    """
+    _configure_stub_env()
+    from api.llm import outfit
+    from api.llm.client import estimate_tokens
+
+    records = load_recorded_exchanges(recorded_file)
+    variants = [("verbose + examples", "verbose", True), ("compact + examples", "compact", True),
+                ("compact, no examples", "compact", False)]
+    totals = {name: [0, 0] for name, _, _ in variants}  # tokens, recorded outfits kept
+
+    for record in records:
+        for name, encoding, examples in variants:
+            prompt, recorded_ids, validated_ids, retry_messages = replay_recorded_outfit(record, encoding, examples)
+            totals[name][0] += estimate_tokens(prompt.combined_prompt)
+            totals[name][1] += validated_ids == recorded_ids and retry_messages is None
+
+    baseline = totals[variants[0][0]][0]
+    static = {examples: estimate_tokens(outfit.prompt_prefix(examples)) for examples in (True, False)}
+    print(f"{len(records)} recorded exchanges ({recorded_file})")
+    print(f"{'encoding':<24}{'tokens/prompt':>15}{'vs verbose':>12}{'cacheable prefix':>18}{'outfit kept':>13}")
+    for name, _, examples in variants:
+        tokens, kept = totals[name]
+        print(f"{name:<24}{tokens / len(records):>15.0f}{tokens / baseline - 1:>12.1%}"
+              f"{static[examples]:>18}{f'{kept}/{len(records)}':>13}")
+
+
+BENCHMARKS = {
+    "wardrobe-load": bench_wardrobe_load,
+    "image-key-replay": bench_image_key_replay,
+    "image-batch": bench_image_batch,
+    "llm-client": bench_llm_client,
+    "occasion-classifier": bench_occasion_classifier,
+    "occasion-matcher": bench_occasion_matcher,
+    "outfit-solver": bench_outfit_solver,
+    "prompt-size": bench_prompt_size,
+    "prompt-encoding": bench_prompt_encoding,
+    "suitability-index": bench_suitability_index,
+    "wardrobe-memory": bench_wardrobe_memory,
+    "metrics-overhead": bench_metrics_overhead,
+    "chat-pipeline": bench_chat_pipeline,
+    "chat-stream": bench_chat_stream,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--rows", help="image-key-replay: JSON export of image_items rows to replay")
+    parser.add_argument("--corpus", help="occasion-classifier: JSON lines of LLM-labelled messages")
+    parser.add_argument("--model", help="occasion-classifier: trained model to evaluate instead of training one")
+    parser.add_argument("--recorded", help="prompt-encoding: JSON lines of recorded outfit exchanges (OUTFIT_RECORD_PATH)")
+    args = parser.parse_args()
+    options = {"rows_file": args.rows, "corpus_file": args.corpus, "model_file": args.model,
+               "recorded_file": args.recorded}
+    options = {name: value for name, value in options.items() if value}
+    BENCHMARKS[args.benchmark](**options)
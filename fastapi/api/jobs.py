@@ -0,0 +1,183 @@
+"""
+In-process background job queue.
+
+Jobs are coroutines run by a fixed pool of asyncio worker tasks, retried with
+exponential backoff and jitter; a job that fails for good can run an
+on_failure hook to leave its data in a usable state. Blocking work inside a job
+should be offloaded with run_in_threadpool. Job state lives in this process only and is kept for
+JOB_TTL seconds after submission, so status lookups must reach the same worker
+that accepted the job.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from api.cache import TTLCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "2"))  # seconds, doubled after each failed attempt
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))  # seconds a job's status is kept
+JOB_MAX_TRACKED = 10000
+
+QUEUED, RUNNING, COMPLETED, FAILED = "queued", "running", "completed", "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    user_id: Optional[str]
+    handler: Callable[["Job"], Awaitable[Any]] = field(repr=False)
+    on_failure: Optional[Callable[["Job", Exception], Awaitable[Any]]] = field(default=None, repr=False)
+    status: str = QUEUED
+    attempts: int = 0
+    error: Optional[str] = None
+    result: Any = None
+    progress: Dict[str, Any] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    version: int = 0
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def _update(self, **changes) -> None:
+        for name, value in changes.items():
+            setattr(self, name, value)
+        self.updated_at = time.time()
+        self.version += 1
+        # Wake everyone waiting for a change, then arm a fresh event for the next one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_change(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the job's state changes; returns False on timeout."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class JobQueue:
+    """
+    Runs submitted jobs on `workers` asyncio tasks. A job's handler receives
+    the Job itself and may record partial progress in `job.progress` so a
+    retry can skip steps that already succeeded.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 retry_delay: float = JOB_RETRY_DELAY, ttl: float = JOB_TTL):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._jobs = TTLCache(max_size=JOB_MAX_TRACKED, ttl=ttl)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+
+    def start(self) -> None:
+        """Start the worker tasks on the running event loop (idempotent)."""
+        if self._tasks and not all(t.done() for t in self._tasks):
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, handler: Callable[[Job], Awaitable[Any]], user_id: str = None,
+                     on_failure: Callable[[Job, Exception], Awaitable[Any]] = None) -> Job:
+        """
+        Queue handler(job) and return the job immediately. on_failure(job, error) is
+        awaited once the last attempt has failed, before the job is marked failed.
+        """
+        self.start()
+        job = Job(id=str(uuid.uuid4()), kind=kind, user_id=user_id, handler=handler, on_failure=on_failure)
+        self._jobs.set(job.id, job)
+        await self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "tracked": len(self._jobs),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"❌ Job worker {number} error: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job._update(status=RUNNING, attempts=job.attempts + 1)
+        try:
+            result = await job.handler(job)
+            job._update(status=COMPLETED, result=result, error=None)
+            self.completed += 1
+        except Exception as e:
+            if job.attempts >= self.max_attempts:
+                logger.error(f"❌ Job {job.kind} {job.id} failed after {job.attempts} attempts: {e}")
+                if job.on_failure is not None:
+                    try:
+                        await job.on_failure(job, e)
+                    except Exception as hook_error:
+                        logger.error(f"❌ Job {job.kind} {job.id} failure hook error: {hook_error}", exc_info=True)
+                job._update(status=FAILED, error=str(e))
+                self.failed += 1
+                return
+            delay = self.retry_delay * 2 ** (job.attempts - 1)
+            delay += random.uniform(0, delay / 2)
+            logger.warning(f"Job {job.kind} {job.id} attempt {job.attempts} failed: {e}; retrying in {delay:.1f}s")
+            job._update(status=QUEUED, error=str(e))
+            self.retries += 1
+            # Requeue after the backoff instead of sleeping, so the worker is free meanwhile
+            asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job)
+
+
+# Create a singleton job queue
+job_queue = JobQueue()
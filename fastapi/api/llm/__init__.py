@@ -1,7 +1,10 @@
 # Import main components for easy access
-from .client import LLMClient, llm_client
-from .config import AIConfig
-from .occasion import determineOccasions
-from .outfit import generateOutfit
-from .item import setOccasion
-from .image import generateImage
\ No newline at end of file
+from .client import LLMClient, LLMTimeout, llm_client
+from .config import AIConfig, ai_config
+from .occasion import adetermineOccasions, determineOccasions
+from .outfit import agenerateOutfit, generateOutfit
+from .item import asetOccasion, asetOccasions, setOccasion, setOccasions
+from .image import generateImage
+
+# Pre-build the pooled chat models for the temperatures the package uses
+llm_client.warm({0.3, *ai_config.get_occasion_temperatures()})
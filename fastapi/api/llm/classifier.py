@@ -0,0 +1,124 @@
+"""
+Naive Bayes occasion model over message words and word pairs.
+
+The model is trained offline from labelled history (JSON lines of
+{"message": ..., "occasion": ...}, typically past LLM answers) and saved as
+JSON next to ai_config.json:
+
+    python -m api.llm.classifier history.jsonl api/llm/config/occasion_model.json
+
+determineOccasions consults it (after the keyword rules) to answer without
+the LLM when it is confident.
+"""
+import json
+import logging
+import math
+import os
+import sys
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from api.llm.occasion_cache import normalize_message
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+OCCASION_MODEL_PATH = os.getenv(
+    "OCCASION_MODEL_PATH", str(Path(__file__).parent / "config" / "occasion_model.json")
+)
+OCCASION_MODEL_THRESHOLD = float(os.getenv("OCCASION_MODEL_THRESHOLD", "0.9"))  # min posterior to skip the LLM
+
+
+def tokenize(message: str) -> List[str]:
+    """Words and adjacent word pairs of the normalized message."""
+    words = normalize_message(message).split()
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def train_occasion_model(examples: Iterable[Tuple[str, str]], alpha: float = 1.0) -> Dict:
+    """Count-based multinomial naive Bayes model from (message, occasion) pairs."""
+    class_counts = Counter()
+    token_counts: Dict[str, Counter] = defaultdict(Counter)
+    for message, occasion in examples:
+        class_counts[occasion] += 1
+        token_counts[occasion].update(tokenize(message))
+    return {
+        "alpha": alpha,
+        "class_counts": dict(class_counts),
+        "token_counts": {occasion: dict(counts) for occasion, counts in token_counts.items()},
+    }
+
+
+class OccasionModel:
+    """Log-probability tables for a trained model, ready for prediction."""
+
+    def __init__(self, model: Dict):
+        alpha = model.get("alpha", 1.0)
+        class_counts = model["class_counts"]
+        token_counts = model["token_counts"]
+        self.vocabulary = set().union(*(counts.keys() for counts in token_counts.values()))
+        total = sum(class_counts.values())
+        self.log_priors = {occ: math.log(n / total) for occ, n in class_counts.items()}
+        self.log_likelihoods: Dict[str, Dict[str, float]] = {}
+        self.log_unseen: Dict[str, float] = {}
+        for occasion, counts in token_counts.items():
+            denominator = sum(counts.values()) + alpha * len(self.vocabulary)
+            self.log_likelihoods[occasion] = {
+                token: math.log((n + alpha) / denominator) for token, n in counts.items()
+            }
+            self.log_unseen[occasion] = math.log(alpha / denominator)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["OccasionModel"]:
+        """Load a saved model; returns None if the file is missing or unreadable."""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                model = cls(json.load(f))
+            logger.info(f"Occasion model loaded from {path} ({len(model.log_priors)} occasions)")
+            return model
+        except Exception as e:
+            logger.error(f"Failed to load occasion model from {path}: {e}")
+            return None
+
+    def predict(self, message: str, candidates: Optional[Iterable[str]] = None) -> Optional[Tuple[str, float]]:
+        """
+        Most likely occasion and its posterior probability, restricted to
+        `candidates` if given. Returns None when no word of the message was
+        seen in training, since the answer would only reflect the priors.
+        """
+        tokens = [t for t in tokenize(message) if t in self.vocabulary]
+        if not tokens:
+            return None
+        occasions = [occ for occ in (candidates or self.log_priors) if occ in self.log_priors]
+        if not occasions:
+            return None
+        scores = {}
+        for occ in occasions:
+            likelihoods, unseen = self.log_likelihoods.get(occ, {}), self.log_unseen.get(occ, 0.0)
+            scores[occ] = self.log_priors[occ] + sum(likelihoods.get(t, unseen) for t in tokens)
+        best = max(scores, key=scores.get)
+        # Posterior of the best class via log-sum-exp
+        total = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / total
+
+
+# Load the model once; None when no model file has been trained yet
+occasion_model = OccasionModel.load(OCCASION_MODEL_PATH)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m api.llm.classifier <history.jsonl> <model.json>")
+    with open(sys.argv[1]) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    trained = train_occasion_model((row["message"], row["occasion"]) for row in rows)
+    with open(sys.argv[2], "w") as f:
+        json.dump(trained, f)
+    print(f"Trained on {len(rows)} messages, {len(trained['class_counts'])} occasions -> {sys.argv[2]}")
@@ -1,10 +1,19 @@
+import asyncio
+import math
 import os
 import logging
-from typing import List, Union
+import re
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+import httpx
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 
+from api import metrics
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -15,38 +24,248 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
     raise EnvironmentError("OPENAI_API_KEY environment variable not set")
 
+# Configuration
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_TEMPERATURE = 0.5
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # seconds
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # in-flight async LLM calls per process
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "30"))  # seconds, default deadline for one async call
+
+
+class LLMTimeout(TimeoutError):
+    """Raised when an async LLM call (including time spent queued) misses its deadline."""
+
+
+def deadline_after(seconds: float) -> float:
+    """Absolute deadline, for spreading one time budget over several LLM calls."""
+    return time.monotonic() + seconds
+
+
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate GPT token count without a tokenizer download: words count one token
+    per 4 letters, digit runs one per 3 digits (as cl100k/o200k split them) and each
+    punctuation mark one token.
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        if piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif piece[0].isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        else:
+            tokens += 1
+    return tokens
+
 
 class LLMClient:
-    """Interface for language model interactions"""
+    """
+    Interface for language model interactions.
+
+    Generation parameters are passed per call. Chat models are built once per
+    (model, temperature) and reused, and all of them share one keep-alive HTTP
+    connection pool, so concurrent requests never change each other's settings.
+
+    `ainvoke` is the non-blocking path: at most LLM_MAX_CONCURRENCY calls are
+    in flight per event loop, and each call must finish (queueing included)
+    before its timeout or absolute deadline. `astream` does the same but yields
+    the response text as it arrives.
+    """
     
-    def __init__(self, api_key: str = None, model_name: str = "gpt-4o-mini"):
+    def __init__(self, api_key: str = None, model_name: str = DEFAULT_MODEL,
+                 temperature: float = DEFAULT_TEMPERATURE):
         """Initialize LLM client with appropriate configuration"""
         self.api_key = api_key or openai_api_key
         self.model_name = model_name
-        self.llm = self._create_llm(temperature=0.5)
+        self.temperature = temperature
+        self.max_concurrency = LLM_MAX_CONCURRENCY
+        self._limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        )
+        self._http_client = httpx.Client(limits=self._limits, timeout=LLM_TIMEOUT)
+        self._http_async_client: Optional[httpx.AsyncClient] = None  # created with the first pooled model
+        self._pool: Dict[Tuple[str, float], ChatOpenAI] = {}
+        self._pool_lock = threading.Lock()
+        self._semaphores = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+        self.in_flight = 0
+        self.timeouts = 0
+        self.get_llm()
+    
+    @property
+    def llm(self) -> ChatOpenAI:
+        """Pooled chat model for the default settings"""
+        return self.get_llm()
     
-    def _create_llm(self, temperature: float) -> ChatOpenAI:
-        """Create a new LLM instance with the given temperature"""
+    def _create_llm(self, model_name: str, temperature: float) -> ChatOpenAI:
+        """Create a new LLM instance on the shared HTTP connection pool (called under _pool_lock)"""
+        if self._http_async_client is None:
+            self._http_async_client = httpx.AsyncClient(limits=self._limits, timeout=LLM_TIMEOUT)
         return ChatOpenAI(
             openai_api_key=self.api_key,
             temperature=temperature,
             top_p=1,
-            model_name=self.model_name
+            model_name=model_name,
+            http_client=self._http_client,
+            http_async_client=self._http_async_client
         )
     
+    def get_llm(self, temperature: Optional[float] = None, model_name: Optional[str] = None) -> ChatOpenAI:
+        """Return the pooled chat model for these settings, building it on first use"""
+        key = (model_name or self.model_name, self.temperature if temperature is None else float(temperature))
+        llm = self._pool.get(key)
+        if llm is None:
+            with self._pool_lock:
+                llm = self._pool.get(key)
+                if llm is None:
+                    llm = self._pool[key] = self._create_llm(*key)
+        return llm
+    
+    def warm(self, temperatures) -> None:
+        """Pre-build chat models for the given temperatures"""
+        for temperature in temperatures:
+            self.get_llm(temperature)
+    
     def with_temperature(self, temperature: float) -> None:
-        """Update the LLM with a new temperature setting"""
-        self.llm = self._create_llm(temperature)
+        """
+        Deprecated: changes the default temperature for every caller. Pass `temperature` to
+        `invoke` instead.
+        """
+        self.temperature = temperature
     
-    def invoke(self, messages: List[Union[SystemMessage, HumanMessage]]) -> str:
+    def invoke(self, messages: List[Union[SystemMessage, HumanMessage]],
+               temperature: Optional[float] = None, model_name: Optional[str] = None) -> str:
         """Send a request to the language model and return the response"""
         try:
-            response = self.llm.invoke(messages)
+            response = self.get_llm(temperature, model_name).invoke(messages)
+            self._record_usage(messages, response)
+            return response.content.strip()
+        except Exception as e:
+            logger.error("Error invoking LLM: %s", e)
+            raise
+    
+    async def ainvoke(self, messages: List[Union[SystemMessage, HumanMessage]],
+                      temperature: Optional[float] = None, model_name: Optional[str] = None,
+                      timeout: Optional[float] = None, deadline: Optional[float] = None) -> str:
+        """
+        Async version of invoke. Waits for a free slot under the concurrency cap and raises
+        LLMTimeout if the call hasn't completed within `timeout` seconds (default LLM_CALL_TIMEOUT)
+        or by `deadline` (a time.monotonic() value, see deadline_after), whichever is sooner.
+        Cancelling the awaiting task cancels the HTTP request.
+        """
+        budget = LLM_CALL_TIMEOUT if timeout is None else timeout
+        if deadline is not None:
+            budget = min(budget, deadline - time.monotonic())
+        llm = self.get_llm(temperature, model_name)
+        try:
+            async with asyncio.timeout(max(budget, 0)):
+                async with self._semaphore():
+                    self.in_flight += 1
+                    try:
+                        response = await llm.ainvoke(messages)
+                    finally:
+                        self.in_flight -= 1
+            self._record_usage(messages, response)
             return response.content.strip()
+        except TimeoutError as e:
+            self.timeouts += 1
+            logger.error("LLM call exceeded its %.1fs deadline", budget)
+            raise LLMTimeout(f"LLM call exceeded its {budget:.1f}s deadline") from e
         except Exception as e:
             logger.error("Error invoking LLM: %s", e)
             raise
+    
+    async def astream(self, messages: List[Union[SystemMessage, HumanMessage]],
+                      temperature: Optional[float] = None, model_name: Optional[str] = None,
+                      timeout: Optional[float] = None, deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Streaming version of ainvoke: yields the response text chunk by chunk. The call
+        holds its concurrency slot until the stream ends, and the whole stream (queueing
+        included) must finish within the same timeout/deadline, else LLMTimeout is raised.
+        Closing the iterator early closes the HTTP response.
+        """
+        budget = LLM_CALL_TIMEOUT if timeout is None else timeout
+        if deadline is not None:
+            budget = min(budget, deadline - time.monotonic())
+        llm = self.get_llm(temperature, model_name)
+        # Only the awaits are bounded, not the time the caller spends between chunks
+        expires = asyncio.get_running_loop().time() + max(budget, 0)
+        semaphore = self._semaphore()
+        response = None
+        try:
+            async with asyncio.timeout_at(expires):
+                await semaphore.acquire()
+            self.in_flight += 1
+            stream = llm.astream(messages)
+            try:
+                while True:
+                    try:
+                        async with asyncio.timeout_at(expires):
+                            chunk = await anext(stream)
+                    except StopAsyncIteration:
+                        break
+                    response = chunk if response is None else response + chunk
+                    if chunk.content:
+                        yield chunk.content
+            finally:
+                self.in_flight -= 1
+                semaphore.release()
+                await stream.aclose()
+            if response is not None:
+                self._record_usage(messages, response)
+        except TimeoutError as e:
+            self.timeouts += 1
+            logger.error("LLM stream exceeded its %.1fs deadline", budget)
+            raise LLMTimeout(f"LLM call exceeded its {budget:.1f}s deadline") from e
+        except Exception as e:
+            logger.error("Error streaming from LLM: %s", e)
+            raise
+    
+    def _record_usage(self, messages, response) -> None:
+        """Token counts from the provider's usage report, estimated when the response has none."""
+        if not metrics.METRICS_ENABLED:
+            return
+        usage = getattr(response, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+        completion_tokens = usage.get("output_tokens")
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(str(response.content))
+        metrics.observe_tokens(prompt_tokens, completion_tokens)
+        metrics.count("llm_call")
+    
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+    
+    async def aclose(self) -> None:
+        """
+        Close the async connection pool (bound to the current event loop). The next call builds
+        its chat model again, on a new pool.
+        """
+        with self._pool_lock:
+            old, self._http_async_client = self._http_async_client, None
+            self._pool.clear()
+        if old is not None:
+            await old.aclose()
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pooled_models": len(self._pool),
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "timeouts": self.timeouts,
+        }
 
 
 # Create a singleton LLM client
-llm_client = LLMClient()
\ No newline at end of file
+llm_client = LLMClient()
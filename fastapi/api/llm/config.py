@@ -1,5 +1,8 @@
+import hashlib
 import json
 import logging
+import os
+import time
 from typing import Dict, List, Any
 from pathlib import Path
 
@@ -7,11 +10,23 @@ from pathlib import Path
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+CONFIG_PATH = Path(__file__).parent / 'config' / 'ai_config.json'
+CONFIG_CHECK_INTERVAL = float(os.getenv("AI_CONFIG_CHECK_INTERVAL", "5"))  # seconds between file change checks
+
 
 class AIConfig:
-    """Configuration management class with JSON file loading"""
+    """
+    Configuration management class with JSON file loading.
+
+    `fingerprint` is a hash of the loaded file's contents and `version` counts
+    reloads, so caches derived from the config can tell when it changed.
+    """
     _instance = None
     _config = None
+    fingerprint = "default"
+    version = 0
+    _mtime = None
+    _checked_at = 0.0
     
     @classmethod
     def get_instance(cls):
@@ -24,12 +39,17 @@ class AIConfig:
     def _load_config(self):
         """Load configuration from JSON file"""
         # Path to the config file, relative to this script
-        config_path = Path(__file__).parent / 'config' / 'ai_config.json'
+        config_path = CONFIG_PATH
+        self.version += 1
+        self._checked_at = time.monotonic()
         try:
-            with open(config_path, 'r') as f:
-                self._config = json.load(f)
-                logger.info(f"AI config loaded successfully from {config_path}")
+            self._mtime = config_path.stat().st_mtime
+            raw = config_path.read_bytes()
+            self._config = json.loads(raw)
+            self.fingerprint = hashlib.sha256(raw).hexdigest()[:16]
+            logger.info(f"AI config loaded successfully from {config_path}")
         except Exception as e:
+            self.fingerprint = "default"
             logger.error(f"Failed to load config from {config_path}: {e}")
             # Provide a minimal default config in case file loading fails
             self._config = {
@@ -53,6 +73,32 @@ class AIConfig:
         """Get temperature setting for a specific occasion"""
         temp_map = self._config.get("occasion_temperature", {})
         return temp_map.get(occasion, 0.5)
+    
+    def get_occasion_temperatures(self) -> List[float]:
+        """Get every distinct temperature used for outfit generation"""
+        return sorted(set(self._config.get("occasion_temperature", {}).values()) | {0.5})
+    
+    def reload(self) -> None:
+        """Re-read the config file"""
+        self._load_config()
+    
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the config if the file was modified, checking at most once per
+        CONFIG_CHECK_INTERVAL seconds. Returns True if it was reloaded.
+        """
+        if time.monotonic() - self._checked_at < CONFIG_CHECK_INTERVAL:
+            return False
+        self._checked_at = time.monotonic()
+        try:
+            mtime = CONFIG_PATH.stat().st_mtime
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        previous = self.fingerprint
+        self._load_config()
+        return self.fingerprint != previous
 
 
 # Initialize the config
@@ -1,10 +1,16 @@
+import asyncio
 import os
 import logging
+import random
+import threading
+import weakref
+import httpx
 import requests
 import time
-from typing import Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterable, NamedTuple, Optional, Dict, Any
 from dotenv import load_dotenv
-from openai import OpenAI, APIError, RateLimitError
+from openai import OpenAI, AsyncOpenAI, APIError, RateLimitError, DefaultHttpxClient, DefaultAsyncHttpxClient
 
 from api.models import ClothingItem
 
@@ -24,6 +30,91 @@ RETRY_DELAY = 2  # seconds
 REQUEST_TIMEOUT = 30  # seconds
 DEFAULT_IMAGE_SIZE = "1024x1024"
 DEFAULT_IMAGE_QUALITY = "hd"
+# Batch generation limits; match these to the account's DALL·E 3 images-per-minute tier
+IMAGE_BATCH_CONCURRENCY = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "5"))
+IMAGE_RATE_LIMIT_PER_MINUTE = float(os.getenv("IMAGE_RATE_LIMIT_PER_MINUTE", "7"))
+IMAGE_HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+
+# Shared clients: one connection pool for every generation in the process. Retries are done here
+# (with backoff that knows about rate limits), so the SDK's own retries are disabled.
+_client = OpenAI(
+    api_key=openai_api_key,
+    max_retries=0,
+    timeout=REQUEST_TIMEOUT * 4,
+    http_client=DefaultHttpxClient(limits=IMAGE_HTTP_LIMITS),
+)
+_download_session = requests.Session()
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> (AsyncOpenAI, httpx.AsyncClient)
+_async_clients_lock = threading.Lock()
+
+
+def _get_async_clients():
+    """
+    Shared async OpenAI client and download client for the running event loop (httpx async pools
+    can't be shared across loops). Both use the same connection pool.
+    """
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = _async_clients.get(loop)
+        if clients is None:
+            http_client = DefaultAsyncHttpxClient(limits=IMAGE_HTTP_LIMITS)
+            openai_client = AsyncOpenAI(
+                api_key=openai_api_key,
+                max_retries=0,
+                timeout=REQUEST_TIMEOUT * 4,
+                http_client=http_client,
+            )
+            clients = _async_clients[loop] = (openai_client, http_client)
+        return clients
+
+
+async def aclose_async_clients() -> None:
+    """Close the running event loop's async clients (on shutdown, or before a private loop ends)."""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = _async_clients.pop(loop, None)
+    if clients is not None:
+        openai_client, http_client = clients
+        await openai_client.close()
+        await http_client.aclose()
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with jitter, so retries from a batch don't fire in lockstep."""
+    return RETRY_DELAY * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
+
+class TokenBucket:
+    """
+    Async token-bucket rate limiter: allows bursts of up to `capacity` calls,
+    refilling at `rate_per_minute`.
+    """
+
+    def __init__(self, rate_per_minute: float = IMAGE_RATE_LIMIT_PER_MINUTE, capacity: float = 1.0):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ImageResult(NamedTuple):
+    """Outcome of one item in a batch; `image` is None when generation failed."""
+    index: int
+    item: Any
+    image: Optional[bytes]
+    error: Optional[str] = None
 
 
 # For backward compatibility
@@ -60,35 +151,15 @@ def generate_image(
     Returns:
         Raw image data as bytes
     """
-    # Build a detailed prompt that avoids logo generation and focuses on quality
-    base_description = f"{item.color} {item.material} {item.sub_type}"
-    if item.pattern and item.pattern.lower() != "none" and item.pattern.lower() != "solid":
-        base_description += f" with a {item.pattern} pattern"
-    
-    prompt = (
-        f"Create a minimalist emoji-style illustration of a {base_description}. "
-        f"The illustration should be simple, glossy, and vector-like, centered on a {background} background. "
-        f"The clothing item should be well-lit with subtle shadows to define its shape. "
-        f"Use clean lines and vibrant, solid colors in a modern emoji aesthetic. "
-        f"IMPORTANT: "
-        f"- Do not include any logos, text, watermarks, decorations, or brand identifiers of any kind. "
-        f"- The image should only show the clothing item itself with absolutely no Apple logo or any other symbol. "
-        f"- Do not add any human figures, mannequins, or additional objects. "
-        f"- Create a straight-on view of the item as if photographed for a product catalog, unless it is a piece of footware. "
-        f"- If it is a piece of footware crate the image at a slight angle. . "
-        f"- The style should be highly simplified, appropriate for small emoji display. "
-    )
+    base_description, prompt = _build_prompt(item, background)
     
     logger.info(f"Generating image for {base_description}")
     
-    # Initialize the OpenAI client
-    client = OpenAI(api_key=openai_api_key)
-    
     # Implement retry logic for resilience
     for attempt in range(1, MAX_RETRIES + 1):
         try:
             # Call DALL·E 3 via OpenAI's API with configurable parameters
-            response = client.images.generate(
+            response = _client.images.generate(
                 model="dall-e-3",
                 prompt=prompt,
                 n=1,
@@ -106,7 +177,7 @@ def generate_image(
             image_url = response.data[0].url
             
             # Download the image data from the URL with timeout
-            r = requests.get(image_url, timeout=REQUEST_TIMEOUT)
+            r = _download_session.get(image_url, timeout=REQUEST_TIMEOUT)
             r.raise_for_status()
             
             logger.info(f"Successfully generated image for {base_description}")
@@ -114,8 +185,8 @@ def generate_image(
             
         except RateLimitError as e:
             if attempt < MAX_RETRIES:
-                wait_time = RETRY_DELAY * (2 ** (attempt - 1))  # Exponential backoff
-                logger.warning(f"Rate limit exceeded. Retrying in {wait_time} seconds...")
+                wait_time = _backoff(attempt)
+                logger.warning(f"Rate limit exceeded. Retrying in {wait_time:.1f} seconds...")
                 time.sleep(wait_time)
             else:
                 logger.error("Rate limit exceeded after multiple retries")
@@ -126,10 +197,10 @@ def generate_image(
             if "content_policy_violation" in str(e).lower():
                 # Content policy issues - try modifying the prompt
                 logger.warning("Content policy violation. Using alternative prompt approach.")
-                return _generate_with_alternative_prompt(client, item, size, quality, style, background)
+                return _generate_with_alternative_prompt(_client, item, size, quality, style, background)
             elif attempt < MAX_RETRIES:
-                wait_time = RETRY_DELAY * (2 ** (attempt - 1))
-                logger.warning(f"API error. Retrying in {wait_time} seconds...")
+                wait_time = _backoff(attempt)
+                logger.warning(f"API error. Retrying in {wait_time:.1f} seconds...")
                 time.sleep(wait_time)
             else:
                 raise Exception(f"Failed to generate image via DALL·E 3: {str(e)}") from e
@@ -137,8 +208,8 @@ def generate_image(
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to download the generated image: {str(e)}")
             if attempt < MAX_RETRIES:
-                wait_time = RETRY_DELAY * (2 ** (attempt - 1))
-                logger.warning(f"Download error. Retrying in {wait_time} seconds...")
+                wait_time = _backoff(attempt)
+                logger.warning(f"Download error. Retrying in {wait_time:.1f} seconds...")
                 time.sleep(wait_time)
             else:
                 raise Exception(f"Failed to download the generated image after {MAX_RETRIES} attempts") from e
@@ -148,6 +219,42 @@ def generate_image(
             raise Exception(f"Failed to generate image: {str(e)}") from e
 
 
+def _build_prompt(item: ClothingItem, background: str):
+    """Returns (base_description, prompt) for the emoji-style illustration of an item."""
+    # Build a detailed prompt that avoids logo generation and focuses on quality
+    base_description = f"{item.color} {item.material} {item.sub_type}"
+    if item.pattern and item.pattern.lower() != "none" and item.pattern.lower() != "solid":
+        base_description += f" with a {item.pattern} pattern"
+    
+    prompt = (
+        f"Create a minimalist emoji-style illustration of a {base_description}. "
+        f"The illustration should be simple, glossy, and vector-like, centered on a {background} background. "
+        f"The clothing item should be well-lit with subtle shadows to define its shape. "
+        f"Use clean lines and vibrant, solid colors in a modern emoji aesthetic. "
+        f"IMPORTANT: "
+        f"- Do not include any logos, text, watermarks, decorations, or brand identifiers of any kind. "
+        f"- The image should only show the clothing item itself with absolutely no Apple logo or any other symbol. "
+        f"- Do not add any human figures, mannequins, or additional objects. "
+        f"- Create a straight-on view of the item as if photographed for a product catalog, unless it is a piece of footware. "
+        f"- If it is a piece of footware crate the image at a slight angle. . "
+        f"- The style should be highly simplified, appropriate for small emoji display. "
+    )
+    return base_description, prompt
+
+
+def _alternative_prompt(item: ClothingItem, background: str) -> str:
+    """
+    A more generic description that focuses on shapes and colors rather than specific clothing
+    terminology that might trigger content filters.
+    """
+    return (
+        f"Create a simple, minimalist vector illustration showing the shape of a {item.color} "
+        f"{item.sub_type} on a {background} background. Use flat colors with minimal details, "
+        f"in a clean clipart style. No text, no logos, no patterns, just the basic silhouette "
+        f"with solid color fill. The image should be extremely simple like an app icon."
+    )
+
+
 def _generate_with_alternative_prompt(
     client: OpenAI,
     item: ClothingItem,
@@ -163,16 +270,9 @@ def _generate_with_alternative_prompt(
     rather than specific clothing terminology that might trigger content filters.
     """
     try:
-        alternative_prompt = (
-            f"Create a simple, minimalist vector illustration showing the shape of a {item.color} "
-            f"{item.sub_type} on a {background} background. Use flat colors with minimal details, "
-            f"in a clean clipart style. No text, no logos, no patterns, just the basic silhouette "
-            f"with solid color fill. The image should be extremely simple like an app icon."
-        )
-        
         response = client.images.generate(
             model="dall-e-3",
-            prompt=alternative_prompt,
+            prompt=_alternative_prompt(item, background),
             n=1,
             size=size,
             quality=quality,
@@ -181,7 +281,7 @@ def _generate_with_alternative_prompt(
         )
         
         image_url = response.data[0].url
-        r = requests.get(image_url, timeout=REQUEST_TIMEOUT)
+        r = _download_session.get(image_url, timeout=REQUEST_TIMEOUT)
         r.raise_for_status()
         
         logger.info(f"Successfully generated image using alternative prompt")
@@ -191,24 +291,135 @@ def _generate_with_alternative_prompt(
         raise Exception("Failed to generate image with alternative prompt") from e
 
 
-def batch_generate_images(items: list[ClothingItem], **kwargs) -> Dict[str, Optional[bytes]]:
+async def agenerate_image(
+    item: ClothingItem,
+    limiter: Optional[TokenBucket] = None,
+    size: str = DEFAULT_IMAGE_SIZE,
+    quality: str = DEFAULT_IMAGE_QUALITY,
+    style: str = "natural",
+    background: str = "pure white"
+) -> bytes:
+    """
+    Async version of generate_image on the shared async client. Each attempt first takes a token
+    from `limiter`, and retries back off with jitter without blocking the event loop.
     """
-    Generate images for multiple clothing items with error handling.
+    client, http_client = _get_async_clients()
+    base_description, prompt = _build_prompt(item, background)
+    used_alternative = False
+    
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            if limiter:
+                await limiter.acquire()
+            response = await client.images.generate(
+                model="dall-e-3",
+                prompt=prompt,
+                n=1,
+                size=size,
+                quality=quality,
+                response_format="url",
+                style=style
+            )
+            r = await http_client.get(response.data[0].url, timeout=REQUEST_TIMEOUT)
+            r.raise_for_status()
+            logger.info(f"Successfully generated image for {base_description}")
+            return r.content
+        
+        except APIError as e:
+            if "content_policy_violation" in str(e).lower() and not used_alternative:
+                logger.warning("Content policy violation. Using alternative prompt approach.")
+                prompt, used_alternative = _alternative_prompt(item, background), True
+            elif attempt >= MAX_RETRIES:
+                raise Exception(f"Failed to generate image via DALL·E 3: {str(e)}") from e
+            else:
+                wait_time = _backoff(attempt)
+                logger.warning(f"{type(e).__name__} for {base_description}. Retrying in {wait_time:.1f} seconds...")
+                await asyncio.sleep(wait_time)
+        
+        except httpx.HTTPError as e:
+            if attempt >= MAX_RETRIES:
+                raise Exception(f"Failed to download the generated image after {MAX_RETRIES} attempts") from e
+            wait_time = _backoff(attempt)
+            logger.warning(f"Download error for {base_description}. Retrying in {wait_time:.1f} seconds...")
+            await asyncio.sleep(wait_time)
+    
+    raise Exception(f"Failed to generate image for {base_description}")
+
+
+async def generate_images(
+    items: Iterable[ClothingItem],
+    concurrency: int = IMAGE_BATCH_CONCURRENCY,
+    rate_per_minute: float = IMAGE_RATE_LIMIT_PER_MINUTE,
+    **kwargs
+) -> AsyncIterator[ImageResult]:
+    """
+    Generates images for many items concurrently, yielding an ImageResult as each one finishes.
+    
+    At most `concurrency` generations are in flight and calls are rate limited to
+    `rate_per_minute`. A failed item yields a result with image=None instead of stopping the batch.
+    Closing the iterator early cancels the remaining generations.
+    
+    Args:
+        items: Clothing items to generate images for
+        concurrency: Maximum simultaneous generations
+        rate_per_minute: Image API calls allowed per minute
+        **kwargs: Additional parameters to pass to agenerate_image
+    """
+    items = list(items)
+    limiter = TokenBucket(rate_per_minute, capacity=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run(index: int, item: ClothingItem) -> ImageResult:
+        async with semaphore:
+            try:
+                return ImageResult(index, item, await agenerate_image(item, limiter, **kwargs))
+            except Exception as e:
+                logger.error(f"Failed to generate image for item {index}: {e}")
+                return ImageResult(index, item, None, str(e))
+    
+    tasks = [asyncio.create_task(run(i, item)) for i, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def abatch_generate_images(items: list[ClothingItem], **kwargs) -> Dict[str, Optional[bytes]]:
+    """
+    Generate images for multiple clothing items with error handling, collected into one dict.
     
     Args:
         items: List of clothing items to generate images for
-        **kwargs: Additional parameters to pass to generate_image
+        **kwargs: Additional parameters to pass to generate_images
         
     Returns:
-        Dictionary mapping item IDs to image data (or None if generation failed)
+        Dictionary mapping item IDs (or list positions for items without one) to image data
+        (or None if generation failed)
     """
     results = {}
-    
-    for item in items:
+    async for result in generate_images(items, **kwargs):
+        results[getattr(result.item, "id", None) or str(result.index)] = result.image
+    return results
+
+
+def batch_generate_images(items: list[ClothingItem], **kwargs) -> Dict[str, Optional[bytes]]:
+    """
+    Synchronous version of abatch_generate_images, for scripts. It runs on a private event
+    loop whose clients are closed before returning; called from a thread that already runs
+    a loop, that private loop gets its own thread (async callers should await
+    abatch_generate_images instead of blocking their loop here).
+    """
+    async def collect():
         try:
-            results[item.id] = generate_image(item, **kwargs)
-        except Exception as e:
-            logger.error(f"Failed to generate image for item {item.id}: {e}")
-            results[item.id] = None
+            return await abatch_generate_images(items, **kwargs)
+        finally:
+            await aclose_async_clients()
     
-    return results
\ No newline at end of file
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(collect())
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, collect()).result()
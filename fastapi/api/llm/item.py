@@ -1,8 +1,12 @@
+import asyncio
 import json
 import logging
+import os
 from langchain_core.messages import SystemMessage
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
+from api.attributes import attribute_key
+from api.cache import TTLCache
 from api.models import ClothingItem
 from api.llm.client import llm_client
 from api.llm.config import ai_config
@@ -11,19 +15,32 @@ from api.llm.config import ai_config
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Configuration
+ITEM_OCCASION_CACHE_SIZE = int(os.getenv("ITEM_OCCASION_CACHE_SIZE", "20000"))
+ITEM_OCCASION_CACHE_TTL = float(os.getenv("ITEM_OCCASION_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+ITEM_OCCASION_BATCH_SIZE = int(os.getenv("ITEM_OCCASION_BATCH_SIZE", "20"))  # items per LLM call in setOccasions
 
-def setOccasion(item: ClothingItem) -> ClothingItem:
-    """
-    Updates the clothing item with one or more suitable occasion tags.
-    
-    Args:
-        item: The clothing item to analyze
-        
-    Returns:
-        The updated clothing item with suitable occasions
-    """
-    allowed_occasions = ai_config.get_allowed_occasions()
-    prompt = (
+# The attributes the occasion prompt is built from; items equal on all of them get the same answer
+OCCASION_ATTRIBUTES = (
+    "item_type", "material", "color", "formality", "pattern", "fit", "suitable_for_weather", "sub_type"
+)
+
+# Occasion lists by (config fingerprint, canonical attributes), shared across users
+item_occasion_cache = TTLCache(max_size=ITEM_OCCASION_CACHE_SIZE, ttl=ITEM_OCCASION_CACHE_TTL)
+
+
+def occasion_key(item: ClothingItem) -> Tuple[str, str]:
+    return ai_config.fingerprint, attribute_key(item, OCCASION_ATTRIBUTES)
+
+
+def apply_occasions(item: ClothingItem, occasions: List[str]) -> ClothingItem:
+    item.suitable_for_occasion = ", ".join(occasions)
+    return item
+
+
+def build_occasion_prompt(item: ClothingItem, allowed_occasions: List[str]) -> str:
+    """Builds the prompt asking which of the allowed occasions suit the item."""
+    return (
         f"Given a clothing item with the following details:\n"
         f"Item type: {item.item_type}\n"
         f"Material: {item.material}\n"
@@ -38,24 +55,191 @@ def setOccasion(item: ClothingItem) -> ClothingItem:
         "Return your answer as a JSON object with a single key \"occasions\" that maps to a list of occasion strings. "
         "Do not output any extra text."
     )
+
+
+def parse_occasions(generated: str, allowed_occasions: List[str]) -> List[str]:
+    """Parses the LLM's JSON answer, keeping only allowed occasions."""
+    parsed = json.loads(generated)
+    occasions = parsed.get("occasions", [])
+    return [opt for opt in occasions if opt in allowed_occasions]
+
+
+def build_batch_occasion_prompt(items: List[ClothingItem], allowed_occasions: List[str]) -> str:
+    """Builds one prompt asking for the suitable occasions of every item, keyed by index."""
+    lines = [
+        f"{i}. Item type: {item.item_type}; Material: {item.material}; Color: {item.color}; "
+        f"Formality: {item.formality}; Pattern: {item.pattern}; Fit: {item.fit}; "
+        f"Suitable for weather: {item.suitable_for_weather}; Sub-type: {item.sub_type}"
+        for i, item in enumerate(items)
+    ]
+    return (
+        "For each numbered clothing item below, decide which occasion(s) it is most suitable for. "
+        "Choose one or more from the following list:\n"
+        f"{', '.join(allowed_occasions)}\n\n"
+        + "\n".join(lines) + "\n\n"
+        "Return your answer as a JSON object mapping each item number (as a string) to a list of "
+        "occasion strings, e.g. {\"0\": [\"work\"], \"1\": [\"gym\", \"casual outing\"]}. "
+        "Do not output any extra text."
+    )
+
+
+def parse_batch_occasions(generated: str, count: int, allowed_occasions: List[str]) -> Dict[int, List[str]]:
+    """Parses the batch answer into {index: allowed occasions}; indices the LLM skipped are left out."""
+    parsed = json.loads(generated)
+    result = {}
+    for i in range(count):
+        occasions = parsed.get(str(i))
+        if isinstance(occasions, list):
+            result[i] = [opt for opt in occasions if opt in allowed_occasions] or ["all occasions"]
+    return result
+
+
+def plan_occasion_batches(items: List[ClothingItem], batch_size: int) -> List[List[Tuple[Tuple[str, str], List[ClothingItem]]]]:
+    """
+    Fills in cached occasions and groups the remaining items by attribute key, so
+    each distinct item is asked about once. Returns batches of (key, items) groups.
+    """
+    groups: Dict[Tuple[str, str], List[ClothingItem]] = {}
+    for item in items:
+        key = occasion_key(item)
+        cached = item_occasion_cache.get(key)
+        if cached is not None:
+            apply_occasions(item, cached)
+        else:
+            groups.setdefault(key, []).append(item)
+    pending = list(groups.items())
+    return [pending[i:i + batch_size] for i in range(0, len(pending), max(1, batch_size))]
+
+
+def apply_batch_answer(batch, answers: Dict[int, List[str]]) -> List[ClothingItem]:
+    """Stores and applies the batch answers; returns one item per group the LLM skipped."""
+    missing = []
+    for i, (key, group) in enumerate(batch):
+        if i not in answers:
+            missing.append(group[0])
+            continue
+        item_occasion_cache.set(key, answers[i])
+        for item in group:
+            apply_occasions(item, answers[i])
+    return missing
+
+
+def copy_occasions(batch) -> None:
+    """Copies each group's first item's occasions to the rest of the group."""
+    for _, group in batch:
+        for item in group[1:]:
+            item.suitable_for_occasion = group[0].suitable_for_occasion
+
+
+def setOccasion(item: ClothingItem) -> ClothingItem:
+    """
+    Updates the clothing item with one or more suitable occasion tags.
+    
+    Args:
+        item: The clothing item to analyze
+        
+    Returns:
+        The updated clothing item with suitable occasions
+    """
+    key = occasion_key(item)
+    cached = item_occasion_cache.get(key)
+    if cached is not None:
+        return apply_occasions(item, cached)
     
-    # Use a moderate temperature for sensible but somewhat diverse occasion matching
-    llm_client.with_temperature(0.3)
-    messages = [SystemMessage(content=prompt)]
+    allowed_occasions = ai_config.get_allowed_occasions()
+    messages = [SystemMessage(content=build_occasion_prompt(item, allowed_occasions))]
     
     try:
-        generated = llm_client.invoke(messages)
+        # Use a moderate temperature for sensible but somewhat diverse occasion matching
+        generated = llm_client.invoke(messages, temperature=0.3)
         logger.info("setOccasion LLM response: %s", generated)
-        
-        parsed = json.loads(generated)
-        occasions = parsed.get("occasions", [])
-        valid_occasions = [opt for opt in occasions if opt in allowed_occasions]
+        valid_occasions = parse_occasions(generated, allowed_occasions)
         
         if not valid_occasions:
             valid_occasions = ["all occasions"]
+        item_occasion_cache.set(key, valid_occasions)
+    except Exception as e:
+        logger.error("Error in setOccasion: %s", e)
+        valid_occasions = ["all occasions"]
+    
+    return apply_occasions(item, valid_occasions)
+
+
+async def asetOccasion(item: ClothingItem, deadline: Optional[float] = None, strict: bool = False) -> ClothingItem:
+    """
+    Async version of setOccasion; falls back to "all occasions" on errors or a missed deadline.
+    With strict=True, LLM and parsing errors are raised instead, so a caller that can
+    retry (the enrichment job) doesn't store the fallback as if it were an answer.
+    """
+    key = occasion_key(item)
+    cached = item_occasion_cache.get(key)
+    if cached is not None:
+        return apply_occasions(item, cached)
+    
+    allowed_occasions = ai_config.get_allowed_occasions()
+    messages = [SystemMessage(content=build_occasion_prompt(item, allowed_occasions))]
+    
+    try:
+        generated = await llm_client.ainvoke(messages, temperature=0.3, deadline=deadline)
+        logger.info("setOccasion LLM response: %s", generated)
+        valid_occasions = parse_occasions(generated, allowed_occasions) or ["all occasions"]
+        item_occasion_cache.set(key, valid_occasions)
     except Exception as e:
+        if strict:
+            raise
         logger.error("Error in setOccasion: %s", e)
         valid_occasions = ["all occasions"]
     
-    item.suitable_for_occasion = ", ".join(valid_occasions)
-    return item
\ No newline at end of file
+    return apply_occasions(item, valid_occasions)
+
+
+def setOccasions(items: List[ClothingItem], batch_size: int = ITEM_OCCASION_BATCH_SIZE) -> List[ClothingItem]:
+    """
+    Sets the occasions of many items, e.g. for a bulk import. Cached items cost
+    nothing, identical items are asked about once, and the rest are classified
+    `batch_size` at a time in a single LLM call each. Items the LLM skips in a
+    batch answer, and every item of a batch whose call or answer fails, get an
+    individual setOccasion call.
+    
+    Args:
+        items: The clothing items to analyze
+        batch_size: Items per LLM request
+        
+    Returns:
+        The same items, updated in place
+    """
+    allowed_occasions = ai_config.get_allowed_occasions()
+    for batch in plan_occasion_batches(items, batch_size):
+        reps = [group[0] for _, group in batch]
+        messages = [SystemMessage(content=build_batch_occasion_prompt(reps, allowed_occasions))]
+        try:
+            generated = llm_client.invoke(messages, temperature=0.3)
+            answers = parse_batch_occasions(generated, len(reps), allowed_occasions)
+        except Exception as e:
+            logger.error("Error in setOccasions batch, asking per item: %s", e)
+            answers = {}
+        for rep in apply_batch_answer(batch, answers):
+            setOccasion(rep)
+        copy_occasions(batch)
+    return items
+
+
+async def asetOccasions(items: List[ClothingItem], batch_size: int = ITEM_OCCASION_BATCH_SIZE,
+                        deadline: Optional[float] = None) -> List[ClothingItem]:
+    """Async version of setOccasions; the batches are sent concurrently."""
+    allowed_occasions = ai_config.get_allowed_occasions()
+
+    async def run(batch):
+        reps = [group[0] for _, group in batch]
+        messages = [SystemMessage(content=build_batch_occasion_prompt(reps, allowed_occasions))]
+        try:
+            generated = await llm_client.ainvoke(messages, temperature=0.3, deadline=deadline)
+            answers = parse_batch_occasions(generated, len(reps), allowed_occasions)
+        except Exception as e:
+            logger.error("Error in setOccasions batch, asking per item: %s", e)
+            answers = {}
+        await asyncio.gather(*(asetOccasion(rep, deadline=deadline) for rep in apply_batch_answer(batch, answers)))
+        copy_occasions(batch)
+
+    await asyncio.gather(*(run(batch) for batch in plan_occasion_batches(items, batch_size)))
+    return items
@@ -1,20 +1,183 @@
+import os
 import re
 import logging
+from collections import Counter
 from langchain_core.messages import SystemMessage
-from typing import Dict, List
+from typing import Dict, List, Optional
 
+from api.llm import classifier
 from api.llm.client import llm_client
 from api.llm.config import ai_config
+from api.llm.occasion_cache import occasion_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Try the keyword rules and the trained model before asking the LLM
+OCCASION_LOCAL_FIRST = os.getenv("OCCASION_LOCAL_FIRST", "true").lower() == "true"
+
+# Synonyms mapping for common alternate phrases
+OCCASION_SYNONYMS = {
+    "very formal": "very formal occasion",
+    "black tie": "black tie event",
+    "white tie": "white tie event",
+    "interview": "job interview",
+    "dinner": "dinner party",
+    "office": "work",
+    "gym": "gym",
+    "casual": "casual outing",
+    "date": "date night",
+    "party": "party",
+    "formal": "general formal occasion",
+    "informal": "general informal occasion"
+}
+
+# How uncached determineOccasions calls were answered: "rule", "model", "llm" or "fallback";
+# "fast" counts occasions fast mode found locally, which never involve the LLM
+occasion_sources = Counter()
+
+# Words that turn a named occasion into one the user doesn't want ("nothing for work")
+NEGATIONS = {"no", "not", "nothing", "never", "without", "avoid", "dont", "don't", "isnt", "isn't",
+             "arent", "aren't", "wont", "won't", "cant", "can't", "neither", "nor"}
+_CLAUSE_BREAK = re.compile(r"[.,;:!?]|\bbut\b")
+
+
+def build_occasion_prompt(user_message: str, allowed_occasions: List[str]) -> str:
+    """Builds the prompt asking the LLM to pick one allowed occasion for the message."""
+    return (
+        f"Based on the following user message, determine the most appropriate occasion "
+        f"for generating an outfit. Choose from the following options: {', '.join(allowed_occasions)}.\n\n"
+        f"User message: \"{user_message}\".\n\n"
+        f"Return only the chosen occasion exactly as one of the options."
+    )
+
+
+def match_occasion(generated: str, allowed_occasions: List[str], user_message: str) -> str:
+    """
+    Maps the LLM's answer onto an allowed occasion, falling back to local matching,
+    and caches the result for the message.
+    """
+    # Check if the output (case-insensitive) is in the allowed occasions
+    for occ in allowed_occasions:
+        if occ.lower() == generated.lower():
+            break
+    else:
+        # If no match, use fallback
+        occ = fallback_determineOccasions(user_message)
+    
+    occasion_cache.set(user_message, occ)
+    return occ
+
+
+class OccasionMatcher:
+    """
+    Every occasion phrase and synonym compiled into one alternation, longest
+    phrase first, so a single scan of the message finds all hits. The pattern
+    is a lookahead so hits that overlap (e.g. "black tie event" and "tie")
+    are all reported.
+    """
+
+    def __init__(self, occasions: List[str], synonyms: Dict[str, str]):
+        # Lower rank wins: occasion phrases longest first, then synonyms in table order
+        self.phrases: Dict[str, tuple] = {}
+        for rank, occ in enumerate(sorted(occasions, key=len, reverse=True)):
+            self.phrases.setdefault(occ.lower(), (rank, occ))
+        for rank, (phrase, occ) in enumerate(synonyms.items(), start=len(self.phrases)):
+            self.phrases.setdefault(phrase.lower(), (rank, occ))
+        alternation = "|".join(re.escape(p) for p in sorted(self.phrases, key=len, reverse=True))
+        self.pattern = re.compile(r'(?=\b(' + alternation + r')\b)')
+
+    def hits(self, message: str) -> List[re.Match]:
+        return list(self.pattern.finditer(message.lower()))
+
+    def best(self, message: str) -> Optional[str]:
+        """The occasion the old per-phrase search would have returned first."""
+        ranked = [self.phrases[m.group(1)] for m in self.hits(message)]
+        return min(ranked)[1] if ranked else None
+
+    def matches(self, message: str) -> List[str]:
+        """Distinct occasions named in the message, ignoring hits inside a longer one."""
+        found, covered_until = [], -1
+        for m in self.hits(message):
+            if m.start(1) < covered_until:
+                continue
+            covered_until = m.end(1)
+            occ = self.phrases[m.group(1)][1]
+            if occ not in found:
+                found.append(occ)
+        return found
+
+
+_matcher: Optional[OccasionMatcher] = None
+_matcher_version = None
+
+
+def get_matcher() -> OccasionMatcher:
+    """The compiled matcher, rebuilt only after AIConfig reloads."""
+    global _matcher, _matcher_version
+    if _matcher is None or _matcher_version != ai_config.version:
+        _matcher = OccasionMatcher(list(ai_config.get_occasion_config().keys()), OCCASION_SYNONYMS)
+        _matcher_version = ai_config.version
+    return _matcher
+
+
+def rule_matches(user_message: str) -> List[str]:
+    """Every occasion named in the message, directly or through a synonym, without duplicates."""
+    return get_matcher().matches(user_message)
+
+
+def is_negated(message: str, position: int) -> bool:
+    """Whether a negation comes before `position` in the same clause of the (lowercased) message."""
+    clause = _CLAUSE_BREAK.split(message[:position].replace("\u2019", "'"))[-1]
+    return any(word in NEGATIONS for word in re.findall(r"[a-z']+", clause))
+
+
+def classify_locally(user_message: str, count: bool = True) -> Optional[str]:
+    """
+    Answers without the LLM when the message is unambiguous: exactly one allowed
+    occasion named in full by the keyword rules, or else a confident prediction
+    from the trained model (limited to the named occasions, if several were).
+    A match found only through a synonym is not enough on its own, since synonyms
+    are loose ("nothing formal" contains "formal"), and a named occasion that is
+    negated ("nothing for work") is left to the LLM. Returns None when the LLM
+    should decide. `count` records the answer's source in occasion_sources.
+    """
+    allowed = ai_config.get_allowed_occasions()
+    matches = [occ for occ in rule_matches(user_message) if occ in allowed]
+    if len(matches) == 1:
+        message = user_message.lower()
+        named = re.search(r'\b' + re.escape(matches[0]) + r'\b', message)
+        if named and is_negated(message, named.start()):
+            return None
+        if named:
+            if count:
+                occasion_sources["rule"] += 1
+            return matches[0]
+
+    if classifier.occasion_model is not None:
+        candidates = matches if len(matches) > 1 else allowed
+        prediction = classifier.occasion_model.predict(user_message, candidates=candidates)
+        if prediction and prediction[1] >= classifier.OCCASION_MODEL_THRESHOLD:
+            if count:
+                occasion_sources["model"] += 1
+            return prediction[0]
+    return None
+
+
+def occasion_stats() -> Dict[str, float]:
+    """Share of determineOccasions answers that avoided the LLM (fast mode is reported apart)."""
+    total = sum(n for source, n in occasion_sources.items() if source != "fast")
+    local = occasion_sources["rule"] + occasion_sources["model"]
+    return {**occasion_sources, "llm_avoided_rate": local / total if total else 0.0}
+
 
 def determineOccasions(user_message: str) -> str:
     """
     Determines the target occasion by querying the LLM.
     If the LLM response doesn't match an allowed occasion, falls back to local matching.
+    Unambiguous messages are answered locally first (see classify_locally).
+    Results are cached by normalized message (see occasion_cache); LLM errors are not cached.
     
     Args:
         user_message: The user's input message
@@ -22,35 +185,58 @@ def determineOccasions(user_message: str) -> str:
     Returns:
         A string representing the detected occasion
     """
+    cached = occasion_cache.get(user_message)
+    if cached is not None:
+        return cached
+    
+    local = classify_locally(user_message) if OCCASION_LOCAL_FIRST else None
+    if local is not None:
+        return local
+    
     allowed_occasions = ai_config.get_allowed_occasions()
-    prompt = (
-        f"Based on the following user message, determine the most appropriate occasion "
-        f"for generating an outfit. Choose from the following options: {', '.join(allowed_occasions)}.\n\n"
-        f"User message: \"{user_message}\".\n\n"
-        f"Return only the chosen occasion exactly as one of the options."
-    )
     
     try:
+        messages = [SystemMessage(content=build_occasion_prompt(user_message, allowed_occasions))]
         # Use a moderate temperature for occasion determination
-        llm_client.with_temperature(0.3)
-        messages = [SystemMessage(content=prompt)]
-        generated = llm_client.invoke(messages)
-        
-        # Check if the output (case-insensitive) is in the allowed occasions
-        for occ in allowed_occasions:
-            if occ.lower() == generated.lower():
-                return occ
-        
-        # If no match, use fallback
+        generated = llm_client.invoke(messages, temperature=0.3)
+        occasion_sources["llm"] += 1
+        return match_occasion(generated, allowed_occasions, user_message)
+    except Exception as e:
+        logger.error("Error in determineOccasions LLM query: %s", e)
+        occasion_sources["fallback"] += 1
         return fallback_determineOccasions(user_message)
+
+
+async def adetermineOccasions(user_message: str, deadline: Optional[float] = None) -> str:
+    """
+    Async version of determineOccasions; uses local matching if the LLM call fails or
+    misses the deadline.
+    """
+    cached = occasion_cache.get(user_message)
+    if cached is not None:
+        return cached
+    
+    local = classify_locally(user_message) if OCCASION_LOCAL_FIRST else None
+    if local is not None:
+        return local
+    
+    allowed_occasions = ai_config.get_allowed_occasions()
+    
+    try:
+        messages = [SystemMessage(content=build_occasion_prompt(user_message, allowed_occasions))]
+        generated = await llm_client.ainvoke(messages, temperature=0.3, deadline=deadline)
+        occasion_sources["llm"] += 1
+        return match_occasion(generated, allowed_occasions, user_message)
     except Exception as e:
         logger.error("Error in determineOccasions LLM query: %s", e)
+        occasion_sources["fallback"] += 1
         return fallback_determineOccasions(user_message)
 
 
 def fallback_determineOccasions(user_message: str) -> str:
     """
     Fallback method to determine the occasion using local regex matching and synonyms.
+    Occasion names take precedence over synonyms, and longer names over shorter ones.
     
     Args:
         user_message: The user's input message
@@ -58,33 +244,4 @@ def fallback_determineOccasions(user_message: str) -> str:
     Returns:
         A string representing the detected occasion, defaulting to "all occasions"
     """
-    lower_msg = user_message.lower()
-    
-    # Exact matching with allowed phrases sorted by length (longest first)
-    for occ in sorted(ai_config.get_occasion_config().keys(), key=len, reverse=True):
-        pattern = r'\b' + re.escape(occ) + r'\b'
-        if re.search(pattern, lower_msg):
-            return occ
-    
-    # Synonyms mapping for common alternate phrases
-    synonyms = {
-        "very formal": "very formal occasion",
-        "black tie": "black tie event",
-        "white tie": "white tie event",
-        "interview": "job interview",
-        "dinner": "dinner party",
-        "office": "work",
-        "gym": "gym",
-        "casual": "casual outing",
-        "date": "date night",
-        "party": "party",
-        "formal": "general formal occasion",
-        "informal": "general informal occasion"
-    }
-    
-    for key, value in synonyms.items():
-        pattern = r'\b' + re.escape(key) + r'\b'
-        if re.search(pattern, lower_msg):
-            return value
-    
-    return "all occasions"
\ No newline at end of file
+    return get_matcher().best(user_message) or "all occasions"
@@ -0,0 +1,148 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from api.cache import TTLCache
+from api.llm.config import ai_config
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+OCCASION_CACHE_SIZE = int(os.getenv("OCCASION_CACHE_SIZE", "10000"))
+OCCASION_CACHE_TTL = float(os.getenv("OCCASION_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+OCCASION_CACHE_DB = os.getenv("OCCASION_CACHE_DB", "")  # SQLite file for the persistent tier; empty disables it
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase and fold punctuation and whitespace, so trivially different messages share a key."""
+    return " ".join(_NON_WORD.sub(" ", (message or "").lower()).split())
+
+
+class OccasionCache:
+    """
+    Cache of occasion labels by normalized user message.
+
+    An in-memory TTL/LRU tier sits in front of an optional SQLite file that
+    survives restarts. Every entry is stored under the fingerprint of the AI
+    config that produced it, so editing ai_config.json makes old labels miss
+    (and purges them from the file).
+    """
+
+    def __init__(self, max_size: int = OCCASION_CACHE_SIZE, ttl: float = OCCASION_CACHE_TTL,
+                 db_path: Optional[str] = OCCASION_CACHE_DB or None):
+        self.ttl = ttl
+        self.db_path = db_path
+        self._memory = TTLCache(max_size=max_size, ttl=ttl)
+        self._local = threading.local()
+        self._fingerprint = ai_config.fingerprint
+        self.disk_hits = 0
+        self.misses = 0
+        if db_path:
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS occasions ("
+                    "fingerprint TEXT NOT NULL, message TEXT NOT NULL, occasion TEXT NOT NULL, "
+                    "expires_at REAL NOT NULL, PRIMARY KEY (fingerprint, message))"
+                )
+            self._purge_stale()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _current_fingerprint(self) -> str:
+        ai_config.reload_if_changed()
+        if ai_config.fingerprint != self._fingerprint:
+            logger.info("AI config changed; invalidating cached occasions")
+            self._fingerprint = ai_config.fingerprint
+            self._memory.clear()
+            self._purge_stale()
+        return self._fingerprint
+
+    def _purge_stale(self) -> None:
+        if not self.db_path:
+            return
+        try:
+            self._connection().execute(
+                "DELETE FROM occasions WHERE fingerprint != ? OR expires_at <= ?", (self._fingerprint, time.time())
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to purge occasion cache: {e}")
+
+    def get(self, message: str) -> Optional[str]:
+        """Return the cached occasion for the message, or None."""
+        fingerprint = self._current_fingerprint()
+        key = normalize_message(message)
+        occasion = self._memory.get(key)
+        if occasion is not None:
+            return occasion
+
+        if self.db_path:
+            try:
+                row = self._connection().execute(
+                    "SELECT occasion, expires_at FROM occasions WHERE fingerprint = ? AND message = ? AND expires_at > ?",
+                    (fingerprint, key, time.time()),
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Occasion cache read failed: {e}")
+                row = None
+            if row is not None:
+                self.disk_hits += 1
+                self._memory.set(key, row[0], ttl=row[1] - time.time())
+                return row[0]
+
+        self.misses += 1
+        return None
+
+    def set(self, message: str, occasion: str) -> None:
+        fingerprint = self._current_fingerprint()
+        key = normalize_message(message)
+        self._memory.set(key, occasion)
+        if self.db_path:
+            try:
+                self._connection().execute(
+                    "INSERT OR REPLACE INTO occasions (fingerprint, message, occasion, expires_at) VALUES (?, ?, ?, ?)",
+                    (fingerprint, key, occasion, time.time() + self.ttl),
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"Occasion cache write failed: {e}")
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self.db_path:
+            self._connection().execute("DELETE FROM occasions")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rates for the memory tier, the disk tier and overall."""
+        memory = self._memory.stats()
+        hits = memory["hits"] + self.disk_hits
+        total = hits + self.misses
+        return {
+            "size": memory["size"],
+            "max_size": memory["max_size"],
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "config_fingerprint": self._fingerprint,
+            "persistent": bool(self.db_path),
+        }
+
+
+# Create a singleton occasion cache
+occasion_cache = OccasionCache()
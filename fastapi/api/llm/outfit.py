@@ -1,13 +1,25 @@
+import asyncio
 import json
 import logging
-from typing import Dict, List, Set, Tuple, Optional
+import os
+import sys
+import threading
+from collections import Counter
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Set, Tuple, Optional
 from langchain_core.messages import SystemMessage, HumanMessage
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 
-from api.llm.client import llm_client
+from api import metrics
+from api.cache import TTLCache
+from api.llm.client import estimate_tokens, llm_client
 from api.llm.config import ai_config
-from api.llm.occasion import determineOccasions
+from api.llm.occasion import (
+    adetermineOccasions, classify_locally, determineOccasions, fallback_determineOccasions, occasion_sources,
+)
+from api.llm.outfit_cache import outfit_cache
 
 
 
@@ -16,6 +28,24 @@ from api.llm.occasion import determineOccasions
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Outfit prompt format: "verbose" (labelled fields per item) or "compact" (header row, aliased IDs)
+PROMPT_ENCODING = os.getenv("PROMPT_ENCODING", "verbose").lower()
+PROMPT_FEW_SHOT = os.getenv("PROMPT_FEW_SHOT", "true").lower() == "true"  # include the example outfits
+# JSON lines file to record outfit prompts' inputs and LLM responses to, for replaying with api.bench
+OUTFIT_RECORD_PATH = os.getenv("OUTFIT_RECORD_PATH", "")
+
+# Prompt size limits for the wardrobe section of the outfit prompt
+PROMPT_WARDROBE_TOKEN_BUDGET = int(os.getenv("PROMPT_WARDROBE_TOKEN_BUDGET", "4000"))
+PROMPT_MAX_ITEMS_PER_TYPE = int(os.getenv("PROMPT_MAX_ITEMS_PER_TYPE", "12"))
+
+# Estimated outfit prompt tokens before and after pruning, summed over all prompts
+prompt_token_stats = Counter()
+
+# Parsed wardrobes, reused while the same rows are passed in again
+WARDROBE_SNAPSHOT_CACHE_SIZE = int(os.getenv("WARDROBE_SNAPSHOT_CACHE_SIZE", "256"))
+WARDROBE_SNAPSHOT_TTL = float(os.getenv("WARDROBE_SNAPSHOT_TTL", "600"))  # seconds
+wardrobe_snapshots = TTLCache(max_size=WARDROBE_SNAPSHOT_CACHE_SIZE, ttl=WARDROBE_SNAPSHOT_TTL)
+
 
 
 
@@ -33,39 +63,44 @@ class ItemType(Enum):
         """Safely convert a string to ItemType, handling common variations."""
         if not value:
             raise ValueError("Item type cannot be empty")
-            
-        value = value.lower().strip()
-        # Handle common variations and typos
-        type_mapping = {
-            'tops': cls.TOP,
-            'top': cls.TOP,
-            'bottoms': cls.BOTTOM,
-            'bottom': cls.BOTTOM,
-            'shoe': cls.SHOES,
-            'shoes': cls.SHOES,
-            'footwear': cls.SHOES,
-            'outer': cls.OUTERWEAR,
-            'outerware': cls.OUTERWEAR,  # Common typo
-            'outerwear': cls.OUTERWEAR,
-            'jacket': cls.OUTERWEAR,
-            'coat': cls.OUTERWEAR,
-            'accessories': cls.ACCESSORY,
-            'accessory': cls.ACCESSORY,
-            'dresses': cls.DRESS,
-            'dress': cls.DRESS,
-            'suits': cls.SUIT,
-            'suit': cls.SUIT
-        }
+        return _item_type_for(value.lower().strip())
+
+
+# Common variations and typos of item type names
+ITEM_TYPE_ALIASES = {
+    'tops': ItemType.TOP,
+    'top': ItemType.TOP,
+    'bottoms': ItemType.BOTTOM,
+    'bottom': ItemType.BOTTOM,
+    'shoe': ItemType.SHOES,
+    'shoes': ItemType.SHOES,
+    'footwear': ItemType.SHOES,
+    'outer': ItemType.OUTERWEAR,
+    'outerware': ItemType.OUTERWEAR,  # Common typo
+    'outerwear': ItemType.OUTERWEAR,
+    'jacket': ItemType.OUTERWEAR,
+    'coat': ItemType.OUTERWEAR,
+    'accessories': ItemType.ACCESSORY,
+    'accessory': ItemType.ACCESSORY,
+    'dresses': ItemType.DRESS,
+    'dress': ItemType.DRESS,
+    'suits': ItemType.SUIT,
+    'suit': ItemType.SUIT
+}
+
+
+@lru_cache(maxsize=1024)
+def _item_type_for(value: str) -> ItemType:
+    """ItemType for a normalized name; memoized, since wardrobes repeat a handful of names."""
+    if value in ITEM_TYPE_ALIASES:
+        return ITEM_TYPE_ALIASES[value]
         
-        if value in type_mapping:
-            return type_mapping[value]
+    # Try to find a close match
+    for valid_type in ItemType:
+        if valid_type.value in value or value in valid_type.value:
+            return valid_type
             
-        # Try to find a close match
-        for valid_type in cls:
-            if valid_type.value in value or value in valid_type.value:
-                return valid_type
-                
-        raise ValueError(f"Invalid item type: {value}")
+    raise ValueError(f"Invalid item type: {value}")
 
 class FormalityLevel(Enum):
     VERY_LOW = "very low"
@@ -83,7 +118,31 @@ class FormalityLevel(Enum):
     BLACK_TIE = "black tie"
     WHITE_TIE = "white tie"
 
-@dataclass
+# Items are slotted where dataclasses support it (Python 3.10+), so large wardrobes stay compact
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# Tag tuples by their source value, shared by every item with the same tags
+_interned_tags: Dict[object, Tuple[str, ...]] = {}
+_INTERNED_TAGS_MAX = 65536
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def intern_tags(value) -> Tuple[str, ...]:
+    """A comma-separated tag string (or list) as one shared tuple of interned strings."""
+    key = value if isinstance(value, str) or value is None else tuple(value)
+    tags = _interned_tags.get(key)
+    if tags is None:
+        parts = value.split(',') if isinstance(value, str) else value or []
+        tags = tuple(_intern(tag) for tag in parts)
+        if len(_interned_tags) < _INTERNED_TAGS_MAX:
+            _interned_tags[key] = tags
+    return tags
+
+
+@dataclass(**_SLOTS)
 class WardrobeItem:
     id: str
     item_type: ItemType
@@ -92,11 +151,15 @@ class WardrobeItem:
     formality: FormalityLevel
     pattern: str
     fit: str
-    suitable_for_weather: List[str]
-    suitable_for_occasion: List[str]
+    suitable_for_weather: Tuple[str, ...]
+    suitable_for_occasion: Tuple[str, ...]
     sub_type: str
     image_link: Optional[str] = None
     favorite: bool = False
+    # Lazily built views of the item, shared by every request that uses the parsed item
+    _view: Optional[Mapping] = field(default=None, init=False, repr=False, compare=False)
+    _line: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _row: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
     @classmethod
     def from_dict(cls, data: Dict) -> 'WardrobeItem':
@@ -112,23 +175,17 @@ class WardrobeItem:
                 formality = FormalityLevel.MEDIUM
                 logger.warning(f"Invalid formality level for item {data.get('id')}, defaulting to MEDIUM")
             
-            # Safely convert weather and occasion lists
-            weather = data.get('suitable_for_weather', '')
-            weather_list = weather.split(',') if isinstance(weather, str) else weather or []
-            
-            occasion = data.get('suitable_for_occasion', '')
-            occasion_list = occasion.split(',') if isinstance(occasion, str) else occasion or []
-            
+            # Weather and occasion tags, and the other repeated attribute values, are interned
             return cls(
                 id=data['id'],
                 item_type=item_type,
-                material=data.get('material', 'unknown'),
-                color=data.get('color', 'unknown'),
+                material=_intern(data.get('material', 'unknown')),
+                color=_intern(data.get('color', 'unknown')),
                 formality=formality,
-                pattern=data.get('pattern', 'solid'),
-                fit=data.get('fit', 'regular'),
-                suitable_for_weather=weather_list,
-                suitable_for_occasion=occasion_list,
+                pattern=_intern(data.get('pattern', 'solid')),
+                fit=_intern(data.get('fit', 'regular')),
+                suitable_for_weather=intern_tags(data.get('suitable_for_weather', '')),
+                suitable_for_occasion=intern_tags(data.get('suitable_for_occasion', '')),
                 sub_type=data.get('sub_type', ''),
                 image_link=data.get('image_link'),
                 favorite=data.get('favorite', False)
@@ -154,6 +211,12 @@ class WardrobeItem:
             'favorite': self.favorite
         }
 
+    def view(self) -> Mapping:
+        """Read-only to_dict(), built once and shared, for code that only reads the item's fields."""
+        if self._view is None:
+            self._view = MappingProxyType(self.to_dict())
+        return self._view
+
     def is_suitable_for_weather(self, weather_data: Dict) -> bool:
         """Check if item is suitable for given weather conditions."""
         temp = weather_data.get("temperature", 0)
@@ -219,6 +282,12 @@ def filter_suitable_items(wardrobe_items: List[WardrobeItem],
     """
     Filter wardrobe items based on weather and occasion suitability.
     
+    Items must suit the weather (accessories and shoes are exempt) and the
+    occasion, allowing semi-formal items for formal occasions and smart casual
+    items for casual ones. The checks run as bitset operations on the wardrobe's
+    precomputed suitability index (see suitability.py), which is reused across
+    the calls made for the same wardrobe list.
+    
     Args:
         wardrobe_items: List of wardrobe items
         weather_data: Weather data dictionary containing temperature, description, etc.
@@ -227,23 +296,8 @@ def filter_suitable_items(wardrobe_items: List[WardrobeItem],
     Returns:
         Filtered list of suitable wardrobe items
     """
-    filtered_items = []
-    
-    for item in wardrobe_items:
-        # Check weather and occasion suitability using the new methods
-        if not item.is_suitable_for_weather(weather_data):
-            if item.item_type not in [ItemType.ACCESSORY, ItemType.SHOES]:
-                continue
-                
-        if not item.is_suitable_for_occasion(occasion):
-            # Allow slight mismatch for some occasions
-            if not (("formal" in occasion.lower() and "semi-formal" in item.suitable_for_occasion) or
-                    ("casual" in occasion.lower() and "smart casual" in item.suitable_for_occasion)):
-                continue
-                
-        filtered_items.append(item)
-    
-    return filtered_items
+    from api.llm.suitability import suitability_index
+    return suitability_index(wardrobe_items).filter(weather_data, occasion)
 
 
 
@@ -344,12 +398,14 @@ def check_style_coherence(outfit_items: List[Dict]) -> Tuple[bool, str]:
 
 
 
-def format_wardrobe_items(wardrobe_items: List[WardrobeItem]) -> Tuple[List[str], Set[str]]:
+def format_wardrobe_items(wardrobe_items: List[WardrobeItem],
+                          aliases: Optional[Dict[str, str]] = None) -> Tuple[List[str], Set[str]]:
     """
     Format wardrobe items for prompt and return set of IDs.
     
     Args:
         wardrobe_items: List of wardrobe items
+        aliases: Item ID -> short alias; when given, items are formatted as compact rows
         
     Returns:
         Tuple of (formatted_items_list, wardrobe_ids_set)
@@ -359,7 +415,35 @@ def format_wardrobe_items(wardrobe_items: List[WardrobeItem]) -> Tuple[List[str]
     
     for item in wardrobe_items:
         wardrobe_ids.add(item.id)
-        formatted_items.append(
+        formatted_items.append(format_wardrobe_item(item, aliases[item.id] if aliases else None))
+    
+    return formatted_items, wardrobe_ids
+
+
+def item_aliases(wardrobe_items: List[WardrobeItem]) -> Dict[str, str]:
+    """Short per-request aliases (i1, i2, ...) for item UUIDs."""
+    return {item.id: f"i{n}" for n, item in enumerate(wardrobe_items, start=1)}
+
+
+def _cell(value) -> str:
+    return str(value if value is not None else "").replace("|", "/").replace("\n", " ").strip()
+
+
+def format_wardrobe_item(item: WardrobeItem, alias: Optional[str] = None) -> str:
+    """
+    One wardrobe item as a line of the prompt; a COMPACT_COLUMNS row when an alias
+    is given. Both forms are built once per parsed item and reused.
+    """
+    if alias is not None:
+        if item._row is None:
+            item._row = "|".join(_cell(value) for value in (
+                item.item_type.value, item.material, item.color, item.formality.value, item.pattern,
+                item.fit, ";".join(w.strip() for w in item.suitable_for_weather),
+                ";".join(o.strip() for o in item.suitable_for_occasion), item.sub_type,
+            ))
+        return f"{_cell(alias)}|{item._row}"
+    if item._line is None:
+        item._line = (
             f"Item ID: {item.id}, Type: {item.item_type.value}, "
             f"Material: {item.material}, "
             f"Color: {item.color}, "
@@ -370,43 +454,172 @@ def format_wardrobe_items(wardrobe_items: List[WardrobeItem]) -> Tuple[List[str]
             f"Occasion Suitability: {', '.join(item.suitable_for_occasion)}, "
             f"Sub Type: {item.sub_type}"
         )
-    
-    return formatted_items, wardrobe_ids
+    return item._line
 
 
+@lru_cache(maxsize=65536)
+def item_tokens(line: str) -> int:
+    """estimate_tokens for a formatted item line; lines repeat across requests for the same wardrobe."""
+    return estimate_tokens(line)
 
 
-def build_prompt(user_message: str, 
-                weather_data: Dict, 
-                formatted_items: List[str], 
-                target_occ: str, 
-                config: Dict) -> str:
+def prune_for_prompt(wardrobe_items: List[WardrobeItem], weather_data: Dict, target_occ: str,
+                     token_budget: int = PROMPT_WARDROBE_TOKEN_BUDGET,
+                     max_per_type: int = PROMPT_MAX_ITEMS_PER_TYPE, compact: bool = False) -> List[WardrobeItem]:
     """
-    Build the LLM prompt for outfit generation.
-    
-    Args:
-        user_message: User's message
-        weather_data: Weather data dictionary
-        formatted_items: Formatted wardrobe items
-        target_occ: Target occasion
-        config: Occasion configuration
-        
-    Returns:
-        Complete prompt string
+    Keeps the best-scoring items for the occasion and weather (scored like the local
+    solver does), at most `max_per_type` per ItemType and within `token_budget`
+    estimated prompt tokens. The best top, bottom and shoes are always kept, and the
+    rest are taken in rounds (each type's next-best item per round) so every type
+    stays represented.
     """
-    # Build rules text
-    rules_text = (
-        f"Allowed items: {', '.join(config['items']) if config.get('items') else 'Any'}, "
-        f"Rules: {config.get('rules', '')}, "
-        f"Strictness: {config.get('strictness', '')}, "
-        f"Description: {config.get('description', '')}\n"
-        f"IMPORTANT: Do not include any items with 'tuxedo' or 'tailcoat' in their sub_type "
-        f"if the occasion is not a 'black tie event' or 'white tie event'."
-    )
+    # Imported here because the solver builds on this module
+    from api.llm.solver import _context, score_item
+    
+    ctx = _context(weather_data, target_occ)
+    ranked = {}
+    for item_type, items in categorize_wardrobe(wardrobe_items).items():
+        ranked[item_type] = sorted(items, key=lambda item: score_item(item, ctx, weather_data), reverse=True)
     
-    wardrobe_text = "The user's wardrobe includes: " + " | ".join(formatted_items) + "."
+    kept, kept_ids, tokens = [], set(), 0
+    for item_type in (ItemType.TOP, ItemType.BOTTOM, ItemType.SHOES):
+        if ranked[item_type]:
+            item = ranked[item_type][0]
+            kept.append(item)
+            kept_ids.add(item.id)
+            tokens += item_tokens(format_wardrobe_item(item, "i00" if compact else None))
     
-    # Build comprehensive weather guidance
+    for position in range(max_per_type):
+        for items in ranked.values():
+            if position >= len(items) or items[position].id in kept_ids:
+                continue
+            cost = item_tokens(format_wardrobe_item(items[position], "i00" if compact else None))
+            if tokens + cost > token_budget:
+                continue
+            kept.append(items[position])
+            kept_ids.add(items[position].id)
+            tokens += cost
+    return kept
+
+
+
+
+def weather_signature(weather_data: Dict) -> Tuple[str, ...]:
+    """
+    Coarse weather buckets using the same thresholds as the guidance in build_prompt,
+    so two requests with the same signature get the same weather guidance.
+    """
+    temp = weather_data.get("temperature", 0)
+    feels_like = weather_data.get("feels_like", temp)
+    forecast = weather_data.get("forecast") or {}
+    forecast_high = forecast.get("high", temp)
+    forecast_low = forecast.get("low", temp)
+    description = (weather_data.get("description") or "").lower()
+    humidity = weather_data.get("humidity", 0) or 0
+    wind_speed = weather_data.get("wind_speed", 0) or 0
+
+    def band(value, cuts):
+        return next((label for limit, label in cuts if value is not None and value > limit), "")
+
+    if feels_like < 10 or "very cold" in description:
+        feel = "very cold"
+    elif feels_like < 15 or "cold" in description:
+        feel = "cold"
+    elif feels_like > 30 or "very hot" in description:
+        feel = "very hot"
+    elif feels_like > 25 or "hot" in description:
+        feel = "hot"
+    else:
+        feel = "mild"
+    temp_range = forecast_high - forecast_low if forecast_high and forecast_low else 0
+    later_low = ""
+    if forecast_high and forecast_low:
+        later_low = "very cold" if forecast_low < 10 else "cold" if forecast_low < 15 else ""
+    precipitation = ",".join(
+        kind for kind, words in (("rain", ["rain", "drizzle", "shower"]), ("snow", ["snow", "sleet", "flurries"]))
+        if any(word in description for word in words)
+    )
+    wind = "strong" if wind_speed > 30 or "strong wind" in description else \
+        "windy" if wind_speed > 20 or "windy" in description else ""
+    humid = "very humid" if humidity > 80 or "very humid" in description else \
+        "humid" if humidity > 70 or "humid" in description else ""
+    return (
+        feel,
+        band(temp_range, [(15, "wide"), (10, "moderate")]),
+        band(forecast_high if forecast_high and forecast_low else None, [(35, "very hot"), (30, "hot"), (25, "warm")]),
+        later_low,
+        precipitation,
+        wind,
+        humid,
+        band(weather_data.get("uv_index", 0), [(8, "very high"), (6, "high")]),
+    )
+
+
+# The static part of the outfit prompt. It comes first and is identical for every request,
+# so the provider's prompt cache can reuse it; everything request-specific follows it.
+PROMPT_INSTRUCTIONS = """
+Step: Generate and Refine Outfit Suggestion.
+You are a style assistant tasked with generating an outfit suggestion based on the following details and guardrails.
+
+1. Use chain-of-thought reasoning to consider the user's message, weather conditions, and wardrobe.
+2. Ensure that only items from the provided wardrobe (with matching Item IDs) are selected.
+3. Do not include any items with 'tuxedo' or 'tailcoat' in their sub_type if the occasion is not a 'black tie event' or 'white tie event'.
+4. The outfit must consist of 3 to 6 items, including:
+   - Exactly one pair of shoes
+   - Either one pair of pants OR one dress/skirt (not both)
+   - Between one and two tops (unless a dress is selected)
+   - Between zero and two outerwear pieces depending on weather
+   - Between zero and two accessories to complete the look
+
+5. Consider color harmony and pattern coordination:
+   - Limit to 3-4 colors maximum in the entire outfit
+   - Avoid mixing more than 2 patterns
+   - Ensure the formality level is consistent across all items
+
+6. Follow the weather guidance given with the details below.
+
+7. IMPORTANT: Each item ID must be unique in the outfit. Do not include the same item ID more than once.
+8. IMPORTANT: Ensure that each item's type classification (tops, bottoms, shoes, etc.) matches its actual type. For example, don't classify a shirt as shoes.
+"""
+
+PROMPT_EXAMPLES = """
+Examples for guidance:
+Example 1 (Wedding):
+Candidate: [White Dress Shirt, Navy Suit Pants, Black Dress Shoes, Navy Suit Jacket]
+Final Output: {"occasion": "wedding", "outfit_items": [{"id": "ex1_1", "sub_type": "White Dress Shirt", "color": "White", "item_type": "top"}, {"id": "ex1_2", "sub_type": "Navy Suit Pants", "color": "Navy", "item_type": "bottom"}, {"id": "ex1_3", "sub_type": "Black Dress Shoes", "color": "Black", "item_type": "shoes"}, {"id": "ex1_4", "sub_type": "Navy Suit Jacket", "color": "Navy", "item_type": "outerwear"}], "description": "An elegant and classic wedding ensemble."}
+
+Example 2 (Dinner Party):
+Candidate: [Black Dress Shirt, Dark Jeans, Brown Loafers, Grey Blazer]
+Final Output: {"occasion": "dinner party", "outfit_items": [{"id": "ex3_1", "sub_type": "Black Dress Shirt", "color": "Black", "item_type": "top"}, {"id": "ex3_2", "sub_type": "Dark Jeans", "color": "Dark Blue", "item_type": "bottom"}, {"id": "ex3_3", "sub_type": "Brown Loafers", "color": "Brown", "item_type": "shoes"}, {"id": "ex3_4", "sub_type": "Grey Blazer", "color": "Grey", "item_type": "outerwear"}], "description": "A stylish and contemporary outfit perfect for a dinner party."}
+
+Example 3 (Hot Weather Casual):
+Candidate: [White T-Shirt, Khaki Shorts, Brown Sandals, Straw Hat]
+Final Output: {"occasion": "casual outing", "outfit_items": [{"id": "ex4_1", "sub_type": "White T-Shirt", "color": "White", "item_type": "top"}, {"id": "ex4_2", "sub_type": "Khaki Shorts", "color": "Beige", "item_type": "bottom"}, {"id": "ex4_3", "sub_type": "Brown Sandals", "color": "Brown", "item_type": "shoes"}, {"id": "ex4_4", "sub_type": "Straw Hat", "color": "Natural", "item_type": "accessory"}], "description": "A comfortable and breezy outfit for hot weather."}
+"""
+
+PROMPT_OUTPUT_FORMAT = """
+Generate your chain-of-thought reasoning (if any) and then output the final refined JSON object in the format:
+{
+  "occasion": "<occasion string>",
+  "outfit_items": [
+    {"id": "<item id>", "sub_type": "<item sub type>", "color": "<item color>", "item_type": "<item type>"},
+    ... (3 to 6 items)
+  ],
+  "description": "<One short sentence describing the outfit>",
+  "styling_tips": "<One short tip for wearing or accessorizing this outfit>"
+}
+"""
+
+COMPACT_COLUMNS = "id|type|material|color|formality|pattern|fit|weather|occasions|sub_type"
+
+
+def prompt_prefix(include_examples: bool = True) -> str:
+    """The request-independent start of the outfit prompt."""
+    return PROMPT_INSTRUCTIONS + (PROMPT_EXAMPLES if include_examples else "") + PROMPT_OUTPUT_FORMAT
+
+
+def build_weather_guidance(weather_data: Dict) -> str:
+    """Weather-specific instructions for the outfit prompt."""
     temp = weather_data.get("temperature", 0)
     feels_like = weather_data.get("feels_like", temp)
     forecast = weather_data.get("forecast", {})
@@ -521,68 +734,65 @@ def build_prompt(user_message: str,
         )
     
     weather_guidance_text = " ".join(weather_guidance) if weather_guidance else "Consider the current weather conditions when selecting items."
-    
-    # Combined prompt for outfit generation and refinement
-    combined_prompt = f"""
-Step: Generate and Refine Outfit Suggestion.
-You are a style assistant tasked with generating an outfit suggestion based on the following details and guardrails.
+    return weather_guidance_text
 
-1. Use chain-of-thought reasoning to consider the user's message, weather conditions, and wardrobe.
-2. Ensure that only items from the provided wardrobe (with matching Item IDs) are selected.
-3. Do not include any items with 'tuxedo' or 'tailcoat' in their sub_type if the occasion is not a 'black tie event' or 'white tie event'.
-4. The outfit must consist of 3 to 6 items, including:
-   - Exactly one pair of shoes
-   - Either one pair of pants OR one dress/skirt (not both)
-   - Between one and two tops (unless a dress is selected)
-   - Between zero and two outerwear pieces depending on weather
-   - Between zero and two accessories to complete the look
-
-5. Consider color harmony and pattern coordination:
-   - Limit to 3-4 colors maximum in the entire outfit
-   - Avoid mixing more than 2 patterns
-   - Ensure the formality level is consistent across all items
-
-6. {weather_guidance_text}
-
-7. IMPORTANT: Each item ID must be unique in the outfit. Do not include the same item ID more than once.
-8. IMPORTANT: Ensure that each item's type classification (tops, bottoms, shoes, etc.) matches its actual type. For example, don't classify a shirt as shoes.
-
-Examples for guidance:
-Example 1 (Wedding):
-Candidate: [White Dress Shirt, Navy Suit Pants, Black Dress Shoes, Navy Suit Jacket]
-Final Output: {{"occasion": "wedding", "outfit_items": [{{"id": "ex1_1", "sub_type": "White Dress Shirt", "color": "White", "item_type": "top"}}, {{"id": "ex1_2", "sub_type": "Navy Suit Pants", "color": "Navy", "item_type": "bottom"}}, {{"id": "ex1_3", "sub_type": "Black Dress Shoes", "color": "Black", "item_type": "shoes"}}, {{"id": "ex1_4", "sub_type": "Navy Suit Jacket", "color": "Navy", "item_type": "outerwear"}}], "description": "An elegant and classic wedding ensemble."}}
-
-Example 2 (Dinner Party):
-Candidate: [Black Dress Shirt, Dark Jeans, Brown Loafers, Grey Blazer]
-Final Output: {{"occasion": "dinner party", "outfit_items": [{{"id": "ex3_1", "sub_type": "Black Dress Shirt", "color": "Black", "item_type": "top"}}, {{"id": "ex3_2", "sub_type": "Dark Jeans", "color": "Dark Blue", "item_type": "bottom"}}, {{"id": "ex3_3", "sub_type": "Brown Loafers", "color": "Brown", "item_type": "shoes"}}, {{"id": "ex3_4", "sub_type": "Grey Blazer", "color": "Grey", "item_type": "outerwear"}}], "description": "A stylish and contemporary outfit perfect for a dinner party."}}
-
-Example 3 (Hot Weather Casual):
-Candidate: [White T-Shirt, Khaki Shorts, Brown Sandals, Straw Hat]
-Final Output: {{"occasion": "casual outing", "outfit_items": [{{"id": "ex4_1", "sub_type": "White T-Shirt", "color": "White", "item_type": "top"}}, {{"id": "ex4_2", "sub_type": "Khaki Shorts", "color": "Beige", "item_type": "bottom"}}, {{"id": "ex4_3", "sub_type": "Brown Sandals", "color": "Brown", "item_type": "shoes"}}, {{"id": "ex4_4", "sub_type": "Straw Hat", "color": "Natural", "item_type": "accessory"}}], "description": "A comfortable and breezy outfit for hot weather."}}
 
+def build_prompt(user_message: str, 
+                weather_data: Dict, 
+                formatted_items: List[str], 
+                target_occ: str, 
+                config: Dict,
+                compact: bool = False,
+                include_examples: bool = True) -> str:
+    """
+    Build the LLM prompt for outfit generation.
+    
+    Args:
+        user_message: User's message
+        weather_data: Weather data dictionary
+        formatted_items: Formatted wardrobe items
+        target_occ: Target occasion
+        config: Occasion configuration
+        compact: formatted_items are COMPACT_COLUMNS rows (see format_wardrobe_items)
+        include_examples: Include the few-shot examples
+        
+    Returns:
+        Complete prompt string
+    """
+    # Build rules text
+    rules_text = (
+        f"Allowed items: {', '.join(config['items']) if config.get('items') else 'Any'}, "
+        f"Rules: {config.get('rules', '')}, "
+        f"Strictness: {config.get('strictness', '')}, "
+        f"Description: {config.get('description', '')}\n"
+        f"IMPORTANT: Do not include any items with 'tuxedo' or 'tailcoat' in their sub_type "
+        f"if the occasion is not a 'black tie event' or 'white tie event'."
+    )
+    
+    if compact:
+        wardrobe_text = (
+            "The user's wardrobe, one item per row (use the id column as the item id):\n"
+            + COMPACT_COLUMNS + "\n" + "\n".join(formatted_items)
+        )
+    else:
+        wardrobe_text = "The user's wardrobe includes: " + " | ".join(formatted_items) + "."
+    
+    temp = weather_data.get("temperature", 0)
+    forecast = weather_data.get("forecast", {})
+    
+    return prompt_prefix(include_examples) + f"""
 Now, with these rules:
 {rules_text}
 
 And the following details:
 Occasion: {user_message}
-Weather Conditions: Current Temperature {temp}°C, {description}, Humidity {humidity}%, Wind Speed {wind_speed} km/h
-Forecast: High {forecast_high}°C, Low {forecast_low}°C
+Weather Conditions: Current Temperature {temp}°C, {weather_data.get("description", "").lower()}, Humidity {weather_data.get("humidity", 0)}%, Wind Speed {weather_data.get("wind_speed", 0)} km/h
+Forecast: High {forecast.get("high", temp)}°C, Low {forecast.get("low", temp)}°C
+Weather guidance: {build_weather_guidance(weather_data)}
 {wardrobe_text}
 
-Generate your chain-of-thought reasoning (if any) and then output the final refined JSON object in the format:
-{{
-  "occasion": "<occasion string>",
-  "outfit_items": [
-    {{"id": "<item id>", "sub_type": "<item sub type>", "color": "<item color>", "item_type": "<item type>"}},
-    ... (3 to 6 items)
-  ],
-  "description": "<One short sentence describing the outfit>",
-  "styling_tips": "<One short tip for wearing or accessorizing this outfit>"
-}}
-
 Output only the final JSON object (with no extra text).
 """
-    return combined_prompt
 
 
 
@@ -784,10 +994,77 @@ def process_outfit_issues(outfit_json: Dict,
 
 
 
+class OutfitItemChecker:
+    """
+    The per-item checks of validate_outfit, applied one candidate at a time so a
+    streamed outfit's items can be checked as they arrive: aliases are mapped back
+    to IDs, unknown and duplicate IDs are dropped, at most one pair of shoes, one
+    bottom and two tops are kept, and the item type, sub_type and color are taken
+    from the wardrobe.
+    """
+    
+    def __init__(self, wardrobe_ids: Set[str], wardrobe_items: List[Dict],
+                 aliases: Optional[Dict[str, str]] = None):
+        self.wardrobe_ids = wardrobe_ids
+        self.aliases = aliases
+        # Create a mapping of item IDs to their correct types
+        self.wardrobe_id_to_type = {item.get("id"): item.get("item_type") for item in wardrobe_items if "id" in item}
+        self.wardrobe_id_to_item = {item.get("id"): item for item in wardrobe_items if "id" in item}
+        self.seen_ids = set()
+        self.seen_types = {ItemType.SHOES: 0, ItemType.BOTTOM: 0, ItemType.TOP: 0}
+    
+    def check(self, candidate_item: Dict) -> Optional[Dict]:
+        """Returns the corrected candidate item (updated in place), or None if it is dropped."""
+        if self.aliases:
+            item_id = str(candidate_item.get("id", "")).strip()
+            candidate_item["id"] = self.aliases.get(item_id, item_id)
+        item_id = candidate_item.get("id")
+        
+        # Skip duplicate items
+        if item_id in self.seen_ids:
+            logger.warning("Duplicate item with id %s found in outfit. Removing duplicate.", item_id)
+            return None
+        
+        # Verify item exists in wardrobe
+        if item_id not in self.wardrobe_ids:
+            logger.warning("Candidate item with id %s not found in wardrobe. Removing item.", item_id)
+            return None
+        
+        # Get the correct type from the wardrobe
+        correct_type = ItemType.from_string(self.wardrobe_id_to_type.get(item_id, ""))
+        
+        # Check if we already have too many of this type
+        seen_types = self.seen_types
+        if correct_type in seen_types:
+            if correct_type == ItemType.SHOES and seen_types[correct_type] >= 1:
+                logger.warning("Too many shoes in outfit. Skipping item %s", item_id)
+                return None
+            elif correct_type == ItemType.BOTTOM and seen_types[correct_type] >= 1:
+                logger.warning("Too many bottom items in outfit. Skipping item %s", item_id)
+                return None
+            elif correct_type == ItemType.TOP and seen_types[correct_type] >= 2:
+                logger.warning("Too many top items in outfit. Skipping item %s", item_id)
+                return None
+        
+        # Update the item type and increment counter
+        candidate_item["item_type"] = correct_type.value
+        seen_types[correct_type] = seen_types.get(correct_type, 0) + 1
+        
+        # Ensure other item fields are correct too
+        original_item = self.wardrobe_id_to_item.get(item_id, {})
+        for field in ["sub_type", "color"]:
+            if field in original_item and (field not in candidate_item or not candidate_item.get(field)):
+                candidate_item[field] = original_item.get(field)
+        
+        self.seen_ids.add(item_id)
+        return candidate_item
+
+
 def validate_outfit(outfit_json: Dict, 
                    wardrobe_ids: Set[str], 
                    target_occ: str,
-                   wardrobe_items: List[Dict]) -> Dict:
+                   wardrobe_items: List[Dict],
+                   aliases: Optional[Dict[str, str]] = None) -> Dict:
     """
     Validate and enhance the outfit response.
     
@@ -796,58 +1073,17 @@ def validate_outfit(outfit_json: Dict,
         wardrobe_ids: Set of valid wardrobe IDs
         target_occ: Target occasion
         wardrobe_items: Original wardrobe items for type verification
+        aliases: Alias -> item ID map of a compact prompt; aliased IDs are mapped back first
         
     Returns:
         Validated and enhanced outfit JSON
     """
-    # Create a mapping of item IDs to their correct types
-    wardrobe_id_to_type = {item.get("id"): item.get("item_type") for item in wardrobe_items if "id" in item}
-    wardrobe_id_to_item = {item.get("id"): item for item in wardrobe_items if "id" in item}
-    
     # Validate candidate item IDs and ensure correct type
+    checker = OutfitItemChecker(wardrobe_ids, wardrobe_items, aliases)
     valid_outfit_items = []
-    seen_ids = set()
-    seen_types = {ItemType.SHOES: 0, ItemType.BOTTOM: 0, ItemType.TOP: 0}
-    
     for candidate_item in outfit_json.get("outfit_items", []):
-        item_id = candidate_item.get("id")
-        
-        # Skip duplicate items
-        if item_id in seen_ids:
-            logger.warning("Duplicate item with id %s found in outfit. Removing duplicate.", item_id)
-            continue
-        
-        # Verify item exists in wardrobe
-        if item_id in wardrobe_ids:
-            # Get the correct type from the wardrobe
-            correct_type = ItemType.from_string(wardrobe_id_to_type.get(item_id, ""))
-            
-            # Check if we already have too many of this type
-            if correct_type in seen_types:
-                if correct_type == ItemType.SHOES and seen_types[correct_type] >= 1:
-                    logger.warning("Too many shoes in outfit. Skipping item %s", item_id)
-                    continue
-                elif correct_type == ItemType.BOTTOM and seen_types[correct_type] >= 1:
-                    logger.warning("Too many bottom items in outfit. Skipping item %s", item_id)
-                    continue
-                elif correct_type == ItemType.TOP and seen_types[correct_type] >= 2:
-                    logger.warning("Too many top items in outfit. Skipping item %s", item_id)
-                    continue
-            
-            # Update the item type and increment counter
-            candidate_item["item_type"] = correct_type.value
-            seen_types[correct_type] = seen_types.get(correct_type, 0) + 1
-                
-            # Ensure other item fields are correct too
-            original_item = wardrobe_id_to_item.get(item_id, {})
-            for field in ["sub_type", "color"]:
-                if field in original_item and (field not in candidate_item or not candidate_item.get(field)):
-                    candidate_item[field] = original_item.get(field)
-                    
+        if checker.check(candidate_item) is not None:
             valid_outfit_items.append(candidate_item)
-            seen_ids.add(item_id)
-        else:
-            logger.warning("Candidate item with id %s not found in wardrobe. Removing item.", item_id)
     
     outfit_json["outfit_items"] = valid_outfit_items
     
@@ -903,193 +1139,465 @@ def validate_outfit(outfit_json: Dict,
 
 
 
-def generateOutfit(user_message: str, weather_data: Dict, wardrobe_items: List[Dict]) -> Dict:
+@dataclass
+class OutfitPrompt:
+    """Everything needed to ask the LLM for an outfit and to validate its answer."""
+    target_occ: str
+    temperature: float
+    combined_prompt: str
+    messages: List
+    wardrobe_ids: Set[str]
+    outfit_items_dict: List[Dict]
+    aliases: Dict[str, str] = field(default_factory=dict)  # alias -> item ID, for compact prompts
+
+
+def parse_wardrobe(wardrobe_items: List[Dict]) -> List[WardrobeItem]:
+    """
+    Converts wardrobe rows to WardrobeItem objects, skipping invalid ones.
+    
+    The result is a snapshot shared by later calls with the same row dicts. The
+    wardrobe cache replaces a row's dict whenever the row changes, so the row
+    identities stand for the wardrobe version, and requests served from the cache
+    reuse the parsed items (and their suitability index and prompt lines). The
+    returned list must not be modified.
+    """
+    # The snapshot keeps the rows alive, so their ids can't be reused while it is cached
+    key = tuple(map(id, wardrobe_items))
+    snapshot = wardrobe_snapshots.get(key)
+    if snapshot is not None:
+        return snapshot[1]
+    
+    wardrobe_objects = []
+    invalid_items = []
+    
+    for item in wardrobe_items:
+        try:
+            wardrobe_objects.append(WardrobeItem.from_dict(item))
+        except ValueError as e:
+            logger.warning(f"Skipping invalid wardrobe item: {str(e)}")
+            invalid_items.append(item.get('id', 'unknown'))
+            continue
+    
+    if not wardrobe_objects:
+        raise ValueError("No valid wardrobe items found")
+        
+    if invalid_items:
+        logger.warning(f"Skipped {len(invalid_items)} invalid wardrobe items: {', '.join(invalid_items)}")
+    wardrobe_snapshots.set(key, (list(wardrobe_items), wardrobe_objects))
+    return wardrobe_objects
+
+
+def prepare_outfit_prompt(user_message: str, weather_data: Dict, wardrobe_objects: List[WardrobeItem],
+                          target_occ: str, encoding: Optional[str] = None,
+                          include_examples: Optional[bool] = None) -> OutfitPrompt:
+    """
+    Filters the wardrobe for the occasion and weather and builds the generation prompt.
+    `encoding` and `include_examples` default to PROMPT_ENCODING and PROMPT_FEW_SHOT.
+    """
+    config = ai_config.get_occasion_config(target_occ)
+    compact = (encoding or PROMPT_ENCODING) == "compact"
+    include_examples = PROMPT_FEW_SHOT if include_examples is None else include_examples
+    
+    # Filter wardrobe items based on suitability
+    with metrics.span("filter"):
+        filtered_items = filter_suitable_items(wardrobe_objects, weather_data, target_occ)
+    
+    # If too few items remain after filtering, use the original list
+    if len(filtered_items) < 10:
+        logger.info("Too few items after filtering (%d). Using original wardrobe.", len(filtered_items))
+        filtered_items = list(wardrobe_objects)
+    
+    # Ensure we have at least one item of each required type
+    item_types_available = {}
+    for item in filtered_items:
+        if item.item_type not in item_types_available:
+            item_types_available[item.item_type] = []
+        item_types_available[item.item_type].append(item)
+    
+    # Check for required types
+    required_types = [ItemType.TOP, ItemType.BOTTOM, ItemType.SHOES]
+    missing_types = []
+    
+    for req_type in required_types:
+        if req_type not in item_types_available or not item_types_available[req_type]:
+            missing_types.append(req_type)
+            
+    if missing_types:
+        logger.warning("Missing required item types: %s. Adding from original wardrobe.", 
+                      ", ".join(t.value for t in missing_types))
+        filtered_ids = {item.id for item in filtered_items}
+        for item in wardrobe_objects:
+            if item.item_type in missing_types and item.id not in filtered_ids:
+                filtered_items.append(item)
+    
+    # Keep the prompt within the token budget, best items first
+    tokens_before = sum(item_tokens(format_wardrobe_item(item, "i00" if compact else None))
+                        for item in filtered_items)
+    with metrics.span("prune"):
+        filtered_items = prune_for_prompt(filtered_items, weather_data, target_occ, compact=compact)
+    
+    # Format wardrobe items, with short aliases instead of UUIDs in compact mode
+    aliases = item_aliases(filtered_items) if compact else None
+    formatted_items, wardrobe_ids = format_wardrobe_items(filtered_items, aliases)
+    
+    # Set generation temperature based on occasion formality
+    generation_temp = ai_config.get_occasion_temperature(target_occ)
+    
+    # Categorize items by type for the prompt
+    categorized = categorize_wardrobe(filtered_items)
+    
+    # Add type counts to the prompt
+    type_counts = {item_type.value: len(items) for item_type, items in categorized.items() if items}
+    type_counts_str = ", ".join(f"{count} {item_type}" for item_type, count in type_counts.items())
+    
+    # Build the prompt with explicit guidance about required item types
+    with metrics.span("build_prompt"):
+        combined_prompt = build_prompt(
+            user_message=user_message,
+            weather_data=weather_data,
+            formatted_items=formatted_items,
+            target_occ=target_occ,
+            config=config,
+            compact=compact,
+            include_examples=include_examples
+        )
+    
+    # Add explicit instructions about composition requirements
+    combined_prompt += f"\n\nIMPORTANT REQUIREMENTS:\n"
+    combined_prompt += f"1. Each item ID must be unique in the outfit. Do not include the same item ID more than once.\n"
+    combined_prompt += f"2. EXACTLY ONE pair of shoes is required (shoes, item_type='shoes').\n"
+    combined_prompt += f"3. EXACTLY ONE bottom item is required (pants, skirt, shorts, item_type='bottom') UNLESS a dress or suit is included.\n"
+    combined_prompt += f"4. At least one top item is required (shirt, blouse, t-shirt, item_type='top') UNLESS a dress or suit is included.\n"
+    combined_prompt += f"5. Available item types in wardrobe: {type_counts_str}.\n"
+    combined_prompt += f"6. Double-check item types before finalizing - each item must have its correct type classification.\n"
+    
+    # Record the prompt size with and without pruning
+    prompt_tokens = estimate_tokens(combined_prompt)
+    wardrobe_tokens = sum(item_tokens(line) for line in formatted_items)
+    prompt_token_stats["prompts"] += 1
+    prompt_token_stats["tokens_unpruned"] += prompt_tokens - wardrobe_tokens + tokens_before
+    prompt_token_stats["tokens"] += prompt_tokens
+    logger.info("Outfit prompt: %d of %d candidate items, ~%d tokens (~%d unpruned)",
+                len(filtered_items), len(wardrobe_objects), prompt_tokens,
+                prompt_tokens - wardrobe_tokens + tokens_before)
+    
+    # Generate outfit suggestion
+    messages = [
+        SystemMessage(content=combined_prompt),
+        HumanMessage(content="Please provide your final refined JSON output.")
+    ]
+    
+    return OutfitPrompt(
+        target_occ=target_occ,
+        temperature=generation_temp,
+        combined_prompt=combined_prompt,
+        messages=messages,
+        wardrobe_ids=wardrobe_ids,
+        # Read-only dictionary views of the items for validation
+        outfit_items_dict=[item.view() for item in filtered_items],
+        aliases={alias: item_id for item_id, alias in (aliases or {}).items()}
+    )
+
+
+def finalize_outfit(generated: str, prompt: OutfitPrompt) -> Tuple[Dict, Optional[List]]:
+    """
+    Parses and validates the LLM's outfit. Returns the validated outfit and, when critical
+    composition requirements are missing, the messages for one retry (otherwise None).
+    """
+    # Optionally remove stray chain-of-thought text if present
+    if "### Output:" in generated:
+        generated = generated.split("### Output:")[-1].strip()
+    
+    # Extract JSON content if wrapped in markdown code blocks
+    if "```json" in generated:
+        generated = generated.split("```json")[1].split("```")[0].strip()
+    elif "```" in generated:
+        generated = generated.split("```")[1].strip()
+    
+    try:
+        outfit_json = json.loads(generated)
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse LLM output as JSON: {str(e)}\nOutput: {generated}")
+        raise ValueError("Failed to generate valid outfit JSON")
+    
+    # Validate and enhance outfit
+    validated_outfit = validate_outfit(outfit_json, prompt.wardrobe_ids, prompt.target_occ, prompt.outfit_items_dict,
+                                       prompt.aliases)
+    
+    # Double check composition requirements are met
+    valid_composition, composition_reason, item_counts = validate_outfit_composition(validated_outfit.get("outfit_items", []))
+    if not valid_composition:
+        logger.warning("Outfit composition invalid after validation: %s", composition_reason)
+        # Add warnings to the outfit
+        validated_outfit["warnings"] = validated_outfit.get("warnings", []) + [f"Composition issue: {composition_reason}"]
+        
+        # If critical requirements are missing, retry with a clearer prompt once
+        if "Missing shoes" in composition_reason or "Too many shoes" in composition_reason or "Missing bottom" in composition_reason:
+            logger.info("Critical composition requirements missing. Retrying with clearer prompt.")
+            retry_prompt = prompt.combined_prompt + f"\n\nPREVIOUS ATTEMPT FAILED: {composition_reason}. Please strictly adhere to the outfit composition requirements."
+            
+            # Retry generation
+            return validated_outfit, [
+                SystemMessage(content=retry_prompt),
+                HumanMessage(content="Please provide your final refined JSON output, ensuring exactly one pair of shoes and exactly one bottom item (unless a dress/suit is included).")
+            ]
+    
+    return validated_outfit, None
+
+
+def finalize_retry(generated: str, prompt: OutfitPrompt, validated_outfit: Dict) -> Dict:
+    """Uses the retry's outfit if it fixes the composition issues, otherwise keeps the original."""
+    # Parse and validate the retry
+    if "```json" in generated:
+        generated = generated.split("```json")[1].split("```")[0].strip()
+    elif "```" in generated:
+        generated = generated.split("```")[1].strip()
+    
+    try:
+        retry_outfit_json = json.loads(generated)
+        retry_validated_outfit = validate_outfit(retry_outfit_json, prompt.wardrobe_ids, prompt.target_occ,
+                                                 prompt.outfit_items_dict, prompt.aliases)
+        
+        # Check if the retry fixed the issues
+        retry_valid, retry_reason, _ = validate_outfit_composition(retry_validated_outfit.get("outfit_items", []))
+        if retry_valid:
+            logger.info("Retry successful. Using retry outfit.")
+            return retry_validated_outfit
+        logger.warning("Retry failed: %s. Using original outfit with warnings.", retry_reason)
+    except Exception as e:
+        logger.error("Error in retry parsing: %s", e)
+    return validated_outfit
+
+
+def retry_failed(error: Exception) -> Exception:
+    """
+    Logs a failed retry call. The first outfit, already validated and carrying its
+    composition warning, is still returned (not cached, so the next request tries again).
+    """
+    logger.error("Outfit retry call failed, keeping the first outfit: %s", error)
+    metrics.count("outfit_retry_error")
+    return error
+
+
+def outfit_error_response(target_occ: Optional[str], error: Exception) -> Dict:
+    """The outfit returned to the user when generation fails."""
+    if isinstance(error, json.JSONDecodeError):
+        logger.error("JSON parsing error: %s", error)
+        return {
+            "occasion": target_occ or "unknown",
+            "outfit_items": [],
+            "description": "Failed to generate a valid outfit. Please try again.",
+            "styling_tips": "Try again with a more specific request.",
+            "warnings": ["Failed to parse generated output as JSON."]
+        }
+    logger.error("Error in generateOutfit: %s", error)
+    return {
+        "occasion": target_occ or "unknown",
+        "outfit_items": [],
+        "description": "An error occurred while generating your outfit. Please try again.",
+        "styling_tips": "Try again with a more specific request.",
+        "warnings": [f"Error: {str(error)}"]
+    }
+
+
+def local_occasion(user_message: str) -> str:
+    """The occasion found without the LLM, as fast mode uses it; counted as "fast" in occasion_sources."""
+    occasion_sources["fast"] += 1
+    return classify_locally(user_message, count=False) or fallback_determineOccasions(user_message)
+
+
+def fast_outfit(user_message: str, weather_data: Dict, wardrobe_objects: List[WardrobeItem],
+                target_occ: Optional[str] = None) -> Dict:
+    """Outfit from the local solver, with the occasion also found locally; no LLM calls."""
+    # Imported here because the solver builds on this module
+    from api.llm.solver import solve_outfit
+    
+    target_occ = target_occ or local_occasion(user_message)
+    with metrics.span("solver"):
+        outfit = solve_outfit(wardrobe_objects, weather_data, target_occ)
+    if outfit is None:
+        raise ValueError("No valid outfit can be made from this wardrobe")
+    metrics.count("outfit_fast")
+    return outfit
+
+
+def solver_fallback(wardrobe_objects: Optional[List[WardrobeItem]], weather_data: Dict,
+                    target_occ: Optional[str], error: Exception) -> Dict:
+    """When LLM generation fails, answers with the local solver's outfit if it finds one."""
+    from api.llm.solver import solve_outfit
+    
+    if wardrobe_objects and target_occ:
+        try:
+            with metrics.span("solver"):
+                outfit = solve_outfit(wardrobe_objects, weather_data, target_occ)
+        except Exception as e:
+            logger.error("Error in outfit solver fallback: %s", e)
+            outfit = None
+        if outfit is not None:
+            logger.warning("Outfit generation failed (%s); using the local solver's outfit", error)
+            outfit["warnings"] = ["Generated from your wardrobe's rules because the AI stylist was unavailable."]
+            metrics.count("outfit_solver_fallback")
+            return outfit
+    metrics.count("outfit_error")
+    return outfit_error_response(target_occ, error)
+
+
+_record_lock = threading.Lock()
+
+
+def record_exchange(user_message: str, weather_data: Dict, wardrobe_items: List[Dict],
+                    prompt: OutfitPrompt, generated: str) -> None:
+    """Appends the prompt inputs and the LLM's response to OUTFIT_RECORD_PATH, if set."""
+    if not OUTFIT_RECORD_PATH:
+        return
+    record = {
+        "user_message": user_message,
+        "weather_data": weather_data,
+        "wardrobe": wardrobe_items,
+        "occasion": prompt.target_occ,
+        "aliases": prompt.aliases,
+        "response": generated,
+    }
+    try:
+        with _record_lock, open(OUTFIT_RECORD_PATH, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+    except OSError as e:
+        logger.warning("Failed to record outfit exchange: %s", e)
+
+
+async def arecord_exchange(user_message: str, weather_data: Dict, wardrobe_items: List[Dict],
+                           prompt: OutfitPrompt, generated: str) -> None:
+    """record_exchange for the async paths: the file write runs in a worker thread, off the event loop."""
+    if OUTFIT_RECORD_PATH:
+        await asyncio.to_thread(record_exchange, user_message, weather_data, wardrobe_items, prompt, generated)
+
+
+def cache_outfit(cache_key: tuple, outfit: Dict) -> None:
+    """Keeps the outfit as a cached alternative if it passed composition checks."""
+    valid, _, _ = validate_outfit_composition(outfit.get("outfit_items", []))
+    if valid and outfit.get("outfit_items"):
+        outfit_cache.add(cache_key, outfit)
+
+
+def generateOutfit(user_message: str, weather_data: Dict, wardrobe_items: List[Dict],
+                   regenerate: bool = False, mode: str = "llm", occasion: Optional[str] = None) -> Dict:
     """
     Generates an outfit suggestion based on the user's message, weather data,
     and wardrobe items.
     
+    Validated outfits are cached by wardrobe contents, occasion and weather bucket
+    (see outfit_cache); a cached alternative is returned when one exists. If the
+    LLM fails, the local solver's outfit is returned instead of an error.
+    
     Args:
         user_message: The user's query or request
         weather_data: Weather data dictionary containing temperature, description, etc.
         wardrobe_items: List of items from the user's wardrobe
+        regenerate: Skip the cache and ask the LLM for a new outfit
+        mode: "llm", or "fast" to use only the local solver
+        occasion: The occasion, if the caller already detected it; detected here otherwise
         
     Returns:
         A dictionary with occasion, outfit items, and description
     """
+    target_occ = None
+    wardrobe_objects = None
     try:
         # Convert wardrobe items to WardrobeItem objects with error handling
-        wardrobe_objects = []
-        invalid_items = []
-        
-        for item in wardrobe_items:
-            try:
-                wardrobe_objects.append(WardrobeItem.from_dict(item))
-            except ValueError as e:
-                logger.warning(f"Skipping invalid wardrobe item: {str(e)}")
-                invalid_items.append(item.get('id', 'unknown'))
-                continue
-        
-        if not wardrobe_objects:
-            raise ValueError("No valid wardrobe items found")
-            
-        if invalid_items:
-            logger.warning(f"Skipped {len(invalid_items)} invalid wardrobe items: {', '.join(invalid_items)}")
+        with metrics.span("parse_wardrobe"):
+            wardrobe_objects = parse_wardrobe(wardrobe_items)
+        if mode == "fast":
+            return fast_outfit(user_message, weather_data, wardrobe_objects, occasion)
         
         # Determine target occasion and configuration
-        target_occ = determineOccasions(user_message)
-        config = ai_config.get_occasion_config(target_occ)
+        target_occ = occasion
+        if target_occ is None:
+            with metrics.span("occasion"):
+                target_occ = determineOccasions(user_message)
+        with metrics.span("outfit_cache"):
+            cache_key = outfit_cache.key(wardrobe_items, target_occ, weather_signature(weather_data))
+            cached = None if regenerate else outfit_cache.get(cache_key)
+        if cached is not None:
+            metrics.count("outfit_cache_hit")
+            return cached
         
-        # Filter wardrobe items based on suitability
-        filtered_items = filter_suitable_items(wardrobe_objects, weather_data, target_occ)
-        
-        # If too few items remain after filtering, use the original list
-        if len(filtered_items) < 10:
-            logger.info("Too few items after filtering (%d). Using original wardrobe.", len(filtered_items))
-            filtered_items = wardrobe_objects
-        
-        # Ensure we have at least one item of each required type
-        item_types_available = {}
-        for item in filtered_items:
-            if item.item_type not in item_types_available:
-                item_types_available[item.item_type] = []
-            item_types_available[item.item_type].append(item)
-        
-        # Check for required types
-        required_types = [ItemType.TOP, ItemType.BOTTOM, ItemType.SHOES]
-        missing_types = []
-        
-        for req_type in required_types:
-            if req_type not in item_types_available or not item_types_available[req_type]:
-                missing_types.append(req_type)
-                
-        if missing_types:
-            logger.warning("Missing required item types: %s. Adding from original wardrobe.", 
-                          ", ".join(t.value for t in missing_types))
-            for item in wardrobe_objects:
-                if item.item_type in missing_types and item not in filtered_items:
-                    filtered_items.append(item)
-        
-        # Format wardrobe items
-        formatted_items, wardrobe_ids = format_wardrobe_items(filtered_items)
-        
-        # Set generation temperature based on occasion formality
-        generation_temp = ai_config.get_occasion_temperature(target_occ)
-        llm_client.with_temperature(generation_temp)
-        
-        # Categorize items by type for the prompt
-        categorized = categorize_wardrobe(filtered_items)
-        
-        # Add type counts to the prompt
-        type_counts = {item_type.value: len(items) for item_type, items in categorized.items() if items}
-        type_counts_str = ", ".join(f"{count} {item_type}" for item_type, count in type_counts.items())
-        
-        # Build the prompt with explicit guidance about required item types
-        combined_prompt = build_prompt(
-            user_message=user_message,
-            weather_data=weather_data,
-            formatted_items=formatted_items,
-            target_occ=target_occ,
-            config=config
-        )
-        
-        # Add explicit instructions about composition requirements
-        combined_prompt += f"\n\nIMPORTANT REQUIREMENTS:\n"
-        combined_prompt += f"1. Each item ID must be unique in the outfit. Do not include the same item ID more than once.\n"
-        combined_prompt += f"2. EXACTLY ONE pair of shoes is required (shoes, item_type='shoes').\n"
-        combined_prompt += f"3. EXACTLY ONE bottom item is required (pants, skirt, shorts, item_type='bottom') UNLESS a dress or suit is included.\n"
-        combined_prompt += f"4. At least one top item is required (shirt, blouse, t-shirt, item_type='top') UNLESS a dress or suit is included.\n"
-        combined_prompt += f"5. Available item types in wardrobe: {type_counts_str}.\n"
-        combined_prompt += f"6. Double-check item types before finalizing - each item must have its correct type classification.\n"
+        prompt = prepare_outfit_prompt(user_message, weather_data, wardrobe_objects, target_occ)
         
-        # Generate outfit suggestion
-        messages = [
-            SystemMessage(content=combined_prompt),
-            HumanMessage(content="Please provide your final refined JSON output.")
-        ]
-        
-        generated = llm_client.invoke(messages)
-        
-        # Optionally remove stray chain-of-thought text if present
-        if "### Output:" in generated:
-            generated = generated.split("### Output:")[-1].strip()
-        
-        # Extract JSON content if wrapped in markdown code blocks
-        if "```json" in generated:
-            generated = generated.split("```json")[1].split("```")[0].strip()
-        elif "```" in generated:
-            generated = generated.split("```")[1].strip()
+        with metrics.span("llm"):
+            generated = llm_client.invoke(prompt.messages, temperature=prompt.temperature)
+        record_exchange(user_message, weather_data, wardrobe_items, prompt, generated)
+        with metrics.span("validate"):
+            validated_outfit, retry_messages = finalize_outfit(generated, prompt)
+        retry_error = None
+        if retry_messages:
+            metrics.count("outfit_retry")
+            try:
+                with metrics.span("retry_llm"):
+                    generated = llm_client.invoke(retry_messages, temperature=prompt.temperature)
+            except Exception as e:
+                retry_error = retry_failed(e)
+            else:
+                with metrics.span("retry_validate"):
+                    validated_outfit = finalize_retry(generated, prompt, validated_outfit)
         
-        try:
-            outfit_json = json.loads(generated)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse LLM output as JSON: {str(e)}\nOutput: {generated}")
-            raise ValueError("Failed to generate valid outfit JSON")
+        if retry_error is None:
+            cache_outfit(cache_key, validated_outfit)
+        metrics.count("outfit_llm")
+        return validated_outfit
+    except Exception as e:
+        return solver_fallback(wardrobe_objects, weather_data, target_occ, e)
+
+
+async def agenerateOutfit(user_message: str, weather_data: Dict, wardrobe_items: List[Dict],
+                          deadline: Optional[float] = None, regenerate: bool = False, mode: str = "llm",
+                          occasion: Optional[str] = None) -> Dict:
+    """
+    Async version of generateOutfit. LLM calls go through llm_client.ainvoke, so they count
+    against the global concurrency cap and share `deadline` (a time.monotonic() value).
+    Cancelling the task cancels the in-flight LLM request.
+    """
+    target_occ = None
+    wardrobe_objects = None
+    try:
+        with metrics.span("parse_wardrobe"):
+            wardrobe_objects = parse_wardrobe(wardrobe_items)
+        if mode == "fast":
+            return fast_outfit(user_message, weather_data, wardrobe_objects, occasion)
         
-        # Convert outfit items back to dictionaries for validation
-        outfit_items_dict = [item.to_dict() for item in filtered_items]
+        target_occ = occasion
+        if target_occ is None:
+            with metrics.span("occasion"):
+                target_occ = await adetermineOccasions(user_message, deadline=deadline)
+        with metrics.span("outfit_cache"):
+            cache_key = outfit_cache.key(wardrobe_items, target_occ, weather_signature(weather_data))
+            cached = None if regenerate else outfit_cache.get(cache_key)
+        if cached is not None:
+            metrics.count("outfit_cache_hit")
+            return cached
         
-        # Validate and enhance outfit
-        validated_outfit = validate_outfit(outfit_json, wardrobe_ids, target_occ, outfit_items_dict)
+        prompt = prepare_outfit_prompt(user_message, weather_data, wardrobe_objects, target_occ)
         
-        # Double check composition requirements are met
-        valid_composition, composition_reason, item_counts = validate_outfit_composition(validated_outfit.get("outfit_items", []))
-        if not valid_composition:
-            logger.warning("Outfit composition invalid after validation: %s", composition_reason)
-            # Add warnings to the outfit
-            validated_outfit["warnings"] = validated_outfit.get("warnings", []) + [f"Composition issue: {composition_reason}"]
-            
-            # If critical requirements are missing, retry with a clearer prompt once
-            if "Missing shoes" in composition_reason or "Too many shoes" in composition_reason or "Missing bottom" in composition_reason:
-                logger.info("Critical composition requirements missing. Retrying with clearer prompt.")
-                combined_prompt += f"\n\nPREVIOUS ATTEMPT FAILED: {composition_reason}. Please strictly adhere to the outfit composition requirements."
-                
-                # Retry generation
-                messages = [
-                    SystemMessage(content=combined_prompt),
-                    HumanMessage(content="Please provide your final refined JSON output, ensuring exactly one pair of shoes and exactly one bottom item (unless a dress/suit is included).")
-                ]
-                
-                generated = llm_client.invoke(messages)
-                
-                # Parse and validate the retry
-                if "```json" in generated:
-                    generated = generated.split("```json")[1].split("```")[0].strip()
-                elif "```" in generated:
-                    generated = generated.split("```")[1].strip()
-                
-                try:
-                    retry_outfit_json = json.loads(generated)
-                    retry_validated_outfit = validate_outfit(retry_outfit_json, wardrobe_ids, target_occ, outfit_items_dict)
-                    
-                    # Check if the retry fixed the issues
-                    retry_valid, retry_reason, _ = validate_outfit_composition(retry_validated_outfit.get("outfit_items", []))
-                    if retry_valid:
-                        logger.info("Retry successful. Using retry outfit.")
-                        validated_outfit = retry_validated_outfit
-                    else:
-                        logger.warning("Retry failed: %s. Using original outfit with warnings.", retry_reason)
-                except Exception as e:
-                    logger.error("Error in retry parsing: %s", e)
+        with metrics.span("llm"):
+            generated = await llm_client.ainvoke(prompt.messages, temperature=prompt.temperature, deadline=deadline)
+        await arecord_exchange(user_message, weather_data, wardrobe_items, prompt, generated)
+        with metrics.span("validate"):
+            validated_outfit, retry_messages = finalize_outfit(generated, prompt)
+        retry_error = None
+        if retry_messages:
+            metrics.count("outfit_retry")
+            try:
+                with metrics.span("retry_llm"):
+                    generated = await llm_client.ainvoke(retry_messages, temperature=prompt.temperature,
+                                                         deadline=deadline)
+            except Exception as e:
+                retry_error = retry_failed(e)
+            else:
+                with metrics.span("retry_validate"):
+                    validated_outfit = finalize_retry(generated, prompt, validated_outfit)
         
+        if retry_error is None:
+            cache_outfit(cache_key, validated_outfit)
+        metrics.count("outfit_llm")
         return validated_outfit
-        
-    except json.JSONDecodeError as e:
-        logger.error("JSON parsing error: %s in: %s", e, generated)
-        outfit_json = {
-            "occasion": target_occ if 'target_occ' in locals() else "unknown",
-            "outfit_items": [],
-            "description": "Failed to generate a valid outfit. Please try again.",
-            "styling_tips": "Try again with a more specific request.",
-            "warnings": ["Failed to parse generated output as JSON."]
-        }
     except Exception as e:
-        logger.error("Error in generateOutfit: %s", e)
-        outfit_json = {
-            "occasion": target_occ if 'target_occ' in locals() else "unknown",
-            "outfit_items": [],
-            "description": "An error occurred while generating your outfit. Please try again.",
-            "styling_tips": "Try again with a more specific request.",
-            "warnings": [f"Error: {str(e)}"]
-        }
-    
-    return outfit_json
\ No newline at end of file
+        return solver_fallback(wardrobe_objects, weather_data, target_occ, e)
@@ -0,0 +1,129 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Set
+
+from dotenv import load_dotenv
+
+from api.cache import TTLCache
+from api.llm.config import ai_config
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+OUTFIT_CACHE_SIZE = int(os.getenv("OUTFIT_CACHE_SIZE", "5000"))  # distinct (wardrobe, occasion, weather) keys
+OUTFIT_CACHE_TTL = float(os.getenv("OUTFIT_CACHE_TTL", "86400"))  # seconds
+OUTFIT_CACHE_ALTERNATIVES = int(os.getenv("OUTFIT_CACHE_ALTERNATIVES", "3"))  # outfits kept per key
+USER_KEYS_PRUNE_AT = 64  # a user's tracked keys are pruned to the live ones past this many
+
+# The wardrobe fields that reach the outfit prompt; other columns (favorite, image_link) don't affect outfits
+PROMPT_FIELDS = (
+    "id", "item_type", "material", "color", "formality", "pattern", "fit",
+    "suitable_for_weather", "suitable_for_occasion", "sub_type",
+)
+
+
+def wardrobe_hash(wardrobe_items: List[Dict]) -> str:
+    """Content hash of the prompt-relevant fields of a wardrobe, independent of row order."""
+    rows = sorted(
+        (tuple(str(item.get(field) or "") for field in PROMPT_FIELDS) for item in wardrobe_items)
+    )
+    return hashlib.sha256(json.dumps(rows).encode()).hexdigest()[:24]
+
+
+@dataclass
+class _Alternatives:
+    """A key's cached outfits and how many times they have been served (for the rotation)."""
+    outfits: List[Dict]
+    served: int = 0
+
+
+@dataclass
+class _UserWardrobe:
+    """The wardrobe hash last seen for a user and the cache keys looked up with it."""
+    digest: str
+    keys: Set[Hashable] = field(default_factory=set)
+
+
+class OutfitCache:
+    """
+    Validated outfits by (wardrobe hash, occasion, weather signature).
+
+    Each key keeps up to `alternatives` outfits and serves them in rotation, so
+    repeated requests still see some variety. A user's entries are dropped as
+    soon as a different wardrobe hash is seen for them, and the AI config
+    fingerprint is part of the key so config edits start afresh. The rotation
+    counter lives in the entry and the per-user key sets in a TTLCache of the
+    same size and TTL, so all bookkeeping is bounded and expires with the outfits.
+    """
+
+    def __init__(self, max_size: int = OUTFIT_CACHE_SIZE, ttl: float = OUTFIT_CACHE_TTL,
+                 alternatives: int = OUTFIT_CACHE_ALTERNATIVES):
+        self.alternatives = alternatives
+        self._entries = TTLCache(max_size=max_size, ttl=ttl)
+        self._users = TTLCache(max_size=max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    def key(self, wardrobe_items: List[Dict], occasion: str, weather_signature: tuple) -> tuple:
+        digest = wardrobe_hash(wardrobe_items)
+        key = ai_config.fingerprint, digest, occasion, weather_signature
+        user_id = next((item.get("user_id") for item in wardrobe_items if item.get("user_id")), None)
+        if user_id:
+            self._track(user_id, digest, key)
+        return key
+
+    def get(self, key: tuple) -> Optional[Dict]:
+        """Next cached alternative for the key (a copy), or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        with self._lock:
+            index = entry.served % len(entry.outfits)
+            entry.served = index + 1
+            outfit = entry.outfits[index]
+        return copy.deepcopy(outfit)
+
+    def add(self, key: tuple, outfit: Dict) -> None:
+        """Store an outfit as one more alternative for the key, replacing the oldest when full."""
+        with self._lock:
+            entry = self._entries.get(key)
+            outfits = (entry.outfits if entry is not None else []) + [copy.deepcopy(outfit)]
+            self._entries.set(key, _Alternatives(outfits[-self.alternatives:], entry.served if entry else 0))
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop every cached outfit built from the user's wardrobe."""
+        with self._lock:
+            self._drop_user(self._users.pop(user_id))
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries.stats()
+        return {**entries, "users": len(self._users), "invalidations": self.invalidations}
+
+    def _track(self, user_id: str, digest: str, key: tuple) -> None:
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None or user.digest != digest:
+                self._drop_user(user)
+                user = _UserWardrobe(digest)
+            if key not in user.keys and len(user.keys) >= USER_KEYS_PRUNE_AT:
+                user.keys = {k for k in user.keys if k in self._entries}
+            user.keys.add(key)
+            self._users.set(user_id, user)
+
+    def _drop_user(self, user: Optional[_UserWardrobe]) -> None:
+        if user is None:
+            return
+        dropped = [key for key in user.keys if self._entries.pop(key) is not None]
+        if dropped:
+            self.invalidations += 1
+
+
+# Create a singleton outfit cache
+outfit_cache = OutfitCache()
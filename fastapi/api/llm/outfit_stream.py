@@ -0,0 +1,188 @@
+"""
+Streaming outfit generation.
+
+The LLM's answer is read as it is generated. OutfitItemStream scans the text
+incrementally and hands over each `outfit_items` entry as soon as its closing
+brace arrives; the entry is checked against the wardrobe (OutfitItemChecker)
+and sent to the client right away. When the answer is complete it goes through
+the same validation, retry and fallback as agenerateOutfit; streamed items the
+final outfit dropped are withdrawn, and the items it added, the description,
+styling tips, warnings and the outfit itself follow.
+"""
+import json
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from api import metrics
+from api.llm.client import llm_client
+from api.llm.occasion import adetermineOccasions
+from api.llm.outfit import (
+    OutfitItemChecker, arecord_exchange, cache_outfit, fast_outfit, finalize_outfit, finalize_retry, outfit_cache,
+    parse_wardrobe, prepare_outfit_prompt, retry_failed, solver_fallback, weather_signature,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class OutfitItemStream:
+    """
+    Incremental scanner for the outfit JSON. Text outside a JSON object (reasoning,
+    code fences) is skipped; inside one, strings, nesting and keys are tracked, so
+    an entry of the top-level "outfit_items" array is returned once it is complete.
+    A top-level object without that key (e.g. braces in the reasoning) is dropped
+    and scanning starts over at the next one.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.stack: List[List] = []  # [kind ("{" or "["), start offset, current key, expecting a key]
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Adds the next piece of the answer and returns the outfit items completed by it."""
+        self.text += chunk
+        items = []
+        text, stack = self.text, self.stack
+        for pos in range(self.pos, len(text)):
+            c = text[pos]
+            if not stack:
+                if c == "{":
+                    stack.append(["{", pos, None, True])
+                continue
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    top = stack[-1]
+                    if top[0] == "{" and top[3]:
+                        top[2] = self._load(self.string_start, pos + 1)
+                continue
+            if c == '"':
+                self.in_string = True
+                self.string_start = pos
+            elif c in "{[":
+                stack.append([c, pos, None, c == "{"])
+            elif c in "}]":
+                kind, start = stack.pop()[:2]
+                # An object in the array under the top-level object's "outfit_items" key
+                if kind == "{" and len(stack) == 2 and stack[0][2] == "outfit_items" and stack[1][0] == "[":
+                    item = self._load(start, pos + 1)
+                    if isinstance(item, dict):
+                        items.append(item)
+            elif c == ":":
+                stack[-1][3] = False
+            elif c == "," and stack[-1][0] == "{":
+                stack[-1][3] = True
+        self.pos = len(text)
+        return items
+
+    def _load(self, start: int, end: int):
+        try:
+            return json.loads(self.text[start:end])
+        except json.JSONDecodeError:
+            return None
+
+
+def outfit_events(outfit: Dict, streamed: Dict[str, Dict], occasion_sent: bool = True) -> List[Tuple[str, Dict]]:
+    """
+    The events that finish a streamed outfit: the occasion if it wasn't sent yet,
+    removals of streamed items the final outfit dropped, its items not streamed yet,
+    then the text fields and the outfit.
+    """
+    events = []
+    if not occasion_sent:
+        events.append(("occasion", {"occasion": outfit.get("occasion")}))
+    final_ids = {item.get("id") for item in outfit.get("outfit_items", [])}
+    for item_id in streamed:
+        if item_id not in final_ids:
+            events.append(("remove", {"id": item_id}))
+    for item in outfit.get("outfit_items", []):
+        if item.get("id") not in streamed:
+            events.append(("item", item))
+    for name in ("description", "styling_tips", "warnings"):
+        if outfit.get(name):
+            events.append((name, {name: outfit[name]}))
+    events.append(("done", outfit))
+    return events
+
+
+async def astreamOutfit(user_message: str, weather_data: Dict, wardrobe_items: List[Dict],
+                        deadline: Optional[float] = None, regenerate: bool = False, mode: str = "llm",
+                        occasion: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Streaming version of agenerateOutfit, yielding (event, data) pairs:
+
+        occasion      {"occasion": ...} once the occasion is known
+        item          an outfit item, as soon as it has been checked against the wardrobe
+        remove        {"id": ...} for a streamed item the final outfit doesn't keep
+        description, styling_tips, warnings
+                      {name: value}, from the validated outfit
+        done          the complete outfit, as agenerateOutfit would return it
+
+    Cached, fast-mode and fallback outfits are sent the same way, all at once.
+    """
+    target_occ = None
+    wardrobe_objects = None
+    streamed: Dict[str, Dict] = {}
+    try:
+        with metrics.span("parse_wardrobe"):
+            wardrobe_objects = parse_wardrobe(wardrobe_items)
+        if mode == "fast":
+            outfit = fast_outfit(user_message, weather_data, wardrobe_objects, occasion)
+        else:
+            target_occ = occasion
+            if target_occ is None:
+                with metrics.span("occasion"):
+                    target_occ = await adetermineOccasions(user_message, deadline=deadline)
+            yield "occasion", {"occasion": target_occ}
+
+            with metrics.span("outfit_cache"):
+                cache_key = outfit_cache.key(wardrobe_items, target_occ, weather_signature(weather_data))
+                outfit = None if regenerate else outfit_cache.get(cache_key)
+            if outfit is not None:
+                metrics.count("outfit_cache_hit")
+            else:
+                prompt = prepare_outfit_prompt(user_message, weather_data, wardrobe_objects, target_occ)
+                checker = OutfitItemChecker(prompt.wardrobe_ids, prompt.outfit_items_dict, prompt.aliases)
+                parser = OutfitItemStream()
+                chunks = []
+                with metrics.span("llm_stream"):
+                    async for chunk in llm_client.astream(prompt.messages, temperature=prompt.temperature,
+                                                          deadline=deadline):
+                        chunks.append(chunk)
+                        for candidate in parser.feed(chunk):
+                            item = checker.check(candidate)
+                            if item is not None:
+                                streamed[item["id"]] = item
+                                yield "item", item
+                generated = "".join(chunks)
+                await arecord_exchange(user_message, weather_data, wardrobe_items, prompt, generated)
+
+                with metrics.span("validate"):
+                    outfit, retry_messages = finalize_outfit(generated, prompt)
+                retry_error = None
+                if retry_messages:
+                    metrics.count("outfit_retry")
+                    try:
+                        with metrics.span("retry_llm"):
+                            generated = await llm_client.ainvoke(retry_messages, temperature=prompt.temperature,
+                                                                 deadline=deadline)
+                    except Exception as e:
+                        retry_error = retry_failed(e)
+                    else:
+                        with metrics.span("retry_validate"):
+                            outfit = finalize_retry(generated, prompt, outfit)
+                if retry_error is None:
+                    cache_outfit(cache_key, outfit)
+                metrics.count("outfit_llm")
+    except Exception as e:
+        outfit = solver_fallback(wardrobe_objects, weather_data, target_occ, e)
+
+    for event in outfit_events(outfit, streamed, occasion_sent=target_occ is not None):
+        yield event
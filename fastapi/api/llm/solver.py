@@ -0,0 +1,255 @@
+"""
+LLM-free outfit engine.
+
+Builds outfits directly from the rules in outfit.py: every candidate satisfies
+validate_outfit_composition and check_style_coherence, and is scored on how
+well its items suit the occasion (the item's own occasion tags, the occasion's
+item list in ai_config.json and its strictness), the weather and each other.
+
+The search is pruned by category: only the best SOLVER_BEAM items of each
+item type (by their own score) are combined, cores of shoes + bottom/dress/suit
++ tops are enumerated exhaustively, and the best cores are then completed with
+outerwear and an accessory greedily. Results come back in a few milliseconds
+even for large wardrobes.
+"""
+import heapq
+import itertools
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from api.attributes import canonical
+from api.llm.config import ai_config
+from api.llm.outfit import (
+    FormalityLevel,
+    ItemType,
+    WardrobeItem,
+    categorize_wardrobe,
+    check_style_coherence,
+    filter_suitable_items,
+    validate_outfit_composition,
+)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SOLVER_BEAM = int(os.getenv("SOLVER_BEAM", "6"))  # best items per category considered
+
+# Formality on one scale, so an outfit's spread and its distance to the occasion can be measured
+FORMALITY_RANK = {
+    FormalityLevel.VERY_LOW: 0, FormalityLevel.LOW: 1, FormalityLevel.CASUAL: 1,
+    FormalityLevel.SOMEWHAT_LOW: 2, FormalityLevel.SMART_CASUAL: 2.5, FormalityLevel.MEDIUM: 3,
+    FormalityLevel.BUSINESS_CASUAL: 3, FormalityLevel.SOMEWHAT_HIGH: 4, FormalityLevel.COCKTAIL: 4,
+    FormalityLevel.HIGH: 5, FormalityLevel.BUSINESS_FORMAL: 5, FormalityLevel.BLACK_TIE: 6,
+    FormalityLevel.WHITE_TIE: 6,
+}
+STRICTNESS_FORMALITY = {"extremely strict": 6, "strict": 4.5, "moderate": 3, "low": 1.5}
+NEUTRAL_COLORS = {"black", "white", "grey", "navy", "beige", "cream", "brown"}
+PLAIN_PATTERNS = {"", "solid", "none"}
+
+
+@dataclass
+class _Context:
+    """What the item scores depend on, computed once per solve."""
+    occasion: str
+    target_formality: float
+    occasion_items: List[str]
+    cold: bool
+    hot: bool
+
+
+def _context(weather_data: Dict, target_occ: str) -> _Context:
+    config = ai_config.get_occasion_config(target_occ)
+    temp = weather_data.get("temperature", 0) or 0
+    feels_like = weather_data.get("feels_like", temp) or temp
+    description = (weather_data.get("description") or "").lower()
+    wet = any(word in description for word in ["rain", "drizzle", "shower", "snow", "sleet", "flurries"])
+    return _Context(
+        occasion=target_occ,
+        target_formality=STRICTNESS_FORMALITY.get(str(config.get("strictness", "")).lower(), 3),
+        occasion_items=[canonical("sub_type", name) for name in config.get("items", [])],
+        cold=feels_like < 15 or "cold" in description or wet,
+        hot=feels_like > 25 or "hot" in description,
+    )
+
+
+def score_item(item: WardrobeItem, ctx: _Context, weather_data: Dict) -> float:
+    """How well one item suits the occasion and weather on its own."""
+    score = 0.0
+    if item.is_suitable_for_occasion(ctx.occasion):
+        score += 3
+    sub_type = canonical("sub_type", item.sub_type)
+    if any(name and (name in sub_type or sub_type in name) for name in ctx.occasion_items):
+        score += 2
+    if item.item_type not in (ItemType.ACCESSORY, ItemType.SHOES):
+        score += 1 if item.is_suitable_for_weather(weather_data) else -1
+    score -= 0.5 * abs(FORMALITY_RANK.get(item.formality, 3) - ctx.target_formality)
+    if item.favorite:
+        score += 0.5
+    return score
+
+
+class _Features:
+    """Per-item values the outfit checks read, computed once per solve."""
+    __slots__ = ("score", "rank", "color", "patterned", "outerwear", "formality")
+
+    def __init__(self, item: WardrobeItem, score: float):
+        self.score = score
+        self.rank = FORMALITY_RANK.get(item.formality, 3)
+        self.color = (item.color or "").lower()
+        self.patterned = (item.pattern or "").lower() not in PLAIN_PATTERNS
+        self.outerwear = item.item_type == ItemType.OUTERWEAR
+        self.formality = item.formality.value
+
+
+def _coherent(features: List[_Features]) -> bool:
+    """The check_style_coherence rules, on precomputed features."""
+    formalities = {f.formality for f in features}
+    if "formal" in formalities and "casual" in formalities:
+        return False
+    if sum(f.patterned for f in features) > 2:
+        return False
+    return len({f.color for f in features}) <= 4
+
+
+def score_outfit(features: List[_Features], ctx: _Context) -> float:
+    """Mean item score plus how well the items go together and with the weather."""
+    score = sum(f.score for f in features) / len(features)
+    ranks = [f.rank for f in features]
+    score -= 0.5 * (max(ranks) - min(ranks))
+    score -= 0.5 * max(0, len({f.color for f in features} - NEUTRAL_COLORS) - 1)
+    score -= 0.5 * max(0, sum(f.patterned for f in features) - 1)
+    outerwear = any(f.outerwear for f in features)
+    if ctx.cold:
+        score += 1.5 if outerwear else -1.5
+    elif ctx.hot and outerwear:
+        score -= 1.5
+    return score
+
+
+def _cores(categories: Dict[ItemType, List[WardrobeItem]]):
+    """Every shoes + (bottom + 1-2 tops | dress or suit + 0-1 top) combination of the pruned items."""
+    tops = categories[ItemType.TOP]
+    bases = []
+    for bottom in categories[ItemType.BOTTOM]:
+        bases += [(bottom, top) for top in tops]
+        bases += [(bottom, *pair) for pair in itertools.combinations(tops, 2)]
+    for one_piece in categories[ItemType.DRESS] + categories[ItemType.SUIT]:
+        bases += [(one_piece,)] + [(one_piece, top) for top in tops]
+    for shoes in categories[ItemType.SHOES]:
+        for base in bases:
+            yield (shoes, *base)
+
+
+def _complete(core: Tuple[WardrobeItem, ...], categories, features, ctx) -> Tuple[float, Tuple[WardrobeItem, ...]]:
+    """Greedily adds up to two outerwear pieces and one accessory while they raise the score."""
+    best = core
+    best_score = score_outfit([features[item.id] for item in core], ctx)
+    for item_type, limit in ((ItemType.OUTERWEAR, 2), (ItemType.ACCESSORY, 1)):
+        for _ in range(limit):
+            improved = None
+            for extra in categories[item_type]:
+                if extra in best:
+                    continue
+                candidate = best + (extra,)
+                candidate_features = [features[item.id] for item in candidate]
+                if not _coherent(candidate_features):
+                    continue
+                candidate_score = score_outfit(candidate_features, ctx)
+                if candidate_score > best_score:
+                    improved, best_score = candidate, candidate_score
+            if improved is None:
+                break
+            best = improved
+    return best_score, best
+
+
+def solve_outfits(wardrobe_objects: List[WardrobeItem], weather_data: Dict, target_occ: str,
+                  k: int = 3, beam: int = SOLVER_BEAM) -> List[Tuple[float, List[WardrobeItem]]]:
+    """
+    The k best valid outfits as (score, items), best first; empty if the wardrobe
+    can't make a valid outfit (e.g. no shoes).
+    """
+    ctx = _context(weather_data, target_occ)
+    candidates = filter_suitable_items(wardrobe_objects, weather_data, target_occ)
+    pool = categorize_wardrobe(candidates)
+    everything = categorize_wardrobe(wardrobe_objects)
+    # Like prepare_outfit_prompt: fall back to the whole wardrobe for types the filter emptied
+    for item_type, items in pool.items():
+        if not items:
+            pool[item_type] = everything[item_type]
+
+    scores = {item.id: score_item(item, ctx, weather_data) for items in pool.values() for item in items}
+    categories = {
+        item_type: heapq.nlargest(beam, items, key=lambda item: scores[item.id])
+        for item_type, items in pool.items()
+    }
+    features = {item.id: _Features(item, scores[item.id]) for items in categories.values() for item in items}
+
+    # Keep the best cores, then complete only those
+    scored_cores = []
+    for core in _cores(categories):
+        core_features = [features[item.id] for item in core]
+        if _coherent(core_features):
+            scored_cores.append((score_outfit(core_features, ctx), core))
+    best_cores = heapq.nlargest(max(k * 4, 8), scored_cores, key=lambda entry: entry[0])
+    completed = {}
+    for _, core in best_cores:
+        score, items = _complete(core, categories, features, ctx)
+        completed.setdefault(frozenset(item.id for item in items), (score, items))
+
+    results = []
+    for score, items in sorted(completed.values(), key=lambda entry: entry[0], reverse=True):
+        item_dicts = [item.view() for item in items]
+        if validate_outfit_composition(item_dicts)[0] and check_style_coherence(item_dicts)[0]:
+            results.append((score, list(items)))
+        if len(results) == k:
+            break
+    return results
+
+
+def describe_outfit(items: List[WardrobeItem], target_occ: str, weather_data: Dict) -> Tuple[str, str]:
+    """A template description and styling tip for a solved outfit."""
+    names = ", ".join(f"{item.color} {item.sub_type}".strip() for item in items)
+    description = f"A {target_occ} outfit built from your wardrobe: {names}."
+    ctx = _context(weather_data, target_occ)
+    outerwear = [item for item in items if item.item_type == ItemType.OUTERWEAR]
+    if ctx.cold and outerwear:
+        tip = f"Layer the {outerwear[0].sub_type} over the rest for warmth."
+    elif ctx.hot:
+        tip = "Keep the layers light and breathable in the heat."
+    else:
+        tip = "Keep accessories minimal so the main pieces stand out."
+    return description, tip
+
+
+def solve_outfit(wardrobe_objects: List[WardrobeItem], weather_data: Dict, target_occ: str,
+                 k: int = 3) -> Optional[Dict]:
+    """
+    The best solved outfit in the same shape as the LLM's (with the other top-k
+    as "alternatives"), or None if no valid outfit exists.
+    """
+    solutions = solve_outfits(wardrobe_objects, weather_data, target_occ, k=k)
+    if not solutions:
+        return None
+
+    def as_outfit(items: List[WardrobeItem]) -> Dict:
+        description, tip = describe_outfit(items, target_occ, weather_data)
+        return {
+            "occasion": target_occ,
+            "outfit_items": [
+                {"id": item.id, "sub_type": item.sub_type, "color": item.color, "item_type": item.item_type.value}
+                for item in items
+            ],
+            "description": description,
+            "styling_tips": tip,
+        }
+
+    outfit = as_outfit(solutions[0][1])
+    outfit["alternatives"] = [as_outfit(items) for _, items in solutions[1:]]
+    return outfit
@@ -0,0 +1,188 @@
+"""
+Precomputed weather/occasion suitability index for a wardrobe.
+
+Each item's weather tags and material flags are encoded as bits, and every bit
+(and every distinct occasion tag) is stored as one column: a Python int whose
+bit i is set when item i has it. Filtering for a weather and occasion is then a
+handful of AND/OR operations on those columns instead of string scans over
+every item, and the result is exactly what WardrobeItem.is_suitable_for_weather
+and is_suitable_for_occasion would give item by item.
+"""
+import itertools
+import logging
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from api.cache import TTLCache
+from api.llm.outfit import WARDROBE_SNAPSHOT_CACHE_SIZE, WARDROBE_SNAPSHOT_TTL, ItemType, WardrobeItem
+
+logger = logging.getLogger(__name__)
+
+# Weather tags the suitability rules look for (exact list elements, like `"cold" in suitable_for_weather`)
+WEATHER_TAGS = ("very cold", "cold", "very hot", "hot", "rainy", "snowy", "windy", "humid", "layered", "versatile")
+WEATHER_BITS = {tag: bit for bit, tag in enumerate(WEATHER_TAGS)}
+# Material flags, matched as substrings of the lowercased material
+MATERIAL_FLAGS = {
+    "windproof": ("windproof", "wind-resistant"),
+    "breathable": ("cotton", "linen", "breathable", "moisture-wicking"),
+}
+MATERIAL_BITS = {flag: len(WEATHER_TAGS) + i for i, flag in enumerate(MATERIAL_FLAGS)}
+# Item types kept whatever the weather
+WEATHER_EXEMPT = (ItemType.ACCESSORY, ItemType.SHOES)
+
+
+def item_bits(item: WardrobeItem) -> int:
+    """The item's weather tags and material flags as one bitmask."""
+    bits = 0
+    for tag in item.suitable_for_weather:
+        if tag in WEATHER_BITS:
+            bits |= 1 << WEATHER_BITS[tag]
+    material = item.material.lower()
+    for flag, needles in MATERIAL_FLAGS.items():
+        if any(needle in material for needle in needles):
+            bits |= 1 << MATERIAL_BITS[flag]
+    return bits
+
+
+def weather_requirements(weather_data: Dict) -> List[Tuple[int, ...]]:
+    """
+    The rules of WardrobeItem.is_suitable_for_weather as clauses: an item is
+    suitable when, for every clause, it has at least one of the clause's bits.
+    Its temperature checks are an elif chain that an item passing the extreme
+    band falls through, so below 10 an item needs both "very cold" and "cold",
+    and above 30 both "very hot" and "hot".
+    """
+    temp = weather_data.get("temperature", 0)
+    feels_like = weather_data.get("feels_like", temp)
+    description = weather_data.get("description", "").lower()
+    humidity = weather_data.get("humidity", 0)
+    wind_speed = weather_data.get("wind_speed", 0)
+
+    clauses = []
+    if feels_like < 10:
+        clauses += [(WEATHER_BITS["very cold"],), (WEATHER_BITS["cold"],)]
+    elif feels_like < 15:
+        clauses.append((WEATHER_BITS["cold"],))
+    elif feels_like > 30:
+        clauses += [(WEATHER_BITS["very hot"],), (WEATHER_BITS["hot"],)]
+    elif feels_like > 25:
+        clauses.append((WEATHER_BITS["hot"],))
+
+    if any(condition in description for condition in ["rain", "drizzle", "shower"]):
+        clauses.append((WEATHER_BITS["rainy"],))
+    if any(condition in description for condition in ["snow", "sleet", "flurries"]):
+        clauses.append((WEATHER_BITS["snowy"],))
+    if wind_speed > 20 or "wind" in description:
+        clauses.append((WEATHER_BITS["windy"], MATERIAL_BITS["windproof"]))
+    if humidity > 70:
+        clauses.append((WEATHER_BITS["humid"], MATERIAL_BITS["breathable"]))
+
+    forecast = weather_data.get("forecast", {})
+    if forecast and forecast.get("high", temp) - forecast.get("low", temp) > 10:
+        clauses.append((WEATHER_BITS["layered"], WEATHER_BITS["versatile"]))
+    return clauses
+
+
+def _column(size: int, positions: List[int]) -> int:
+    """An int with bit i set for each item position i."""
+    digits = bytearray(b"0" * size)
+    for i in positions:
+        digits[size - 1 - i] = 49  # "1"; item 0 is the lowest bit
+    return int(digits, 2) if size else 0
+
+
+class SuitabilityIndex:
+    """Column bitsets over one wardrobe, answering filter_suitable_items for any weather and occasion."""
+
+    def __init__(self, wardrobe_items: List[WardrobeItem]):
+        self.items = list(wardrobe_items)
+        self.size = len(self.items)
+        self.all = (1 << self.size) - 1
+
+        # One pass collecting, per bit and per occasion tag, the positions of the items that have it
+        bit_positions = defaultdict(list)
+        exempt_positions = []
+        tag_positions = defaultdict(set)
+        set_bits: Dict[tuple, List[int]] = {}  # wardrobes repeat tag/material combinations, so decode each once
+        for i, item in enumerate(self.items):
+            key = (tuple(item.suitable_for_weather), item.material)
+            if key not in set_bits:
+                bits = item_bits(item)
+                set_bits[key] = [bit for bit in range(bits.bit_length()) if bits >> bit & 1]
+            for bit in set_bits[key]:
+                bit_positions[bit].append(i)
+            if item.item_type in WEATHER_EXEMPT:
+                exempt_positions.append(i)
+            for tag in item.suitable_for_occasion:
+                tag_positions[tag].add(i)
+
+        self.columns = [_column(self.size, bit_positions[bit])
+                        for bit in range(len(WEATHER_TAGS) + len(MATERIAL_FLAGS))]
+        self.exempt = _column(self.size, exempt_positions)
+        # Occasion tags: lowercased for the substring rule, raw for the semi-formal/smart casual allowance
+        lowered = defaultdict(set)
+        for tag, positions in tag_positions.items():
+            lowered[tag.lower()] |= positions
+        self.occasion_columns = {tag: _column(self.size, positions) for tag, positions in lowered.items()}
+        self.raw_occasion_columns = {
+            tag: _column(self.size, tag_positions.get(tag, ())) for tag in ("semi-formal", "smart casual")
+        }
+        self._occasion_masks: Dict[str, int] = {}
+
+    def weather_mask(self, weather_data: Dict) -> int:
+        """Items suitable for the weather (is_suitable_for_weather)."""
+        mask = self.all
+        for clause in weather_requirements(weather_data):
+            mask &= self._any(clause)
+        return mask
+
+    def occasion_mask(self, occasion: str) -> int:
+        """Items that pass the occasion check of filter_suitable_items, including its near-miss allowance."""
+        mask = self._occasion_masks.get(occasion)
+        if mask is None:
+            target = occasion.lower()
+            mask = 0
+            for tag, column in self.occasion_columns.items():
+                if tag in target or target in tag:
+                    mask |= column
+            if "formal" in target:
+                mask |= self.raw_occasion_columns["semi-formal"]
+            if "casual" in target:
+                mask |= self.raw_occasion_columns["smart casual"]
+            self._occasion_masks[occasion] = mask
+        return mask
+
+    def filter(self, weather_data: Dict, occasion: str) -> List[WardrobeItem]:
+        """Suitable items in wardrobe order; accessories and shoes skip the weather check."""
+        mask = (self.weather_mask(weather_data) | self.exempt) & self.occasion_mask(occasion)
+        return self.select(mask)
+
+    def select(self, mask: int) -> List[WardrobeItem]:
+        """The items whose bits are set in the mask, in wardrobe order."""
+        if mask == self.all:
+            return list(self.items)
+        flags = format(mask, f"0{self.size}b")[::-1]
+        return list(itertools.compress(self.items, map("1".__eq__, flags)))
+
+    def _any(self, clause: Tuple[int, ...]) -> int:
+        mask = 0
+        for bit in clause:
+            mask |= self.columns[bit]
+        return mask
+
+
+# Indexes of recently filtered wardrobes by list identity (the list is kept so its id can't be reused);
+# parse_wardrobe returns the same list for an unchanged wardrobe, so an index lives as long as its snapshot
+_indexes = TTLCache(max_size=WARDROBE_SNAPSHOT_CACHE_SIZE, ttl=WARDROBE_SNAPSHOT_TTL)
+
+
+def suitability_index(wardrobe_items: List[WardrobeItem]) -> SuitabilityIndex:
+    """The index for a wardrobe list, built on first use and reused while the list is unchanged."""
+    entry = _indexes.get(id(wardrobe_items))
+    if entry is not None:
+        items, index = entry
+        if items is wardrobe_items and index.size == len(wardrobe_items):
+            return index
+    index = SuitabilityIndex(wardrobe_items)
+    _indexes.set(id(wardrobe_items), (wardrobe_items, index))
+    return index
@@ -1,10 +1,15 @@
 import logging
 from fastapi import FastAPI, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 # Import routers
-from api.routers import auth, chat, clothing, profile, outfits, weather
+from api.routers import auth, chat, clothing, metrics, profile, outfits, weather
+from api.Database.images import image_index
+from api.jobs import job_queue
+from api.llm.client import llm_client
+from api.llm.image import aclose_async_clients as close_image_clients
 
 # Logging
 logging.basicConfig(
@@ -37,6 +42,19 @@ async def generic_exception_handler(request, exc):
         content={"detail": "An unexpected error occurred. Please try again later."}
     )
 
+# ——— Lifecycle ———
+
+@app.on_event("startup")
+async def startup():
+    job_queue.start()
+    await run_in_threadpool(image_index.load)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.stop()
+    await llm_client.aclose()
+    await close_image_clients()
+
 # ——— Include Routers ———
 
 # Auth routes
@@ -56,3 +74,6 @@ app.include_router(outfits.router)
 
 # Weather routes
 app.include_router(weather.router)
+
+# Metrics routes
+app.include_router(metrics.router)
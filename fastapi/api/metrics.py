@@ -0,0 +1,223 @@
+"""
+In-process metrics for the request pipeline, exposed in Prometheus text format.
+
+Code marks a stage with `span("stage")`, used as a context manager, which
+records its duration in the stage histogram and in the current request's trace
+(see start_trace). LLM token counts go into a token histogram, and named events
+(retries, where an outfit came from) into counters. Other modules' stats()
+dictionaries are exported as gauges through register_collector.
+
+With METRICS_ENABLED=false every recording call returns immediately, and
+span() hands back one shared no-op context manager.
+"""
+import bisect
+import logging
+import math
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Mapping, Optional, Sequence
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_PREFIX = "wardrobe"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per value of a single label."""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], label: str):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._series: Dict[str, List] = {}  # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {label_value: list(series) for label_value, series in self._series.items()}
+        for label_value, series in sorted(snapshot.items()):
+            label = f'{self.label}="{_label(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{_number(bound)}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{{{label}}} {series[-1]}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class CounterFamily:
+    """Monotonic counters with one series per value of a single label."""
+
+    def __init__(self, name: str, help: str, label: str):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_value, value in values:
+            lines.append(f'{self.name}{{{self.label}="{_label(label_value)}"}} {_number(value)}')
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+stage_seconds = Histogram(f"{METRICS_PREFIX}_stage_duration_seconds",
+                          "Time spent in each request pipeline stage.", LATENCY_BUCKETS, "stage")
+llm_tokens = Histogram(f"{METRICS_PREFIX}_llm_tokens",
+                       "Prompt and completion tokens per LLM call.", TOKEN_BUCKETS, "kind")
+events = CounterFamily(f"{METRICS_PREFIX}_events_total",
+                       "Pipeline events such as outfit retries and where outfits came from.", "event")
+
+# Stage durations of the request being handled (stage -> seconds), when it started a trace
+_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar("metrics_trace", default=None)
+
+
+def start_trace() -> Dict[str, float]:
+    """
+    Starts collecting the current request's stage durations. Spans in this context
+    (and in tasks and threadpool calls started from it) add to the returned dict.
+    """
+    trace: Dict[str, float] = {}
+    _trace.set(trace)
+    return trace
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    if not METRICS_ENABLED:
+        return
+    stage_seconds.observe(stage, seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace[stage] = trace.get(stage, 0.0) + seconds
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        observe_stage(self.stage, time.perf_counter() - self.start)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(stage: str):
+    """Context manager timing one pipeline stage (sync or async code; time spent awaiting counts)."""
+    return _Span(stage) if METRICS_ENABLED else _NO_SPAN
+
+
+def observe_tokens(prompt_tokens: int, completion_tokens: int) -> None:
+    if not METRICS_ENABLED:
+        return
+    llm_tokens.observe("prompt", prompt_tokens)
+    llm_tokens.observe("completion", completion_tokens)
+
+
+def count(event: str, amount: float = 1) -> None:
+    if not METRICS_ENABLED:
+        return
+    events.inc(event, amount)
+
+
+# Gauges read from other modules' stats() when /metrics is scraped
+_collectors: Dict[str, Callable[[], Mapping]] = {}
+_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def register_collector(name: str, collect: Callable[[], Mapping]) -> None:
+    """Export the numeric values of collect() as gauges named <prefix>_<name>_<key>."""
+    _collectors[name] = collect
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = stage_seconds.render() + llm_tokens.render() + events.render()
+    for name, collect in sorted(_collectors.items()):
+        try:
+            values = collect()
+        except Exception as e:
+            logger.warning(f"Metrics collector {name} failed: {e}")
+            continue
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            metric = _NAME_CHARS.sub("_", f"{METRICS_PREFIX}_{name}_{key}")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    """Drop all recorded histograms and counters."""
+    stage_seconds.clear()
+    llm_tokens.clear()
+    events.clear()
@@ -1,4 +1,4 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from pydantic import BaseModel, Field, field_validator, ConfigDict
 
 
@@ -42,6 +42,10 @@ class WeatherData(BaseModel):
 class ChatRequest(BaseModel):
     user_message: str = Field(..., description="User's query about outfit suggestions")
     weather_data: WeatherData = Field(..., description="Current weather data")
+    regenerate: bool = Field(False, description="Ask for a new outfit instead of a cached suggestion")
+    mode: Literal["llm", "fast"] = Field("llm", description="\"fast\" builds the outfit with the local solver, without the LLM")
+    lat: Optional[float] = Field(None, description="Latitude, to look up the day's forecast alongside the request")
+    lon: Optional[float] = Field(None, description="Longitude, to look up the day's forecast alongside the request")
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -127,6 +131,11 @@ class ItemID(BaseModel):
     id: str = Field(..., description="ID of the item")
 
 
+class FavoriteBatch(BaseModel):
+    ids: List[str] = Field(..., min_length=1, description="IDs of the items or outfits")
+    favorite: Optional[bool] = Field(None, description="Value to set; omit to flip each one")
+
+
 class UpdateProfile(BaseModel):
     first_name: str
     last_name: str
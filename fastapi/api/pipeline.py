@@ -0,0 +1,88 @@
+"""
+Small DAG executor for request pipelines.
+
+A pipeline is a set of named async stages, each listing the stages whose
+results it needs. Every stage starts as soon as its dependencies are done, so
+independent stages (e.g. the wardrobe fetch and occasion detection in /chat)
+overlap and the request waits for the slowest of them rather than their sum.
+Each stage runs inside a metrics span named after it.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple
+
+from api import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    """
+    One pipeline step. `run` is called with the results of the `after` stages as
+    keyword arguments. An optional stage that fails yields None instead of
+    failing the pipeline.
+    """
+    name: str
+    run: Callable[..., Awaitable[Any]]
+    after: Tuple[str, ...] = ()
+    optional: bool = False
+
+
+class Pipeline:
+    """Runs stages concurrently in dependency order and returns every stage's result by name."""
+
+    def __init__(self, stages: Iterable[Stage] = (), concurrent: bool = True):
+        self.stages: Dict[str, Stage] = {}
+        self.concurrent = concurrent
+        for stage in stages:
+            self.add(stage)
+
+    def add(self, stage: Stage) -> None:
+        """Stages may only depend on stages added before them, so the graph can't have cycles."""
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate pipeline stage: {stage.name}")
+        missing = [name for name in stage.after if name not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {', '.join(missing)}")
+        self.stages[stage.name] = stage
+
+    async def _execute(self, stage: Stage, dependencies: Dict[str, Any]) -> Any:
+        with metrics.span(stage.name):
+            try:
+                return await stage.run(**dependencies)
+            except Exception as e:
+                if not stage.optional:
+                    raise
+                logger.warning(f"Optional pipeline stage {stage.name} failed: {e}")
+                return None
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Runs the pipeline. If a required stage fails, the stages still running are
+        cancelled and the error is raised; cancelling run() cancels every stage.
+        """
+        if not self.concurrent:
+            results: Dict[str, Any] = {}
+            for stage in self.stages.values():
+                results[stage.name] = await self._execute(stage, {name: results[name] for name in stage.after})
+            return results
+
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def start(stage: Stage) -> Any:
+            dependencies = {name: await tasks[name] for name in stage.after}
+            return await self._execute(stage, dependencies)
+
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.ensure_future(start(stage))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            pending = [task for task in tasks.values() if not task.done()]
+            for task in pending:
+                task.cancel()
+            # Collect the cancelled stages (and any later failures) so none are left unretrieved
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+        return {name: task.result() for name, task in tasks.items()}
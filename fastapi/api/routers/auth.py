@@ -3,12 +3,12 @@ import logging
 from typing import Optional
 
 from api.models import SignupUser, SigninUser
-from api.Database.auth import (
+from api.Database.auth import get_current_user
+from api.Database.repository import (
     sign_up_db,
     sign_in_db,
     get_session_db,
-    sign_out_db,
-    get_current_user
+    sign_out_db
 )
 
 logger = logging.getLogger(__name__)
@@ -21,7 +21,7 @@ router = APIRouter(
 @router.post("/sign-up/", status_code=status.HTTP_201_CREATED)
 async def sign_up(user: SignupUser):
     try:
-        return sign_up_db(user)
+        return await sign_up_db(user)
     except Exception as e:
         logger.error(f"Sign-up error: {e}", exc_info=True)
         if "already registered" in str(e).lower():
@@ -38,8 +38,8 @@ async def sign_in(user: SigninUser):
 
 @router.get("/session/")
 async def get_session(user=Depends(get_current_user)):
-    return get_session_db(user)
+    return await get_session_db(user)
 
 @router.post("/sign-out/")
 async def sign_out(user=Depends(get_current_user)):
-    return sign_out_db(user) 
\ No newline at end of file
+    return await sign_out_db(user) 
\ No newline at end of file
@@ -1,11 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+import asyncio
 import logging
 import json
+import os
+import time
+from typing import AsyncIterator, Dict, Literal, Optional
 
+from api import metrics
 from api.models import ChatRequest
+from api.pipeline import Pipeline, Stage
 from api.Database.auth import get_current_user
-from api.llm.outfit import generateOutfit
-from api.Database.database import supabase
+from api.llm.client import deadline_after
+from api.llm.occasion import adetermineOccasions
+from api.llm.outfit import agenerateOutfit, local_occasion
+from api.llm.outfit_stream import astreamOutfit, outfit_events
+from api.Database.repository import get_all_user_items_db
+from api.Weather.weather import ForecastData, get_weather_forecast
 
 logger = logging.getLogger(__name__)
 
@@ -14,65 +26,210 @@ router = APIRouter(
     tags=["ai"]
 )
 
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", "60"))  # seconds of LLM time per chat request
+CHAT_FORECAST_TIMEOUT = float(os.getenv("CHAT_FORECAST_TIMEOUT", "3"))  # seconds; the outfit is built without it after that
+# Run the independent /chat stages concurrently; false runs them one after another
+CHAT_CONCURRENT_STAGES = os.getenv("CHAT_CONCURRENT_STAGES", "true").lower() == "true"
+DISCONNECT_POLL_INTERVAL = 0.5  # seconds
+
+async def cancel_on_disconnect(request: Request, coro):
+    """
+    Awaits coro, cancelling it (and any LLM call it is waiting on) if the client disconnects first.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("Client disconnected; cancelling outfit generation")
+                task.cancel()
+                raise HTTPException(499, "Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+def forecast_summary(forecast: Optional[ForecastData]) -> Optional[Dict]:
+    """Today's high, low and conditions from a forecast lookup, as generateOutfit reads them."""
+    if not forecast or not forecast.forecast_days:
+        return None
+    today = forecast.forecast_days[0]
+    return {"high": today.max_temp, "low": today.min_temp, "description": today.description}
+
+
+def build_weather_data(chat_request: ChatRequest, forecast: Optional[Dict]) -> Dict:
+    """Weather dict for generateOutfit; the forecast is only included when one was found."""
+    weather = chat_request.weather_data
+    weather_data = {
+        "temperature": weather.temperature,
+        "description": weather.description,
+        "feels_like": weather.feels_like,
+        "humidity": weather.humidity,
+        "wind_speed": weather.wind_speed,
+        "location": weather.location,
+        "timestamp": weather.timestamp,
+    }
+    if forecast:
+        weather_data["forecast"] = forecast
+    return weather_data
+
+
+def empty_wardrobe_response() -> Dict:
+    return {
+        "occasion": "all occasions",
+        "outfit_items": [],
+        "description": "Your wardrobe is empty. Please add some items first."
+    }
+
+
+def chat_pipeline(chat_request: ChatRequest, mode: str, user, deadline: float,
+                  with_generate: bool = True) -> Pipeline:
+    """
+    The /chat stages: the wardrobe fetch, occasion detection and forecast lookup
+    don't depend on each other and run concurrently; outfit generation joins them.
+    With with_generate=False the caller generates the outfit (as /chat/stream does).
+    """
+    async def wardrobe_fetch():
+        return (await get_all_user_items_db(user))["data"]
+
+    async def occasion():
+        if mode == "fast":
+            return local_occasion(chat_request.user_message)
+        return await adetermineOccasions(chat_request.user_message, deadline=deadline)
+
+    async def forecast():
+        if chat_request.lat is None or chat_request.lon is None:
+            return None
+        lookup = run_in_threadpool(get_weather_forecast, chat_request.lat, chat_request.lon)
+        return forecast_summary(await asyncio.wait_for(lookup, CHAT_FORECAST_TIMEOUT))
+
+    async def generate(wardrobe_fetch, occasion, forecast):
+        if not wardrobe_fetch:
+            return empty_wardrobe_response()
+        weather_data = build_weather_data(chat_request, forecast)
+        logger.info(f"Processed weather data: {weather_data}")
+        return await agenerateOutfit(chat_request.user_message, weather_data, wardrobe_fetch,
+                                     deadline=deadline, regenerate=chat_request.regenerate,
+                                     mode=mode, occasion=occasion)
+
+    pipeline = Pipeline([
+        Stage("wardrobe_fetch", wardrobe_fetch),
+        Stage("occasion", occasion),
+        Stage("forecast", forecast, optional=True),
+    ], concurrent=CHAT_CONCURRENT_STAGES)
+    if with_generate:
+        pipeline.add(Stage("generate", generate, after=("wardrobe_fetch", "occasion", "forecast")))
+    return pipeline
+
+
 @router.post("/", response_model_exclude_none=True)
-async def chat(request: Request, user=Depends(get_current_user)):
+async def chat(request: Request, response: Response, mode: Optional[Literal["llm", "fast"]] = Query(None),
+               user=Depends(get_current_user)):
+    """
+    Outfit suggestion for the user's message. `mode=fast` (query or body) answers with
+    the local solver only, in milliseconds and without LLM calls. Stage durations are
+    returned in the Server-Timing header.
+    """
+    trace = metrics.start_trace()
+    try:
+        with metrics.span("chat"):
+            return await _chat(request, mode, user)
+    finally:
+        if trace:
+            response.headers["Server-Timing"] = ", ".join(
+                f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in trace.items()
+            )
+            logger.info("Chat stages: %s", ", ".join(f"{stage}={seconds * 1000:.1f}ms"
+                                                     for stage, seconds in trace.items()))
+
+
+async def parse_chat_request(request: Request) -> ChatRequest:
+    # Log the raw request body
+    body = await request.body()
+    logger.info(f"Raw request body: {body.decode()}")
+    
+    # Parse the request body manually first to see what we're getting
     try:
-        # Log the raw request body
-        body = await request.body()
-        logger.info(f"Raw request body: {body.decode()}")
+        raw_data = json.loads(body)
+        logger.info(f"Parsed request data: {raw_data}")
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse request body as JSON: {e}")
+        raise HTTPException(400, "Invalid JSON in request body")
         
-        # Parse the request body manually first to see what we're getting
-        try:
-            raw_data = json.loads(body)
-            logger.info(f"Parsed request data: {raw_data}")
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse request body as JSON: {e}")
-            raise HTTPException(400, "Invalid JSON in request body")
-            
-        # Now try to parse with Pydantic model
-        try:
+    # Now try to parse with Pydantic model
+    try:
+        with metrics.span("parse_request"):
             chat_request = ChatRequest(**raw_data)
-            logger.info(f"Successfully parsed ChatRequest: {chat_request}")
-        except Exception as e:
-            logger.error(f"Failed to parse request as ChatRequest: {str(e)}")
-            raise HTTPException(422, f"Invalid request data: {str(e)}")
-
-        wardrobe_resp = (
-            supabase.table("clothing_items")
-            .select("*")
-            .eq("user_id", user.id)
-            .execute()
-        )
-        wardrobe_items = wardrobe_resp.data or []
-        if not wardrobe_items:
-            return {
-                "response": {
-                    "occasion": "all occasions",
-                    "outfit_items": [],
-                    "description": "Your wardrobe is empty. Please add some items first."
-                }
-            }
-        
-        # Convert temperature to string as expected by generateOutfit
-        weather_data = {
-            "temperature": chat_request.weather_data.temperature,
-            "description": chat_request.weather_data.description,
-            "feels_like": chat_request.weather_data.feels_like,
-            "humidity": chat_request.weather_data.humidity,
-            "wind_speed": chat_request.weather_data.wind_speed,
-            "location": chat_request.weather_data.location,
-            "timestamp": chat_request.weather_data.timestamp,
-            "forecast": {
-                "high": chat_request.weather_data.forecast.high if hasattr(chat_request.weather_data, 'forecast') else None,
-                "low": chat_request.weather_data.forecast.low if hasattr(chat_request.weather_data, 'forecast') else None,
-                "description": chat_request.weather_data.forecast.description if hasattr(chat_request.weather_data, 'forecast') else None
-            }
-        }
-        
-        logger.info(f"Processed weather data: {weather_data}")
-        
-        outfit_resp = generateOutfit(chat_request.user_message, weather_data, wardrobe_items)
-        return {"response": outfit_resp}
+        logger.info(f"Successfully parsed ChatRequest: {chat_request}")
+    except Exception as e:
+        logger.error(f"Failed to parse request as ChatRequest: {str(e)}")
+        raise HTTPException(422, f"Invalid request data: {str(e)}")
+    return chat_request
+
+
+async def _chat(request: Request, mode: Optional[str], user):
+    try:
+        chat_request = await parse_chat_request(request)
+        pipeline = chat_pipeline(chat_request, mode or chat_request.mode, user, deadline_after(CHAT_DEADLINE))
+        results = await cancel_on_disconnect(request, pipeline.run())
+        return {"response": results["generate"]}
     except Exception as e:
+        if isinstance(e, HTTPException) and e.status_code == 499:
+            raise
         logger.error(f"Error in /chat/: {e}", exc_info=True)
-        raise HTTPException(500, f"Failed to generate outfit suggestion: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(500, f"Failed to generate outfit suggestion: {str(e)}")
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """One Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/stream")
+async def chat_stream(request: Request, mode: Optional[Literal["llm", "fast"]] = Query(None),
+                      user=Depends(get_current_user)):
+    """
+    Same request as /chat/, answered as Server-Sent Events: `occasion`, then each
+    outfit `item` as soon as the LLM has written it and it has been checked against
+    the wardrobe, `remove` for streamed items the final validation dropped, then
+    `description`, `styling_tips`, `warnings` and finally `done` with the full outfit
+    (the /chat/ response). Failures after the stream has started arrive as `error`.
+    """
+    chat_request = await parse_chat_request(request)
+    return StreamingResponse(
+        chat_events(chat_request, mode or chat_request.mode, user),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def chat_events(chat_request: ChatRequest, mode: str, user) -> AsyncIterator[str]:
+    """The /chat/stream events; the client disconnecting cancels the stream and its LLM call."""
+    trace = metrics.start_trace()
+    started = time.perf_counter()
+    deadline = deadline_after(CHAT_DEADLINE)
+    first_item = True
+    try:
+        with metrics.span("chat_stream"):
+            results = await chat_pipeline(chat_request, mode, user, deadline, with_generate=False).run()
+            if not results["wardrobe_fetch"]:
+                events = outfit_events(empty_wardrobe_response(), {}, occasion_sent=False)
+                for event, data in events:
+                    yield sse_event(event, data)
+                return
+            weather_data = build_weather_data(chat_request, results["forecast"])
+            async for event, data in astreamOutfit(chat_request.user_message, weather_data,
+                                                   results["wardrobe_fetch"], deadline=deadline,
+                                                   regenerate=chat_request.regenerate, mode=mode,
+                                                   occasion=results["occasion"]):
+                if event == "item" and first_item:
+                    metrics.observe_stage("first_item", time.perf_counter() - started)
+                    first_item = False
+                yield sse_event(event, data)
+    except Exception as e:
+        logger.error(f"Error in /chat/stream: {e}", exc_info=True)
+        yield sse_event("error", {"detail": f"Failed to generate outfit suggestion: {str(e)}"})
+    finally:
+        logger.info("Chat stream stages: %s", ", ".join(f"{stage}={seconds * 1000:.1f}ms"
+                                                        for stage, seconds in trace.items()))
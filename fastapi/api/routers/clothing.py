@@ -1,20 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+import json
 import logging
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 
-from api.models import ClothingItem, ItemID
+from api.models import ClothingItem, FavoriteBatch, ItemID
 from api.Database.auth import get_current_user
-from api.llm.item import setOccasion
-from api.Database.wardrobe import (
+from api.attributes import lookup_key
+from api.jobs import COMPLETED, FAILED, JOB_TTL, Job, job_queue
+from api.llm.item import asetOccasion
+from api.Database.repository import (
     add_clothing_item_db,
     delete_clothing_item_db,
     edit_favorite_item_db,
+    edit_favorite_items_db,
     get_user_items_db,
     get_item_by_id_db,
     get_all_user_items_db,
-    check_item_in_outfits_db
+    get_items_with_occasion_db,
+    check_item_in_outfits_db,
+    update_clothing_item_db
 )
-from api.Database.images import set_image
+from api.Database.images import image_index, set_image
 
 logger = logging.getLogger(__name__)
 
@@ -23,17 +32,105 @@ router = APIRouter(
     tags=["clothing"]
 )
 
+# Placeholder stored until the background job has picked the item's occasions
+PENDING_OCCASION = "pending"
+# Stored instead when the job gives up, like setOccasion's own fallback
+FALLBACK_OCCASION = "all occasions"
+JOB_EVENTS_KEEPALIVE = 15  # seconds between SSE keep-alive comments
+
+def enrich_item_job(item: ClothingItem, item_id: str):
+    """
+    Job handler that fills in the occasions and image of a newly inserted item.
+    Steps that succeeded are kept in job.progress, so a retry only redoes what failed;
+    LLM errors are raised (strict) so they are retried rather than stored as the fallback.
+    """
+    async def handler(job: Job):
+        fields = job.progress
+        if "suitable_for_occasion" not in fields:
+            await asetOccasion(item, strict=True)
+            fields["suitable_for_occasion"] = item.suitable_for_occasion
+        if not item.image_link:
+            # A retry must really generate again, not get the failure remembered from the last attempt
+            await run_in_threadpool(set_image, item, job.attempts > 1)
+        fields["image_link"] = item.image_link
+        return (await update_clothing_item_db(item_id, dict(fields)))["data"]
+    return handler
+
+def enrich_item_failed(item_id: str):
+    """Failure hook that replaces the pending placeholder, keeping whatever the job already found."""
+    async def on_failure(job: Job, error: Exception):
+        fields = {"suitable_for_occasion": FALLBACK_OCCASION, **job.progress}
+        await update_clothing_item_db(item_id, fields)
+    return on_failure
+
+async def enqueue_item_enrichment(item: ClothingItem, item_id: str, user_id: str) -> Job:
+    return await job_queue.submit("enrich_clothing_item", enrich_item_job(item, item_id),
+                                  user_id=user_id, on_failure=enrich_item_failed(item_id))
+
+async def requeue_pending_items(older_than: float = JOB_TTL) -> List[Job]:
+    """
+    Enqueues enrichment again for items still carrying the pending placeholder more than
+    `older_than` seconds after they were added. No job runs that long, so their job was
+    lost with the process that accepted it. Meant to run in one process (python -m
+    api.sweep), not in every worker, which would race the workers' own live jobs.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=older_than)
+    rows = (await get_items_with_occasion_db(PENDING_OCCASION, added_before=cutoff.isoformat()))["data"]
+    fields = set(ClothingItem.model_fields) - {"suitable_for_occasion"}
+    jobs = []
+    for row in rows:
+        item = ClothingItem(**{name: row[name] for name in fields if row.get(name) is not None})
+        jobs.append(await enqueue_item_enrichment(item, row["id"], row["user_id"]))
+    logger.info(f"Re-enqueued enrichment for {len(rows)} pending clothing items")
+    return jobs
+
 @router.post("/add_clothing_item/", status_code=status.HTTP_201_CREATED)
 async def add_clothing_item(item: ClothingItem, user=Depends(get_current_user)):
+    """
+    Inserts the item right away with a pending occasion (and no image unless one is already
+    known) and returns it with a job_id; occasions and image are filled in in the background.
+    Poll /wardrobe/jobs/{job_id} or stream /wardrobe/jobs/{job_id}/events for completion.
+    """
     try:
-        setOccasion(item)
-        set_image(item)
         item.user_id = user.id
-        return add_clothing_item_db(item)
+        item.image_link = image_index.get(lookup_key(item))
+        pending = item.model_copy(update={"suitable_for_occasion": PENDING_OCCASION})
+        result = await add_clothing_item_db(pending)
+
+        job = await enqueue_item_enrichment(item, result["data"][0]["id"], user.id)
+        return {**result, "job_id": job.id}
     except Exception as e:
         logger.error(f"Error in /add_clothing_item/: {e}", exc_info=True)
         raise HTTPException(500, "Failed to add clothing item")
 
+def get_user_job(job_id: str, user) -> Job:
+    job = job_queue.get(job_id)
+    if job is None or job.user_id != user.id:
+        raise HTTPException(404, "Job not found")
+    return job
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, user=Depends(get_current_user)):
+    return get_user_job(job_id, user).to_dict()
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, user=Depends(get_current_user)):
+    """Server-sent events with the job's state on every change, ending once it completes or fails."""
+    job = get_user_job(job_id, user)
+
+    async def events():
+        while True:
+            version, state = job.version, job.to_dict()
+            yield f"event: status\ndata: {json.dumps(state, default=str)}\n\n"
+            if state["status"] in (COMPLETED, FAILED):
+                return
+            # Only wait if nothing changed while the event was being sent
+            while job.version == version and not await job.wait_for_change(JOB_EVENTS_KEEPALIVE):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @router.get("/clothing_items/")
 async def get_clothing_items(
     item_type: Optional[str] = None,
@@ -42,9 +139,9 @@ async def get_clothing_items(
 ):
     try:
         if item_id:
-            return get_item_by_id_db(item_id, user)
+            return await get_item_by_id_db(item_id, user)
         if item_type:
-            return get_user_items_db(item_type, user)
+            return await get_user_items_db(item_type, user)
         raise HTTPException(400, "Either item_type or item_id must be provided")
     except HTTPException:
         raise
@@ -55,7 +152,7 @@ async def get_clothing_items(
 @router.get("/clothing_items/all/")
 async def get_all_clothing_items(user=Depends(get_current_user)):
     try:
-        return get_all_user_items_db(user)
+        return await get_all_user_items_db(user)
     except Exception as e:
         logger.error(f"Error in /clothing_items/all/: {e}", exc_info=True)
         raise HTTPException(500, "Failed to retrieve all clothing items")
@@ -63,18 +160,31 @@ async def get_all_clothing_items(user=Depends(get_current_user)):
 @router.post("/edit_favorite_item/")
 async def edit_favorite_item(data: ItemID, user=Depends(get_current_user)):
     try:
-        return edit_favorite_item_db(data.id)
+        return await edit_favorite_item_db(data.id, user.id)
+    except HTTPException as he:
+        if he.status_code == 404:
+            raise
+        logger.error(f"Error in /edit_favorite_item/: {he.detail}")
+        raise HTTPException(500, "Failed to update favorite status")
     except Exception as e:
         logger.error(f"Error in /edit_favorite_item/: {e}", exc_info=True)
         raise HTTPException(500, "Failed to update favorite status")
 
+@router.post("/edit_favorite_items/")
+async def edit_favorite_items(data: FavoriteBatch, user=Depends(get_current_user)):
+    try:
+        return await edit_favorite_items_db(data.ids, data.favorite, user.id)
+    except Exception as e:
+        logger.error(f"Error in /edit_favorite_items/: {e}", exc_info=True)
+        raise HTTPException(500, "Failed to update favorite status")
+
 @router.get("/check_item_in_outfits/")
 async def check_item_in_outfits(
     item_id: str = Query(..., description="ID of the item to check"),
     user=Depends(get_current_user)
 ):
     try:
-        return check_item_in_outfits_db(item_id, user.id)
+        return await check_item_in_outfits_db(item_id, user.id)
     except Exception as e:
         logger.error(f"Error in /check_item_in_outfits/: {e}", exc_info=True)
         return {"data": []}
@@ -86,7 +196,7 @@ async def delete_clothing_item(
     user=Depends(get_current_user)
 ):
     try:
-        return delete_clothing_item_db(data.id, delete_outfits, user.id)
+        return await delete_clothing_item_db(data.id, delete_outfits, user.id)
     except Exception as e:
         logger.error(f"Error in /delete_clothing_item/: {e}", exc_info=True)
         raise HTTPException(500, "Failed to delete clothing item") 
\ No newline at end of file
@@ -0,0 +1,44 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+import logging
+
+from api import metrics
+from api.Database.images import image_generation_stats, image_index
+from api.Database.tokens import token_verifier
+from api.Database.wardrobe_cache import wardrobe_cache
+from api.jobs import job_queue
+from api.llm.client import llm_client
+from api.llm.item import item_occasion_cache
+from api.llm.occasion import occasion_stats
+from api.llm.occasion_cache import occasion_cache
+from api.llm.outfit import prompt_token_stats, wardrobe_snapshots
+from api.llm.outfit_cache import outfit_cache
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    tags=["metrics"]
+)
+
+# Caches and queues whose stats() are exported as gauges
+metrics.register_collector("llm_client", llm_client.stats)
+metrics.register_collector("occasion_cache", occasion_cache.stats)
+metrics.register_collector("occasion_sources", occasion_stats)
+metrics.register_collector("item_occasion_cache", item_occasion_cache.stats)
+metrics.register_collector("outfit_cache", outfit_cache.stats)
+metrics.register_collector("outfit_prompt", lambda: prompt_token_stats)
+metrics.register_collector("wardrobe_snapshots", wardrobe_snapshots.stats)
+metrics.register_collector("wardrobe_cache", wardrobe_cache.stats)
+metrics.register_collector("token_cache", token_verifier.stats)
+metrics.register_collector("image_index", image_index.stats)
+metrics.register_collector("image_generation", image_generation_stats)
+metrics.register_collector("jobs", job_queue.stats)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Stage latency and LLM token histograms, pipeline event counters and cache
+    gauges, in the Prometheus text exposition format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
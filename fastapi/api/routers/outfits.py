@@ -1,13 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
 import logging
 
-from api.models import OutfitData, ItemID
+from api.models import FavoriteBatch, OutfitData, ItemID
 from api.Database.auth import get_current_user
-from api.Database.outfits import (
+from api.Database.repository import (
     add_saved_outfit_db,
     get_saved_outfits_db,
     delete_saved_outfit_db,
-    edit_favorite_outfit_db
+    edit_favorite_outfit_db,
+    edit_favorite_outfits_db
 )
 
 logger = logging.getLogger(__name__)
@@ -20,7 +21,7 @@ router = APIRouter(
 @router.post("/add_saved_outfit/", status_code=201)
 async def add_saved_outfit(outfit: OutfitData, user=Depends(get_current_user)):
     try:
-        return add_saved_outfit_db(outfit)
+        return await add_saved_outfit_db(outfit)
     except Exception as e:
         logger.error(f"Error in /add_saved_outfit/: {e}", exc_info=True)
         raise HTTPException(500, "Failed to save outfit")
@@ -28,7 +29,7 @@ async def add_saved_outfit(outfit: OutfitData, user=Depends(get_current_user)):
 @router.get("/get_saved_outfits/")
 async def get_saved_outfits(user=Depends(get_current_user)):
     try:
-        return get_saved_outfits_db(user)
+        return await get_saved_outfits_db(user)
     except Exception as e:
         logger.error(f"Error in /get_saved_outfits/: {e}", exc_info=True)
         raise HTTPException(500, "Failed to retrieve saved outfits")
@@ -36,7 +37,7 @@ async def get_saved_outfits(user=Depends(get_current_user)):
 @router.post("/delete_saved_outfit/")
 async def delete_saved_outfit(data: ItemID, user=Depends(get_current_user)):
     try:
-        return delete_saved_outfit_db(data.id)
+        return await delete_saved_outfit_db(data.id)
     except Exception as e:
         logger.error(f"Error in /delete_saved_outfit/: {e}", exc_info=True)
         raise HTTPException(500, "Failed to delete saved outfit")
@@ -44,7 +45,20 @@ async def delete_saved_outfit(data: ItemID, user=Depends(get_current_user)):
 @router.post("/edit_favorite_outfit/")
 async def edit_favorite_outfit(data: ItemID, user=Depends(get_current_user)):
     try:
-        return edit_favorite_outfit_db(data.id)
+        return await edit_favorite_outfit_db(data.id, user.id)
+    except HTTPException as he:
+        if he.status_code == 404:
+            raise
+        logger.error(f"Error in /edit_favorite_outfit/: {he.detail}")
+        raise HTTPException(500, "Failed to update favorite status")
     except Exception as e:
         logger.error(f"Error in /edit_favorite_outfit/: {e}", exc_info=True)
+        raise HTTPException(500, "Failed to update favorite status")
+
+@router.post("/edit_favorite_outfits/")
+async def edit_favorite_outfits(data: FavoriteBatch, user=Depends(get_current_user)):
+    try:
+        return await edit_favorite_outfits_db(data.ids, data.favorite, user.id)
+    except Exception as e:
+        logger.error(f"Error in /edit_favorite_outfits/: {e}", exc_info=True)
         raise HTTPException(500, "Failed to update favorite status") 
\ No newline at end of file
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.concurrency import run_in_threadpool
 import logging
 from api.Database.auth import get_current_user
 from api.Weather.weather import get_current_weather, get_weather_forecast, WeatherData, ForecastData
@@ -19,7 +20,7 @@ async def current_weather(
     """
     Get current weather data for the specified coordinates.
     """
-    weather_data = get_current_weather(lat, lon)
+    weather_data = await run_in_threadpool(get_current_weather, lat, lon)
     
     if not weather_data:
         logger.error("Failed to get weather data")
@@ -40,7 +41,7 @@ async def weather_forecast(
     Get 3-day weather forecast for the specified coordinates.
     Returns forecast data including temperature ranges, conditions, and precipitation chances.
     """
-    forecast_data = get_weather_forecast(lat, lon)
+    forecast_data = await run_in_threadpool(get_weather_forecast, lat, lon)
     
     if not forecast_data:
         logger.error("Failed to get weather forecast data")
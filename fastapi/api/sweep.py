@@ -0,0 +1,35 @@
+"""
+Finishes clothing items whose background enrichment was lost, e.g. with a
+restarted or crashed worker. Run once per deploy (or periodically), from the
+fastapi/ directory and outside the API workers:
+
+    python -m api.sweep
+
+Items still "pending" more than JOB_TTL seconds after they were added are
+enriched again on this process's job queue; the command waits for the jobs
+and prints how many completed and failed.
+"""
+import asyncio
+
+from api.jobs import COMPLETED, job_queue
+from api.llm.client import llm_client
+from api.llm.image import aclose_async_clients
+from api.routers.clothing import requeue_pending_items
+
+
+async def sweep():
+    jobs = await requeue_pending_items()
+    try:
+        for job in jobs:
+            while not job.done:
+                await job.wait_for_change()
+    finally:
+        await job_queue.stop()
+        await llm_client.aclose()
+        await aclose_async_clients()
+    completed = sum(job.status == COMPLETED for job in jobs)
+    return {"requeued": len(jobs), "completed": completed, "failed": len(jobs) - completed}
+
+
+if __name__ == "__main__":
+    print(asyncio.run(sweep()))
@@ -0,0 +1,6 @@
+import os
+
+# The API modules read these at import time; the tests never reach the services
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_ROLE_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
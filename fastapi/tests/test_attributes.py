@@ -0,0 +1,71 @@
+import pytest
+
+from api.attributes import canonical, lookup_key, singularize
+
+
+@pytest.mark.parametrize("plural, singular", [
+    ("shoes", "shoe"),
+    ("dresses", "dress"),
+    ("boxes", "box"),
+    ("watches", "watch"),
+    ("ties", "tie"),
+    ("bowties", "bowtie"),
+    ("hoodies", "hoodie"),
+    ("beanies", "beanie"),
+    ("scarves", "scarf"),
+    ("sleeves", "sleeve"),
+    ("jeans", "jeans"),
+    ("glasses", "glasses"),
+])
+def test_singularize(plural, singular):
+    assert singularize(plural) == singular
+
+
+@pytest.mark.parametrize("attribute, first, second", [
+    ("sub_type", "ties", "tie"),
+    ("sub_type", "Scarves", "scarf"),
+    ("sub_type", "zip hoodies", "zip hoodie"),
+    ("sub_type", "zip hoody", "zip hoodie"),
+    ("sub_type", "Jeans", "jean"),
+    ("sub_type", "cargo short", "cargo shorts"),
+    ("sub_type", "T-Shirts", "tee"),
+    ("sub_type", "graphic tees", "graphic t-shirt"),
+    ("material", "Jeans", "jean"),
+    ("material", "denim", "jeans"),
+    ("material", "stretch jeans", "stretch denim"),
+    ("material", "Merino", "merino wool"),
+    ("color", "Navy Blue", "navy"),
+    ("color", "light gray", "light grey"),
+    ("pattern", "polka dots", "dotted"),
+    ("pattern", "Stripes", "striped"),
+])
+def test_spellings_share_a_canonical_value(attribute, first, second):
+    assert canonical(attribute, first) == canonical(attribute, second)
+
+
+@pytest.mark.parametrize("attribute, value, expected", [
+    ("sub_type", "short sleeve shirt", "short sleeve shirt"),
+    ("sub_type", "jean jacket", "jean jacket"),
+    ("pattern", "polka dot", "polka dot"),
+    ("material", "merino wool", "merino wool"),
+    ("material", "Jeans", "denim"),
+    ("sub_type", "zip hoodies", "zip hoodie"),
+])
+def test_canonical_value(attribute, value, expected):
+    assert canonical(attribute, value) == expected
+
+
+@pytest.mark.parametrize("attribute, value", [
+    ("sub_type", "graphic tees"),
+    ("pattern", "polka dots"),
+    ("material", "merino"),
+    ("sub_type", "cargo short"),
+])
+def test_canonical_is_idempotent(attribute, value):
+    once = canonical(attribute, value)
+    assert canonical(attribute, once) == once
+
+
+def test_lookup_key():
+    row = {"material": "Jeans", "color": "Navy Blue", "pattern": None, "sub_type": "Skinny Jeans"}
+    assert lookup_key(row) == "denim|navy||skinny jeans"
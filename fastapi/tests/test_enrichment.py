@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from api.cache import SingleFlight
+from api.Database import images
+from api.jobs import COMPLETED, JOB_TTL, JobQueue
+from api.models import ClothingItem
+from api.routers import clothing
+
+
+def make_item():
+    return ClothingItem(user_id="u1", item_type="top", material="linen", color="teal", formality="casual",
+                        pattern="solid", fit="regular", suitable_for_weather="hot", sub_type="camp shirt")
+
+
+async def wait_done(job):
+    while not job.done:
+        await job.wait_for_change(2.0)
+    return job
+
+
+@pytest.fixture
+def updates(monkeypatch):
+    writes = []
+
+    async def update(item_id, fields):
+        writes.append((item_id, fields))
+        return {"data": [{"id": item_id, **fields}]}
+
+    async def set_occasion(item, deadline=None, strict=False):
+        item.suitable_for_occasion = "beach"
+        return item
+
+    monkeypatch.setattr(clothing, "update_clothing_item_db", update)
+    monkeypatch.setattr(clothing, "asetOccasion", set_occasion)
+    monkeypatch.setattr(clothing, "job_queue", JobQueue(workers=1, retry_delay=0.01))
+    monkeypatch.setattr(images, "image_flights", SingleFlight(failure_ttl=30))
+    return writes
+
+
+def test_job_retry_generates_the_image_again(updates, monkeypatch):
+    generations = []
+
+    def find_or_create(item, key):
+        generations.append(key)
+        if len(generations) == 1:
+            raise RuntimeError("image API unavailable")
+        return {"data": [{"lookup_key": key, "image_link": "https://img/teal-shirt.png"}]}
+
+    monkeypatch.setattr(images, "find_or_create_image", find_or_create)
+
+    async def scenario():
+        job = await clothing.enqueue_item_enrichment(make_item(), "item-1", "u1")
+        await wait_done(job)
+        await clothing.job_queue.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == COMPLETED and job.attempts == 2
+    assert len(generations) == 2
+    assert updates == [("item-1", {"suitable_for_occasion": "beach", "image_link": "https://img/teal-shirt.png"})]
+
+
+def test_sweep_only_requeues_items_older_than_the_job_ttl(updates, monkeypatch):
+    queries = []
+
+    async def pending_items(occasion, added_before=None, limit=1000):
+        queries.append((occasion, added_before))
+        return {"data": []}
+
+    monkeypatch.setattr(clothing, "get_items_with_occasion_db", pending_items)
+    assert asyncio.run(clothing.requeue_pending_items()) == []
+    (occasion, added_before), = queries
+    assert occasion == clothing.PENDING_OCCASION
+    expected = datetime.now(timezone.utc) - timedelta(seconds=JOB_TTL)
+    assert abs(datetime.fromisoformat(added_before) - expected) < timedelta(seconds=5)
@@ -0,0 +1,42 @@
+import asyncio
+
+from api.llm import image
+from api.models import ClothingItem
+
+
+def make_item(color):
+    return ClothingItem(user_id="u1", item_type="top", material="cotton", color=color, formality="casual",
+                        pattern="solid", fit="regular", suitable_for_weather="warm", sub_type="t shirt")
+
+
+async def fake_generate(item, limiter=None, **kwargs):
+    image._get_async_clients()  # as the real call does, so the loop gets clients to close
+    return item.color.encode()
+
+
+def test_batch_generate_images_without_a_loop(monkeypatch):
+    monkeypatch.setattr(image, "agenerate_image", fake_generate)
+    results = image.batch_generate_images([make_item("red"), make_item("blue")])
+    assert results == {"0": b"red", "1": b"blue"}
+    assert not image._async_clients
+
+
+def test_batch_generate_images_inside_a_running_loop(monkeypatch):
+    monkeypatch.setattr(image, "agenerate_image", fake_generate)
+
+    async def caller():
+        return image.batch_generate_images([make_item("green")])
+
+    assert asyncio.run(caller()) == {"0": b"green"}
+    assert not image._async_clients
+
+
+def test_aclose_async_clients_closes_the_loops_clients():
+    async def scenario():
+        _, http_client = image._get_async_clients()
+        await image.aclose_async_clients()
+        return http_client
+
+    http_client = asyncio.run(scenario())
+    assert http_client.is_closed
+    assert not image._async_clients
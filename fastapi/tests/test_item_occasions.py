@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+import pytest
+
+from api.cache import TTLCache
+from api.llm import item as item_module
+from api.llm.client import llm_client
+from api.llm.item import asetOccasions, setOccasions
+from api.models import ClothingItem
+
+# Per-item answers by color; the batch call always fails
+OCCASIONS = {"black": ["work"], "red": ["party", "date night"]}
+
+
+def make_item(color):
+    return ClothingItem(user_id="u1", item_type="top", material="cotton", color=color, formality="casual",
+                        pattern="solid", fit="regular", suitable_for_weather="warm", sub_type="shirt")
+
+
+def answer(messages):
+    prompt = messages[0].content
+    if prompt.startswith("For each numbered clothing item"):
+        raise RuntimeError("batch request failed")
+    color = next(c for c in OCCASIONS if f"Color: {c}\n" in prompt)
+    return json.dumps({"occasions": OCCASIONS[color]})
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(item_module, "item_occasion_cache", TTLCache(max_size=100, ttl=60))
+
+
+def test_failed_batch_falls_back_to_per_item_calls(monkeypatch):
+    monkeypatch.setattr(llm_client, "invoke", lambda messages, temperature=None, **kwargs: answer(messages))
+    items = setOccasions([make_item("black"), make_item("red"), make_item("black")])
+    assert [i.suitable_for_occasion for i in items] == ["work", "party, date night", "work"]
+
+
+def test_async_failed_batch_falls_back_to_per_item_calls(monkeypatch):
+    async def ainvoke(messages, temperature=None, deadline=None, **kwargs):
+        return answer(messages)
+
+    monkeypatch.setattr(llm_client, "ainvoke", ainvoke)
+    items = asyncio.run(asetOccasions([make_item("black"), make_item("red"), make_item("black")]))
+    assert [i.suitable_for_occasion for i in items] == ["work", "party, date night", "work"]
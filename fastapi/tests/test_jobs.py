@@ -0,0 +1,58 @@
+import asyncio
+
+from api.jobs import COMPLETED, FAILED, JobQueue
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def wait_done(job, timeout=2.0):
+    while not job.done:
+        await job.wait_for_change(timeout)
+    return job
+
+
+def test_failed_job_runs_failure_hook_once():
+    calls = []
+
+    async def handler(job):
+        raise RuntimeError("LLM unavailable")
+
+    async def on_failure(job, error):
+        calls.append((job.attempts, str(error)))
+
+    async def scenario():
+        queue = JobQueue(workers=1, max_attempts=2, retry_delay=0.01)
+        job = await queue.submit("test", handler, on_failure=on_failure)
+        await wait_done(job)
+        await queue.stop()
+        return job
+
+    job = run(scenario())
+    assert job.status == FAILED
+    assert calls == [(2, "LLM unavailable")]
+
+
+def test_retry_keeps_progress_and_skips_failure_hook():
+    calls = []
+
+    async def handler(job):
+        job.progress["attempt"] = job.progress.get("attempt", 0) + 1
+        if job.progress["attempt"] == 1:
+            raise RuntimeError("transient")
+        return job.progress["attempt"]
+
+    async def on_failure(job, error):
+        calls.append(error)
+
+    async def scenario():
+        queue = JobQueue(workers=1, max_attempts=3, retry_delay=0.01)
+        job = await queue.submit("test", handler, on_failure=on_failure)
+        await wait_done(job)
+        await queue.stop()
+        return job
+
+    job = run(scenario())
+    assert job.status == COMPLETED and job.result == 2
+    assert calls == []
@@ -0,0 +1,26 @@
+import asyncio
+
+from api.llm.client import LLMClient
+
+
+def test_aclose_closes_the_pool_without_opening_another():
+    client = LLMClient(api_key="test-key")
+    first = client._http_async_client
+
+    asyncio.run(client.aclose())
+    assert first.is_closed
+    assert client._http_async_client is None and not client._pool
+
+    asyncio.run(client.aclose())  # nothing left to close
+    assert client._http_async_client is None
+
+
+def test_next_call_after_aclose_gets_a_fresh_pool():
+    client = LLMClient(api_key="test-key")
+    first = client._http_async_client
+    asyncio.run(client.aclose())
+
+    llm = client.get_llm(0.2)
+    assert client._http_async_client is not first and not client._http_async_client.is_closed
+    assert llm.http_async_client is client._http_async_client
+    assert client.llm is client.get_llm()
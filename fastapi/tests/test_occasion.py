@@ -0,0 +1,81 @@
+import pytest
+
+from api.llm import classifier
+from api.llm import occasion as occasion_module
+from api.llm.occasion import classify_locally, occasion_stats
+from api.llm.outfit import local_occasion
+
+
+class FixedModel:
+    """Stands in for a trained OccasionModel with a fixed prediction."""
+
+    def __init__(self, occasion, confidence):
+        self.prediction = (occasion, confidence)
+
+    def predict(self, message, candidates=None):
+        return self.prediction
+
+
+@pytest.fixture
+def no_model(monkeypatch):
+    monkeypatch.setattr(classifier, "occasion_model", None)
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("What should I wear to work tomorrow?", "work"),
+    ("Outfit for a job interview at a bank", "job interview"),
+    ("Heading to the gym after class", "gym"),
+])
+def test_named_occasion_is_answered_without_model(no_model, message, expected):
+    assert classify_locally(message) == expected
+
+
+@pytest.mark.parametrize("message", [
+    "I don't want anything formal, just hanging out",
+    "Dinner with my in-laws",
+    "Something casual but not too casual",
+    "What goes with my new jacket?",
+])
+def test_synonym_or_no_hit_defers_to_llm_without_model(no_model, message):
+    assert classify_locally(message) is None
+
+
+@pytest.mark.parametrize("message", [
+    "Nothing for work, it's my day off",
+    "I'm not going to the gym today",
+    "Don\u2019t suggest a job interview look",
+    "No work clothes please",
+])
+def test_negated_occasion_defers_to_llm(monkeypatch, message):
+    monkeypatch.setattr(classifier, "occasion_model", FixedModel("work", 0.99))
+    assert classify_locally(message) is None
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("No rain today, so what should I wear to work?", "work"),
+    ("I don't mind the cold but I need something for the gym", "gym"),
+])
+def test_negation_in_another_clause_is_ignored(no_model, message, expected):
+    assert classify_locally(message) == expected
+
+
+def test_fast_mode_is_counted_apart_from_local_answers(no_model, monkeypatch):
+    monkeypatch.setattr(occasion_module, "occasion_sources", occasion_module.Counter())
+    monkeypatch.setattr("api.llm.outfit.occasion_sources", occasion_module.occasion_sources)
+    assert local_occasion("What should I wear to work tomorrow?") == "work"
+    classify_locally("Heading to the gym after class")
+    occasion_module.occasion_sources["llm"] += 1
+    stats = occasion_stats()
+    assert stats["fast"] == 1 and stats["rule"] == 1
+    assert stats["llm_avoided_rate"] == 0.5
+
+
+def test_synonym_hit_defers_to_llm_below_threshold(monkeypatch):
+    model = FixedModel("general formal occasion", classifier.OCCASION_MODEL_THRESHOLD / 2)
+    monkeypatch.setattr(classifier, "occasion_model", model)
+    assert classify_locally("I don't want anything formal, just hanging out") is None
+
+
+def test_confident_model_answers(monkeypatch):
+    monkeypatch.setattr(classifier, "occasion_model", FixedModel("casual outing", 0.99))
+    assert classify_locally("I don't want anything formal, just hanging out") == "casual outing"
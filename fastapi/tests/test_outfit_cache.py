@@ -0,0 +1,57 @@
+from api.bench import sample_wardrobe_items
+from api.llm.outfit_cache import OutfitCache
+
+WEATHER = ("mild", "clear")
+
+
+def outfit(name):
+    return {"occasion": "work", "outfit_items": [], "description": name}
+
+
+def test_alternatives_are_served_in_rotation():
+    cache = OutfitCache(alternatives=2)
+    key = cache.key(sample_wardrobe_items(7), "work", WEATHER)
+    cache.add(key, outfit("a"))
+    cache.add(key, outfit("b"))
+    assert [cache.get(key)["description"] for _ in range(3)] == ["a", "b", "a"]
+    cache.add(key, outfit("c"))  # replaces "a", the rotation carries on
+    assert [cache.get(key)["description"] for _ in range(2)] == ["c", "b"]
+
+
+def test_wardrobe_change_drops_only_that_users_outfits():
+    cache = OutfitCache()
+    wardrobe = sample_wardrobe_items(7, user_id="u1")
+    other = sample_wardrobe_items(5, user_id="u2")
+    key = cache.key(wardrobe, "work", WEATHER)
+    other_key = cache.key(other, "work", WEATHER)
+    cache.add(key, outfit("a"))
+    cache.add(other_key, outfit("b"))
+
+    cache.key(wardrobe[:-1], "work", WEATHER)
+    assert cache.get(key) is None
+    assert cache.get(other_key)["description"] == "b"
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_invalidate_user():
+    cache = OutfitCache()
+    key = cache.key(sample_wardrobe_items(7, user_id="u1"), "work", WEATHER)
+    cache.add(key, outfit("a"))
+    cache.invalidate_user("u1")
+    cache.invalidate_user("unknown")
+    assert cache.get(key) is None
+    assert cache.stats()["users"] == 0
+
+
+def test_bookkeeping_is_bounded():
+    cache = OutfitCache(max_size=10)
+    for i in range(50):
+        key = cache.key(sample_wardrobe_items(3, user_id=f"u{i}"), f"occasion {i}", WEATHER)
+        cache.add(key, outfit(str(i)))
+    stats = cache.stats()
+    assert stats["size"] == 10 and stats["users"] == 10
+
+    wardrobe = sample_wardrobe_items(3, user_id="many")
+    for i in range(200):
+        cache.key(wardrobe, "work", ("weather", i))
+    assert len(cache._users.get("many").keys) <= 64
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from api.bench import sample_wardrobe_items
+from api.llm import outfit as outfit_module
+from api.llm.client import llm_client
+from api.llm.outfit import agenerateOutfit, generateOutfit, parse_wardrobe, prepare_outfit_prompt
+from api.llm.outfit_cache import OutfitCache
+from api.llm.outfit_stream import astreamOutfit
+
+MESSAGE = "Something relaxed for the weekend"
+OCCASION = "casual outing"
+WEATHER = {"temperature": 21, "feels_like": 21, "description": "clear sky", "humidity": 40, "wind_speed": 5}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = OutfitCache()
+    monkeypatch.setattr(outfit_module, "outfit_cache", cache)
+    monkeypatch.setattr("api.llm.outfit_stream.outfit_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def wardrobe(cache):
+    # Without shoes, validation can't add a pair itself, so the missing shoes trigger the retry
+    return [item for item in sample_wardrobe_items(14) if item["item_type"] != "shoes"]
+
+
+def shoeless_answer(wardrobe):
+    """An answer with a valid top and bottom and no shoes."""
+    prompt = prepare_outfit_prompt(MESSAGE, WEATHER, parse_wardrobe(wardrobe), OCCASION)
+    offered = [item for item in prompt.outfit_items_dict if item["id"] in prompt.wardrobe_ids]
+    top = next(item for item in offered if item["item_type"] == "top")
+    bottom = next(item for item in offered if item["item_type"] == "bottom")
+    answer = {
+        "occasion": OCCASION,
+        "outfit_items": [{"id": top["id"], "item_type": "top"}, {"id": bottom["id"], "item_type": "bottom"}],
+        "description": "Relaxed weekend look",
+        "styling_tips": "Roll the sleeves.",
+    }
+    return json.dumps(answer), {top["id"], bottom["id"]}
+
+
+def check_first_outfit_kept(result, expected_ids, cache):
+    assert {item["id"] for item in result["outfit_items"]} == expected_ids
+    assert result["description"] == "Relaxed weekend look"
+    assert any("Missing shoes" in warning for warning in result["warnings"])
+    assert cache.stats()["size"] == 0
+
+
+def test_generate_outfit_keeps_first_outfit_when_retry_call_fails(wardrobe, cache, monkeypatch):
+    answer, expected_ids = shoeless_answer(wardrobe)
+    calls = []
+
+    def invoke(messages, temperature=None, **kwargs):
+        calls.append(messages)
+        if len(calls) > 1:
+            raise RuntimeError("LLM unavailable")
+        return answer
+
+    monkeypatch.setattr(llm_client, "invoke", invoke)
+    monkeypatch.setattr(outfit_module, "record_exchange", lambda *args: None)
+    result = generateOutfit(MESSAGE, WEATHER, wardrobe, occasion=OCCASION)
+    assert len(calls) == 2
+    check_first_outfit_kept(result, expected_ids, cache)
+
+
+def test_agenerate_outfit_keeps_first_outfit_when_retry_call_fails(wardrobe, cache, monkeypatch):
+    answer, expected_ids = shoeless_answer(wardrobe)
+    calls = []
+
+    async def ainvoke(messages, temperature=None, deadline=None, **kwargs):
+        calls.append(messages)
+        if len(calls) > 1:
+            raise RuntimeError("LLM unavailable")
+        return answer
+
+    monkeypatch.setattr(llm_client, "ainvoke", ainvoke)
+    monkeypatch.setattr(outfit_module, "record_exchange", lambda *args: None)
+    result = asyncio.run(agenerateOutfit(MESSAGE, WEATHER, wardrobe, occasion=OCCASION))
+    assert len(calls) == 2
+    check_first_outfit_kept(result, expected_ids, cache)
+
+
+def test_stream_outfit_keeps_first_outfit_when_retry_call_fails(wardrobe, cache, monkeypatch):
+    answer, expected_ids = shoeless_answer(wardrobe)
+
+    async def astream(messages, temperature=None, deadline=None, **kwargs):
+        for start in range(0, len(answer), 16):
+            yield answer[start:start + 16]
+
+    async def ainvoke(messages, temperature=None, deadline=None, **kwargs):
+        raise RuntimeError("LLM unavailable")
+
+    async def collect():
+        return [event async for event in astreamOutfit(MESSAGE, WEATHER, wardrobe, occasion=OCCASION)]
+
+    monkeypatch.setattr(llm_client, "astream", astream)
+    monkeypatch.setattr(llm_client, "ainvoke", ainvoke)
+    monkeypatch.setattr(outfit_module, "record_exchange", lambda *args: None)
+    events = asyncio.run(collect())
+    assert {data["id"] for name, data in events if name == "item"} == expected_ids
+    assert not [data for name, data in events if name == "remove"]
+    name, result = events[-1]
+    assert name == "done"
+    check_first_outfit_kept(result, expected_ids, cache)
+
+
+def test_async_paths_record_exchanges_off_the_event_loop(wardrobe, cache, monkeypatch, tmp_path):
+    answer, _ = shoeless_answer(wardrobe)
+    path = tmp_path / "exchanges.jsonl"
+    writer_threads = []
+    record = outfit_module.record_exchange
+
+    def tracking_record(*args):
+        writer_threads.append(threading.get_ident())
+        record(*args)
+
+    async def ainvoke(messages, temperature=None, deadline=None, **kwargs):
+        return answer
+
+    monkeypatch.setattr(outfit_module, "OUTFIT_RECORD_PATH", str(path))
+    monkeypatch.setattr(outfit_module, "record_exchange", tracking_record)
+    monkeypatch.setattr(llm_client, "ainvoke", ainvoke)
+
+    async def scenario():
+        await agenerateOutfit(MESSAGE, WEATHER, wardrobe, occasion=OCCASION)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert writer_threads and loop_thread not in writer_threads
+    assert json.loads(path.read_text().splitlines()[0])["response"] == answer
@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from api.bench import load_recorded_exchanges, replay_recorded_outfit
+
+# Exchanges in the OUTFIT_RECORD_PATH format; real recordings can be appended to the file
+RECORDS = load_recorded_exchanges()
+ENCODINGS = [("verbose", True), ("compact", True), ("compact", False)]
+
+
+def recorded_encoding(record):
+    return "compact" if record["aliases"] else "verbose"
+
+
+@pytest.mark.parametrize("record", RECORDS, ids=lambda r: f"{recorded_encoding(r)}-{r['occasion']}")
+def test_recorded_prompt_is_rebuilt(record):
+    prompt, _, _, _ = replay_recorded_outfit(record, recorded_encoding(record))
+    assert prompt.aliases == record["aliases"]
+    assert prompt.target_occ == record["occasion"]
+
+
+@pytest.mark.parametrize("encoding, include_examples", ENCODINGS)
+@pytest.mark.parametrize("record", RECORDS, ids=lambda r: f"{recorded_encoding(r)}-{r['occasion']}")
+def test_recorded_outfit_survives_validation(record, encoding, include_examples):
+    _, recorded_ids, validated_ids, retry_messages = replay_recorded_outfit(record, encoding, include_examples)
+    assert len(recorded_ids) >= 3
+    assert validated_ids == recorded_ids
+    assert retry_messages is None
+
+
+def test_recorded_answers_name_only_offered_items():
+    for record in RECORDS:
+        offered = {item["id"] for item in record["wardrobe"]} | set(record["aliases"])
+        answer = json.loads(record["response"])
+        assert {item["id"] for item in answer["outfit_items"]} <= offered
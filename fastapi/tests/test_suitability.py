@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from api.bench import sample_wardrobe_items, scan_suitable_items
+from api.llm.outfit import WardrobeItem
+from api.llm.suitability import WEATHER_TAGS, SuitabilityIndex
+
+MATERIALS = ["cotton", "linen blend", "windproof nylon", "Wind-Resistant shell", "breathable mesh",
+             "moisture-wicking polyester", "wool", "leather"]
+OCCASION_TAGS = ["work", "Work", "casual outing", "date night", "gym", "semi-formal", "smart casual", "party"]
+DESCRIPTIONS = ["clear sky", "light rain", "heavy snow", "windy", "drizzle and wind", "sleet showers", "overcast"]
+OCCASIONS = ["work", "casual outing", "date night", "gym", "dinner party", "formal event", "business casual"]
+# Both sides of every temperature threshold the weather rules use
+TEMPERATURES = [-5, 5, 9.9, 10, 12, 14.9, 15, 20, 25, 25.1, 28, 30, 30.1, 36]
+
+
+def random_wardrobe(rng, size):
+    rows = sample_wardrobe_items(size)
+    for row in rows:
+        tags = rng.sample(WEATHER_TAGS, rng.randint(0, 4))
+        row["suitable_for_weather"] = ",".join(tags + rng.sample(["sunny", "mild"], rng.randint(0, 1)))
+        row["material"] = rng.choice(MATERIALS)
+        row["suitable_for_occasion"] = ",".join(rng.sample(OCCASION_TAGS, rng.randint(1, 3)))
+    return [WardrobeItem.from_dict(row) for row in rows]
+
+
+def random_weather(rng):
+    temp = rng.choice(TEMPERATURES)
+    return {"temperature": temp, "feels_like": rng.choice([temp, temp - 3, temp + 2]),
+            "description": rng.choice(DESCRIPTIONS), "humidity": rng.choice([30, 70, 71, 90]),
+            "wind_speed": rng.choice([2, 20, 21]),
+            "forecast": rng.choice([{}, {"high": temp + 3, "low": temp - 2}, {"high": temp + 8, "low": temp - 6}])}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_index_matches_per_item_scan_on_random_wardrobes(seed):
+    rng = random.Random(seed)
+    wardrobe = random_wardrobe(rng, 120)
+    index = SuitabilityIndex(wardrobe)
+    for _ in range(60):
+        weather, occasion = random_weather(rng), rng.choice(OCCASIONS)
+        assert index.filter(weather, occasion) == scan_suitable_items(wardrobe, weather, occasion), (weather, occasion)
+
+
+@pytest.mark.parametrize("feels_like, tags, suitable", [
+    (5, "very cold", False),
+    (5, "very cold,cold", True),
+    (12, "cold", True),
+    (35, "very hot", False),
+    (35, "very hot,hot", True),
+    (27, "hot", True),
+])
+def test_extreme_temperatures_need_both_tags(feels_like, tags, suitable):
+    row = sample_wardrobe_items(1)[0]
+    row.update(item_type="top", suitable_for_weather=tags, suitable_for_occasion="work")
+    item = WardrobeItem.from_dict(row)
+    weather = {"temperature": feels_like, "feels_like": feels_like, "description": "clear sky"}
+    assert item.is_suitable_for_weather(weather) is suitable
+    assert SuitabilityIndex([item]).filter(weather, "work") == ([item] if suitable else [])
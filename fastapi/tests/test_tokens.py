@@ -0,0 +1,46 @@
+import time
+
+import pytest
+from jose import jwt
+
+from api.Database.tokens import TokenVerifier
+
+SECRET = "test-secret"
+
+
+def make_token(user_id, issued_at):
+    claims = {"sub": user_id, "aud": "authenticated", "iat": int(issued_at), "exp": int(issued_at) + 3600}
+    return jwt.encode(claims, SECRET, algorithm="HS256")
+
+
+@pytest.fixture
+def remote_calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(TokenVerifier, "_verify_remotely", lambda self, token: calls.append(token) or "remote")
+    return calls
+
+
+def test_revoked_tokens_are_checked_remotely(remote_calls):
+    verifier = TokenVerifier(secret=SECRET)
+    token = make_token("u1", time.time() - 10)
+    assert verifier.verify(token).id == "u1"
+    verifier.revoke_user("u1")
+    assert verifier.verify(token) == "remote"
+    assert remote_calls == [token]
+
+
+def test_revocations_expire_after_the_token_lifetime(remote_calls):
+    verifier = TokenVerifier(secret=SECRET, ttl=0.01, token_lifetime=0.05)
+    token = make_token("u1", time.time() - 10)
+    verifier.revoke_user("u1")
+    assert verifier.stats()["revoked_users"] == 1
+    time.sleep(0.06)
+    assert verifier.verify(token).id == "u1"
+    assert remote_calls == []
+
+
+def test_revocations_are_bounded():
+    verifier = TokenVerifier(secret=SECRET, max_size=10)
+    for i in range(50):
+        verifier.revoke_user(f"u{i}")
+    assert verifier.stats()["revoked_users"] == 10